@@ -0,0 +1,372 @@
+import abc
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Subdiretório reservado para o registro (banco SQLite ou arquivos de metadados)
+REGISTRY_DIR = '.registry'
+
+# Arquivos sem registro mais novos que isso podem ser gravações em andamento em outro processo
+ORPHAN_GRACE_SECONDS = 3600
+
+
+def path_size(path: str) -> int:
+    """Tamanho em disco de um arquivo ou da soma dos arquivos de um diretório"""
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(raiz, nome))
+            for raiz, _, nomes in os.walk(path) for nome in nomes
+        )
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+class ArtifactRegistry(abc.ABC):
+    """Registro dos artefatos (id -> parent, ttl, bytes, created_at, last_access)
+
+    As implementações guardam o registro em disco, para que todos os processos
+    (workers do uvicorn, jobs) que usam o mesmo diretório vejam os mesmos artefatos.
+    """
+
+    @abc.abstractmethod
+    def get(self, artifact_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abc.abstractmethod
+    def put(self, artifact_id: str, entrada: Dict[str, Any]) -> None:
+        ...
+
+    @abc.abstractmethod
+    def delete(self, artifact_id: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    def touch(self, artifact_id: str, agora: float) -> None:
+        ...
+
+    @abc.abstractmethod
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        ...
+
+
+class SqliteRegistry(ArtifactRegistry):
+    """Registro em um banco SQLite local (modo WAL), seguro entre processos
+
+    Cada thread reutiliza a sua própria conexão (conexões SQLite não devem ser
+    compartilhadas entre threads); após um fork, o processo filho abre as suas.
+    """
+
+    CAMPOS = ('parent', 'ttl', 'bytes', 'created_at', 'last_access')
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._query("PRAGMA journal_mode=WAL")
+        self._query(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            "id TEXT PRIMARY KEY, parent TEXT, ttl REAL, bytes INTEGER, created_at REAL, last_access REAL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        """Conexão da thread atual, aberta na primeira consulta da thread"""
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        return self._connect().execute(sql, params).fetchall()
+
+    def get(self, artifact_id: str) -> Optional[Dict[str, Any]]:
+        linhas = self._query(f"SELECT {', '.join(self.CAMPOS)} FROM artifacts WHERE id = ?", (artifact_id,))
+        return dict(zip(self.CAMPOS, linhas[0])) if linhas else None
+
+    def put(self, artifact_id: str, entrada: Dict[str, Any]) -> None:
+        self._query(
+            f"INSERT OR REPLACE INTO artifacts (id, {', '.join(self.CAMPOS)}) VALUES (?, ?, ?, ?, ?, ?)",
+            (artifact_id,) + tuple(entrada[c] for c in self.CAMPOS)
+        )
+
+    def delete(self, artifact_id: str) -> None:
+        self._query("DELETE FROM artifacts WHERE id = ?", (artifact_id,))
+
+    def touch(self, artifact_id: str, agora: float) -> None:
+        self._query("UPDATE artifacts SET last_access = ? WHERE id = ?", (agora, artifact_id))
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        linhas = self._query(f"SELECT id, {', '.join(self.CAMPOS)} FROM artifacts")
+        return [(linha[0], dict(zip(self.CAMPOS, linha[1:]))) for linha in linhas]
+
+
+class FileRegistry(ArtifactRegistry):
+    """Registro em arquivos JSON (um por artefato) gravados de forma atômica
+
+    Alternativa ao SQLite para diretórios compartilhados em que o SQLite não é
+    confiável (ex.: alguns sistemas de arquivos de rede).
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, artifact_id: str) -> str:
+        return os.path.join(self.directory, f"{artifact_id}.json")
+
+    def get(self, artifact_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(artifact_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, artifact_id: str, entrada: Dict[str, Any]) -> None:
+        tmp_path = f"{self._path(artifact_id)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entrada, f)
+        os.replace(tmp_path, self._path(artifact_id))
+
+    def delete(self, artifact_id: str) -> None:
+        try:
+            os.remove(self._path(artifact_id))
+        except FileNotFoundError:
+            pass
+
+    def touch(self, artifact_id: str, agora: float) -> None:
+        entrada = self.get(artifact_id)
+        if entrada is not None:
+            entrada['last_access'] = agora
+            self.put(artifact_id, entrada)
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        itens = []
+        for nome in os.listdir(self.directory):
+            if nome.endswith('.json'):
+                entrada = self.get(nome[:-len('.json')])
+                if entrada is not None:
+                    itens.append((nome[:-len('.json')], entrada))
+        return itens
+
+
+def create_registry(kind: str, directory: str) -> ArtifactRegistry:
+    """Cria o registro do tipo pedido ('sqlite' ou 'files') dentro do diretório de artefatos"""
+    registro_dir = os.path.join(directory, REGISTRY_DIR)
+    os.makedirs(registro_dir, exist_ok=True)
+    if kind == 'sqlite':
+        return SqliteRegistry(os.path.join(registro_dir, 'artifacts.db'))
+    if kind == 'files':
+        return FileRegistry(registro_dir)
+    raise ValueError(f"Registro de artefatos desconhecido: {kind}")
+
+
+class ArtifactStore:
+    """Arquivos temporários da API (uploads, resultados e derivados) com TTL e cota de disco
+
+    Cada artefato é um arquivo ou diretório dentro de `directory`, registrado em um
+    ArtifactRegistry persistido em disco (sobrevive a reinícios e é compartilhado entre
+    processos). Artefatos derivados apontam para um `parent` e são removidos junto com ele.
+    Regras:
+
+    - TTL por inatividade: um artefato não acessado há mais de `ttl` segundos expira
+      (filhos sem TTL próprio seguem o do pai)
+    - cota: ao registrar, os grupos (raiz + derivados) menos usados recentemente são
+      removidos até o total caber em `quota_bytes`. O total é mantido em memória a cada
+      registro e remoção, sem reler o registro; como outros processos também registram,
+      ele é recalculado a partir do registro na varredura e sempre que passa da cota
+    - a varredura de expirados e órfãos roda em uma thread em segundo plano (start_sweeper)
+    """
+
+    def __init__(self, directory: str, quota_bytes: int, default_ttl: float,
+                 registry: Optional[ArtifactRegistry] = None):
+        self.directory = directory
+        self.quota_bytes = quota_bytes
+        self.default_ttl = default_ttl
+        # Contadores deste processo
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.RLock()
+        # Total de bytes registrados (None: ainda não calculado, ver _used_bytes)
+        self._bytes: Optional[int] = None
+        os.makedirs(directory, exist_ok=True)
+        self.registry = registry or create_registry('sqlite', directory)
+
+    def path(self, artifact_id: str) -> str:
+        """Caminho do artefato no diretório gerenciado (registrado ou não)"""
+        return os.path.join(self.directory, artifact_id)
+
+    def register(self, artifact_id: str, parent: Optional[str] = None, ttl: Optional[float] = None) -> str:
+        """Registra (ou atualiza) um artefato já gravado em path(artifact_id) e aplica a cota"""
+        path = self.path(artifact_id)
+        agora = time.time()
+        with self._lock:
+            usados = self._used_bytes()
+            anterior = self.registry.get(artifact_id) or {}
+            tamanho = path_size(path)
+            self.registry.put(artifact_id, {
+                'parent': parent,
+                'ttl': ttl if ttl is not None else (None if parent else self.default_ttl),
+                'bytes': tamanho,
+                'created_at': anterior.get('created_at', agora),
+                'last_access': agora,
+            })
+            self._bytes = usados + tamanho - anterior.get('bytes', 0)
+            self._touch(artifact_id, agora)
+            self._enforce_quota(protegido=self._root(artifact_id))
+        return path
+
+    def __contains__(self, artifact_id: str) -> bool:
+        """Artefato registrado e não expirado; conta como acesso"""
+        agora = time.time()
+        with self._lock:
+            entrada = self.registry.get(artifact_id)
+            if entrada is None:
+                return False
+            if self._expired(entrada, agora):
+                self._remove(artifact_id, self.registry.items())
+                self.expirations += 1
+                return False
+            self._touch(artifact_id, agora)
+            return True
+
+    def __getitem__(self, artifact_id: str) -> str:
+        if artifact_id not in self:
+            raise KeyError(artifact_id)
+        return self.path(artifact_id)
+
+    def keys(self) -> List[str]:
+        return [artifact_id for artifact_id, _ in self.registry.items()]
+
+    def remove(self, artifact_id: str) -> None:
+        with self._lock:
+            self._remove(artifact_id, self.registry.items())
+
+    def sweep(self) -> int:
+        """Remove os artefatos expirados, os registros sem arquivo e os arquivos órfãos
+
+        Retorna quantos artefatos expiraram.
+        """
+        agora = time.time()
+        with self._lock:
+            itens = self.registry.items()
+            self._bytes = sum(e['bytes'] for _, e in itens)
+            expirados = [a for a, e in itens if self._expired(e, agora)]
+            for artifact_id in expirados:
+                self._remove(artifact_id, itens)
+                self.expirations += 1
+            for artifact_id, entrada in itens:
+                if not os.path.exists(self.path(artifact_id)) and self.registry.get(artifact_id) is not None:
+                    self.registry.delete(artifact_id)
+                    self._bytes -= entrada['bytes']
+            self._remove_orphans(agora)
+        return len(expirados)
+
+    def start_sweeper(self, interval: float) -> threading.Thread:
+        """Varre logo ao iniciar (limpa o que sobrou de execuções anteriores) e depois a cada `interval` segundos"""
+        def loop():
+            while True:
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"Erro na limpeza de artefatos: {str(e)}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=loop, name="rfv-artifact-sweeper", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> Dict[str, Any]:
+        itens = self.registry.items()
+        with self._lock:
+            self._bytes = sum(e['bytes'] for _, e in itens)
+        return {
+            "artifacts": len(itens),
+            "bytes": self._bytes,
+            "quota_bytes": self.quota_bytes,
+            "registry": type(self.registry).__name__,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _root(self, artifact_id: str) -> str:
+        entrada = self.registry.get(artifact_id)
+        while entrada is not None and entrada['parent'] is not None:
+            pai = self.registry.get(entrada['parent'])
+            if pai is None:
+                break
+            artifact_id, entrada = entrada['parent'], pai
+        return artifact_id
+
+    def _touch(self, artifact_id: str, agora: float) -> None:
+        """Marca o acesso no artefato e em seus ancestrais (o LRU e o TTL são por grupo)"""
+        entrada = self.registry.get(artifact_id)
+        while entrada is not None:
+            self.registry.touch(artifact_id, agora)
+            if entrada['parent'] is None:
+                break
+            artifact_id = entrada['parent']
+            entrada = self.registry.get(artifact_id)
+
+    @staticmethod
+    def _expired(entrada: Dict[str, Any], agora: float) -> bool:
+        return entrada['ttl'] is not None and agora - entrada['last_access'] > entrada['ttl']
+
+    def _used_bytes(self) -> int:
+        if self._bytes is None:
+            self._bytes = sum(e['bytes'] for _, e in self.registry.items())
+        return self._bytes
+
+    def _remove(self, artifact_id: str, itens: List[Tuple[str, Dict[str, Any]]]) -> None:
+        for filho, entrada in itens:
+            if entrada['parent'] == artifact_id:
+                self._remove(filho, itens)
+        entrada = self.registry.get(artifact_id)
+        if entrada is not None:
+            self.registry.delete(artifact_id)
+            if self._bytes is not None:
+                self._bytes -= entrada['bytes']
+        path = self.path(artifact_id)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _enforce_quota(self, protegido: str) -> None:
+        """Remove os grupos menos usados até caber na cota; só relê o registro se o total passar dela"""
+        if self._used_bytes() <= self.quota_bytes:
+            return
+
+        # Recalcula com o registro (inclui o que outros processos gravaram) antes de remover
+        itens = self.registry.items()
+        self._bytes = sum(e['bytes'] for _, e in itens)
+        ids = {a for a, _ in itens}
+        raizes = sorted(
+            ((a, e) for a, e in itens if e['parent'] not in ids and a != protegido),
+            key=lambda item: item[1]['last_access']
+        )
+        for raiz, _ in raizes:
+            if self._bytes <= self.quota_bytes:
+                break
+            self._remove(raiz, itens)
+            self.evictions += 1
+
+    def _remove_orphans(self, agora: float) -> None:
+        """Apaga arquivos do diretório sem registro (ex.: de um processo encerrado no meio da gravação)"""
+        registrados = set(self.keys())
+        for nome in os.listdir(self.directory):
+            if nome.startswith('.') or nome in registrados:
+                continue
+            path = self.path(nome)
+            try:
+                if agora - os.path.getmtime(path) < ORPHAN_GRACE_SECONDS:
+                    continue
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
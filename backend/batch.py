@@ -0,0 +1,225 @@
+"""Processamento RFV em lote, sem a API: vários arquivos em paralelo em um pool de processos
+
+Uso:
+    python batch.py lojas/ -o saida/
+    python batch.py "lojas/*.csv" extra.csv -o saida/ --outliers winsorize --workers 8
+    python batch.py vendas.csv -o saida/ --id-cliente cliente --id-transacao pedido --data dt --valor vl
+
+Para cada arquivo <nome>.csv são gravados em `saida/`: <nome>.rfv.csv (scores e segmentos),
+<nome>.quintis.json, <nome>.pdf e <nome>.lote.json (entrada e parâmetros usados). <nome> é o
+caminho relativo à pasta comum das entradas, sem a extensão (lojas/a/vendas.csv e
+lojas/b/vendas.csv geram saida/a/vendas.* e saida/b/vendas.*); entradas que ainda resultariam
+no mesmo nome são recusadas. Arquivos cujas saídas já correspondem à entrada atual e aos mesmos
+parâmetros são pulados.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from columnar import COLUNAS
+from storage import staged_file
+from dates import detect_date_format, SAMPLE_SIZE as DATE_SAMPLE_SIZE
+from pipeline import (ColumnMapping, OutlierTreatment, CHUNK_ROWS, CHUNKED_MIN_BYTES, clean_dataset,
+                      calculate_rfv_scores, calculate_rfv_scores_chunked, result_statistics)
+from report import generate_pdf_report
+
+# Sufixos dos arquivos gravados para cada entrada
+SAIDAS = {
+    'resultado': '.rfv.csv',
+    'quintis': '.quintis.json',
+    'pdf': '.pdf',
+}
+MANIFESTO = '.lote.json'
+
+
+def expand_inputs(entradas: List[str]) -> List[str]:
+    """Arquivos CSV a partir de caminhos de arquivo, diretórios (não recursivo) ou padrões glob"""
+    arquivos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            arquivos.extend(sorted(glob.glob(os.path.join(entrada, '*.csv'))))
+        elif os.path.isfile(entrada):
+            arquivos.append(entrada)
+        else:
+            arquivos.extend(sorted(glob.glob(entrada)))
+    return list(dict.fromkeys(os.path.abspath(a) for a in arquivos))
+
+
+def output_names(arquivos: List[str]) -> Dict[str, str]:
+    """Nome das saídas de cada entrada: caminho relativo à pasta comum das entradas, sem extensão
+
+    Levanta ValueError se duas entradas resultarem no mesmo nome (ex.: vendas.csv e
+    vendas.txt na mesma pasta). A comparação ignora maiúsculas, pois o diretório de saída
+    pode estar em um sistema de arquivos que não as diferencia.
+    """
+    raiz = os.path.commonpath([os.path.dirname(a) for a in arquivos])
+    nomes = {a: os.path.splitext(os.path.relpath(a, raiz))[0] for a in arquivos}
+
+    vistos: Dict[str, str] = {}
+    for arquivo, nome in nomes.items():
+        anterior = vistos.setdefault(nome.casefold(), arquivo)
+        if anterior != arquivo:
+            raise ValueError(f"{anterior} e {arquivo} gerariam as mesmas saídas ({nome}.*)")
+    return nomes
+
+
+def output_paths(nome: str, saida_dir: str) -> Dict[str, str]:
+    caminhos = {chave: os.path.join(saida_dir, nome + sufixo) for chave, sufixo in SAIDAS.items()}
+    caminhos['manifesto'] = os.path.join(saida_dir, nome + MANIFESTO)
+    return caminhos
+
+
+def input_signature(path: str, parametros: Dict[str, Any]) -> Dict[str, Any]:
+    """Identifica a entrada (tamanho e data de modificação) e os parâmetros do processamento"""
+    info = os.stat(path)
+    return {
+        'entrada': path,
+        'tamanho': info.st_size,
+        'modificado_ns': info.st_mtime_ns,
+        'parametros': hashlib.sha1(json.dumps(parametros, sort_keys=True).encode('utf-8')).hexdigest(),
+    }
+
+
+def is_up_to_date(path: str, nome: str, saida_dir: str, parametros: Dict[str, Any]) -> bool:
+    caminhos = output_paths(nome, saida_dir)
+    if not all(os.path.exists(c) for c in caminhos.values()):
+        return False
+    with open(caminhos['manifesto'], 'r', encoding='utf-8') as f:
+        manifesto = json.load(f)
+    return manifesto.get('assinatura') == input_signature(path, parametros)
+
+
+def process_file(path: str, nome: str, saida_dir: str, parametros: Dict[str, Any]) -> Dict[str, Any]:
+    """Calcula o RFV de um arquivo e grava resultado, quintis, PDF e manifesto (roda no pool)"""
+    inicio = time.perf_counter()
+    mapping = ColumnMapping(**parametros['mapeamento'])
+    outlier_treatment = OutlierTreatment(**parametros['outliers'])
+    usecols = list({mapping.id_cliente, mapping.id_transacao, mapping.data, mapping.valor})
+
+    formato_data = mapping.data_format
+    if formato_data is None:
+        amostra = pd.read_csv(path, encoding='utf-8', usecols=[mapping.data], nrows=DATE_SAMPLE_SIZE)
+        formato_data = detect_date_format(amostra[mapping.data])
+
+    relatorio: Dict[str, Any] = {}
+
+    def ler_blocos():
+        relatorio.clear()
+        for chunk in pd.read_csv(path, encoding='utf-8', usecols=usecols, chunksize=CHUNK_ROWS):
+            yield clean_dataset(chunk, mapping, formato_data, relatorio).dropna(subset=['id_cliente', 'id_transacao'])
+
+    if os.path.getsize(path) >= CHUNKED_MIN_BYTES:
+        # Mesmo critério da API: arquivos grandes são agregados em blocos
+        df_rfv, quintis_info = calculate_rfv_scores_chunked(ler_blocos, outlier_treatment)
+    else:
+        blocos = list(ler_blocos())
+        df = pd.concat(blocos, ignore_index=True) if blocos else pd.DataFrame(columns=COLUNAS)
+        df_rfv, quintis_info = calculate_rfv_scores(df, outlier_treatment)
+
+    caminhos = output_paths(nome, saida_dir)
+    os.makedirs(os.path.dirname(caminhos['resultado']), exist_ok=True)
+    statistics = result_statistics(df_rfv)
+    _write_atomic(caminhos['resultado'], df_rfv.to_csv(index=False).encode('utf-8'))
+    _write_atomic(caminhos['quintis'], json.dumps(quintis_info, indent=2).encode('utf-8'))
+    _write_atomic(caminhos['pdf'], generate_pdf_report(statistics, quintis_info))
+
+    # O manifesto é gravado por último: só existe se as demais saídas estiverem completas
+    segundos = time.perf_counter() - inicio
+    manifesto = {
+        'assinatura': input_signature(path, parametros),
+        'linhas': relatorio.get('rows_read', 0),
+        'date_parsing': relatorio,
+        'statistics': statistics,
+        'segundos': round(segundos, 3),
+    }
+    _write_atomic(caminhos['manifesto'], json.dumps(manifesto, indent=2, default=str).encode('utf-8'))
+    return {'entrada': path, 'linhas': manifesto['linhas'], 'clientes': statistics['total_clientes'], 'segundos': segundos}
+
+
+def _write_atomic(path: str, dados: bytes) -> None:
+    with staged_file(path) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            f.write(dados)
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Calcula o RFV de vários arquivos CSV em paralelo")
+    parser.add_argument('entradas', nargs='+', help="Arquivos, diretórios ou padrões glob")
+    parser.add_argument('-o', '--saida', required=True, help="Diretório de saída")
+    parser.add_argument('--id-cliente', default='id_cliente')
+    parser.add_argument('--id-transacao', default='id_transacao')
+    parser.add_argument('--data', default='data')
+    parser.add_argument('--valor', default='valor')
+    parser.add_argument('--formato-data', help="Formato da data (ex.: %%d/%%m/%%Y); se ausente, é detectado")
+    parser.add_argument('--outliers', choices=['keep', 'winsorize', 'remove'], default='keep')
+    parser.add_argument('--limite-inferior', type=float)
+    parser.add_argument('--limite-superior', type=float)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--forcar', action='store_true', help="Reprocessa mesmo se as saídas estiverem atualizadas")
+    args = parser.parse_args(argv)
+
+    parametros = {
+        'mapeamento': {
+            'id_cliente': args.id_cliente,
+            'id_transacao': args.id_transacao,
+            'data': args.data,
+            'valor': args.valor,
+            'data_format': args.formato_data,
+        },
+        'outliers': {
+            'method': args.outliers,
+            'lower_limit': args.limite_inferior,
+            'upper_limit': args.limite_superior,
+        },
+    }
+
+    arquivos = expand_inputs(args.entradas)
+    if not arquivos:
+        print("Nenhum arquivo CSV encontrado", file=sys.stderr)
+        return 1
+    try:
+        nomes = output_names(arquivos)
+    except ValueError as e:
+        print(f"ERRO  {str(e)}", file=sys.stderr)
+        return 1
+    os.makedirs(args.saida, exist_ok=True)
+
+    pendentes = [a for a in arquivos if args.forcar or not is_up_to_date(a, nomes[a], args.saida, parametros)]
+    pulados = len(arquivos) - len(pendentes)
+
+    inicio = time.perf_counter()
+    concluidos, falhas = [], []
+    workers = max(1, min(args.workers, len(pendentes)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futuros = {pool.submit(process_file, a, nomes[a], args.saida, parametros): a for a in pendentes}
+        for futuro in as_completed(futuros):
+            arquivo = futuros[futuro]
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                falhas.append(arquivo)
+                print(f"ERRO  {arquivo}: {str(e)}", file=sys.stderr)
+                continue
+            concluidos.append(resultado)
+            print(f"OK    {arquivo}: {resultado['linhas']} linhas, {resultado['clientes']} clientes "
+                  f"em {resultado['segundos']:.2f}s")
+    segundos = time.perf_counter() - inicio
+
+    linhas = sum(r['linhas'] for r in concluidos)
+    print(f"\n{len(concluidos)} processados, {pulados} atualizados (pulados), {len(falhas)} com erro")
+    if concluidos:
+        print(f"{linhas} linhas em {segundos:.2f}s: {linhas / segundos:,.0f} linhas/s, "
+              f"{len(concluidos) / segundos:.2f} arquivos/s com {workers} processos")
+    return 1 if falhas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
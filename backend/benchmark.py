@@ -0,0 +1,227 @@
+"""Benchmarks do backend com dados sintéticos (ver synthetic.py)
+
+Uso:
+    python benchmark.py                              # 1m, compara com benchmark_baseline.json
+    python benchmark.py --tamanhos 1m 10m --repeticoes 3
+    python benchmark.py --tamanhos 1m --salvar-baseline
+
+Cada execução roda em um processo separado, com um diretório de artefatos vazio, e mede o
+tempo de cada endpoint e de cada etapa do pipeline (campo `profile`), a vazão em linhas/s e
+o pico de RSS. Os casos `micro.*` medem funções isoladas (conversão de datas e scores por
+quintis). Com várias repetições vale o melhor número de cada métrica. O comando termina com
+código 1 se alguma métrica de tempo ou memória piorar além da tolerância.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from synthetic import TAMANHOS, FORMATOS_DATA, write_transactions_csv
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# Diferença absoluta abaixo da qual uma piora de tempo é tratada como ruído
+MIN_SEGUNDOS = 0.05
+
+# Repetições de cada caso micro (vale a mais rápida)
+MICRO_REPETICOES = 3
+
+
+def run_micro(path: str) -> Dict[str, float]:
+    """Casos isolados sobre as colunas do arquivo: conversão de datas e scores por quintis"""
+    import pandas as pd
+    from dates import detect_date_format, parse_dates
+    from pipeline import score_quintis
+
+    def tempo(chamada) -> float:
+        melhor = float('inf')
+        for _ in range(MICRO_REPETICOES):
+            inicio = time.perf_counter()
+            chamada()
+            melhor = min(melhor, time.perf_counter() - inicio)
+        return melhor
+
+    df = pd.read_csv(path, usecols=['id_cliente', 'data', 'valor'], dtype={'data': object})
+    datas = df['data']
+    datas_texto = datas.astype('string')
+    metricas = {
+        'micro.datas.segundos': tempo(lambda: parse_dates(datas, detect_date_format(datas))),
+        # Mesmo caminho com o dtype de texto do pandas (padrão do read_csv no pandas 3)
+        'micro.datas_string.segundos': tempo(lambda: parse_dates(datas_texto, detect_date_format(datas_texto))),
+    }
+
+    # Scores R, F e V de um cliente por linha do agregado, com os quintis do próprio agregado
+    df['data'] = parse_dates(datas, detect_date_format(datas))[0]
+    df_agg = df.groupby('id_cliente').agg(ultima=('data', 'max'), frequencia=('data', 'size'), valor=('valor', 'sum'))
+    df_agg['recencia'] = (df_agg['ultima'].max() - df_agg['ultima']).dt.days + 1
+    colunas = [(df_agg[c].to_numpy(), df_agg[c].quantile([0.2, 0.4, 0.6, 0.8]).tolist(), c == 'recencia')
+               for c in ('recencia', 'frequencia', 'valor')]
+    metricas['micro.scores.segundos'] = tempo(lambda: [score_quintis(*c) for c in colunas])
+    return metricas
+
+
+def run_once(path: str, linhas: int) -> Dict[str, float]:
+    """Executa os endpoints sobre o arquivo e retorna as métricas (chamada no processo filho)"""
+    from fastapi.testclient import TestClient
+    import main
+
+    cliente = TestClient(main.app)
+    metricas: Dict[str, float] = {}
+
+    def medir(nome: str, chamada, vazao: bool = True) -> Any:
+        """Tempo da chamada, vazão (se percorre as transações) e etapas do Server-Timing/profile"""
+        inicio = time.perf_counter()
+        resposta = chamada()
+        segundos = time.perf_counter() - inicio
+        if resposta.status_code != 200:
+            raise RuntimeError(f"{nome}: HTTP {resposta.status_code} {resposta.text[:200]}")
+        metricas[f"{nome}.segundos"] = segundos
+        if vazao:
+            metricas[f"{nome}.linhas_por_segundo"] = linhas / segundos if segundos else 0.0
+        for item in filter(None, resposta.headers.get('server-timing', '').split(',')):
+            etapa, duracao = item.strip().split(';dur=')
+            metricas[f"{nome}.{etapa}.segundos"] = float(duracao) / 1000
+        if resposta.headers.get('content-type', '').startswith('application/json'):
+            perfil = resposta.json().get('profile') or {}
+            picos = [e['pico_memoria_bytes'] for e in perfil.get('etapas', []) if e['pico_memoria_bytes'] is not None]
+            if picos:
+                metricas[f"{nome}.pico_rss_bytes"] = max(picos)
+        return resposta
+
+    with open(path, 'rb') as f:
+        upload = medir('upload', lambda: cliente.post('/upload', files={'file': (os.path.basename(path), f, 'text/csv')}))
+    mapping = {'id_cliente': 'id_cliente', 'id_transacao': 'id_transacao', 'data': 'data', 'valor': 'valor',
+               'file_id': upload.json()['file_id']}
+
+    # A primeira chamada inclui a ingestão (leitura do CSV e armazenamento colunar)
+    medir('analyze-outliers', lambda: cliente.post('/analyze-outliers?profile=true', json={
+        'column_mapping': mapping, 'outlier_treatment': {'method': 'keep'}}))
+    processo = medir('process-rfv', lambda: cliente.post('/process-rfv?profile=true', json={
+        'column_mapping': mapping, 'outlier_treatment': {'method': 'winsorize'}}))
+    medir('rfv-scenarios', lambda: cliente.post('/rfv-scenarios?profile=true', json={
+        'column_mapping': mapping,
+        'scenarios': [{'outlier_treatment': {'method': m}} for m in ('keep', 'winsorize', 'remove')]}))
+
+    result_id = processo.json()['file_id']
+    medir('results', lambda: cliente.get(f'/results/{result_id}?sort_by=valor&order=desc&limit=100'), vazao=False)
+    medir('download', lambda: cliente.get(f'/download/{result_id}'), vazao=False)
+    medir('generate-pdf', lambda: cliente.get(f'/generate-pdf/{result_id}'), vazao=False)
+
+    try:
+        import resource
+        metricas['pico_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        pass
+    metricas.update(run_micro(path))
+    return metricas
+
+
+def run_size(tamanho: str, path: str, repeticoes: int) -> Dict[str, float]:
+    """Roda as repetições em processos separados e combina o melhor valor de cada métrica"""
+    linhas = TAMANHOS[tamanho][0]
+    melhores: Dict[str, float] = {}
+    for _ in range(repeticoes):
+        with tempfile.TemporaryDirectory(prefix='rfv_bench_') as artefatos:
+            env = dict(os.environ, RFV_ARTIFACT_DIR=artefatos)
+            saida = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--executar', path, '--linhas', str(linhas)],
+                env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                stdout=subprocess.PIPE, text=True, check=True
+            ).stdout
+        metricas = json.loads(saida.strip().splitlines()[-1])
+        for chave, valor in metricas.items():
+            melhor = max if chave.endswith('linhas_por_segundo') else min
+            melhores[chave] = melhor(melhores[chave], valor) if chave in melhores else valor
+    return melhores
+
+
+def compare(atual: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerancia: float) -> List[str]:
+    """Métricas de tempo e memória que pioraram mais que `tolerancia` em relação ao baseline"""
+    regressoes = []
+    for tamanho, metricas in atual.items():
+        for chave, valor in sorted(metricas.items()):
+            base = baseline.get(tamanho, {}).get(chave)
+            if base is None or not (chave.endswith('segundos') or chave.endswith('rss_bytes')):
+                continue
+            if chave.endswith('segundos') and valor - base < MIN_SEGUNDOS:
+                continue
+            if valor > base * (1 + tolerancia):
+                regressoes.append(f"{tamanho} {chave}: {valor:.4g} (baseline {base:.4g}, +{(valor / base - 1) * 100:.0f}%)")
+    return regressoes
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks do backend RFV com dados sintéticos")
+    parser.add_argument('--tamanhos', nargs='+', choices=sorted(TAMANHOS), default=['1m'])
+    parser.add_argument('--formato-data', choices=sorted(FORMATOS_DATA), default='iso')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeticoes', type=int, default=1)
+    parser.add_argument('--dados-dir', default=os.path.join(tempfile.gettempdir(), 'rfv_bench_dados'),
+                        help="Onde os datasets gerados ficam guardados entre execuções")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerancia', type=float, default=0.25, help="Piora relativa aceita (0.25 = 25%%)")
+    parser.add_argument('--salvar-baseline', action='store_true', help="Grava os números atuais no baseline")
+    parser.add_argument('--saida', help="Grava o relatório completo em JSON")
+    parser.add_argument('--executar', help=argparse.SUPPRESS)
+    parser.add_argument('--linhas', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.executar:
+        # Processo filho: uma execução, métricas em JSON na última linha da saída
+        metricas = run_once(args.executar, args.linhas)
+        sys.stdout.flush()
+        print(json.dumps(metricas))
+        return 0
+
+    os.makedirs(args.dados_dir, exist_ok=True)
+    resultados: Dict[str, Dict[str, float]] = {}
+    for tamanho in args.tamanhos:
+        linhas, clientes = TAMANHOS[tamanho]
+        path = os.path.join(args.dados_dir, f"transacoes_{tamanho}_{args.formato_data}_{args.seed}.csv")
+        if not os.path.exists(path):
+            print(f"Gerando {path}...", file=sys.stderr)
+            write_transactions_csv(path, linhas, clientes, seed=args.seed, formato_data=args.formato_data)
+        print(f"Executando {tamanho} ({linhas} linhas, {args.repeticoes} repetição(ões))...", file=sys.stderr)
+        resultados[tamanho] = run_size(tamanho, path, args.repeticoes)
+
+    for tamanho, metricas in resultados.items():
+        print(f"\n[{tamanho}]")
+        for chave, valor in sorted(metricas.items()):
+            print(f"  {chave:<45} {valor:>16,.4f}" if chave.endswith('segundos') else f"  {chave:<45} {valor:>16,.0f}")
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    if args.salvar_baseline:
+        baseline.update(resultados)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nBaseline gravado em {args.baseline}")
+        return 0
+
+    if not baseline:
+        print("\nSem baseline para comparar (use --salvar-baseline)")
+        return 0
+    regressoes = compare(resultados, baseline, args.tolerancia)
+    if regressoes:
+        print(f"\nRegressões acima de {args.tolerancia:.0%}:")
+        for linha in regressoes:
+            print(f"  {linha}")
+        return 1
+    print(f"\nSem regressões acima de {args.tolerancia:.0%} em relação ao baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import pandas as pd
+
+
+def estimate_nbytes(value: Any) -> int:
+    """Estima o tamanho em memória de um valor armazenado no cache
+
+    Dicionários, listas e tuplas (ex.: o índice temporal, com arrays e meta) somam o
+    tamanho dos itens recursivamente; objetos com `nbytes` (arrays numpy, QuantileSketch)
+    usam esse atributo e os demais, sys.getsizeof.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_nbytes(k) + estimate_nbytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_nbytes(v) for v in value)
+    nbytes = getattr(value, 'nbytes', None)
+    return int(nbytes) if nbytes is not None else sys.getsizeof(value)
+
+
+class DatasetCache:
+    """Cache LRU em memória com orçamento em bytes e contadores de acerto/falha"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        nbytes = estimate_nbytes(value)
+        with self._lock:
+            self._discard(key)
+            # Valores maiores que o orçamento inteiro não são armazenados
+            if nbytes > self.max_bytes:
+                return
+            while self._entries and self.current_bytes + nbytes > self.max_bytes:
+                old_key = next(iter(self._entries))
+                self._discard(old_key)
+                self.evictions += 1
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Retorna o valor do cache ou executa o loader e armazena o resultado"""
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.put(key, value)
+        return value
+
+    def _discard(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
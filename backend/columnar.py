@@ -0,0 +1,137 @@
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from storage import staged_directory
+
+# Colunas do dataset tipado, na ordem usada pelo restante do backend
+COLUNAS = ['id_cliente', 'id_transacao', 'data', 'valor']
+
+META_FILE = 'meta.json'
+
+# Versão do layout em disco; armazenamentos de outra versão são regravados
+STORE_VERSION = 2
+
+# Epoch usado nos números de dia das datas
+_EPOCH = np.datetime64('1970-01-01', 'D')
+
+
+def _codes_dtype(n: int):
+    return np.int32 if n < np.iinfo(np.int32).max else np.int64
+
+
+def _dictionary_encode(serie: pd.Series):
+    """Códigos inteiros + valores únicos, em ordem crescente quando os valores são ordenáveis"""
+    try:
+        codigos, unicos = pd.factorize(serie, sort=True)
+    except TypeError:
+        codigos, unicos = pd.factorize(serie, sort=False)
+    return codigos.astype(_codes_dtype(len(unicos))), np.asarray(unicos)
+
+
+def write_columnar_store(df: pd.DataFrame, directory: str, value_dtype: str = 'float64') -> Dict[str, Any]:
+    """Grava o dataset tipado em arquivos .npy compactos que podem ser mapeados em memória
+
+    - id_cliente: codificado em dicionário (códigos int32 + valores únicos ordenados,
+      usados só para devolver os IDs originais na saída)
+    - id_transacao: apenas os códigos int32 (-1 para nulos); o valor original não é usado
+    - data: número de dias (int32) quando não há horário; senão datetime64 original
+    - valor: float com a largura `value_dtype`
+
+    A gravação é feita em um diretório temporário exclusivo e movida no final, de modo
+    que um leitor nunca encontra um armazenamento pela metade (ver staged_directory). Retorna o relatório de memória.
+    """
+    # Um armazenamento de outra versão é substituído; um atual, gravado por outro escritor, é mantido
+    with staged_directory(directory, obsoleto=lambda d: not has_columnar_store(d)) as tmp_dir:
+        def salvar(nome: str, valores: np.ndarray) -> int:
+            caminho = os.path.join(tmp_dir, f"{nome}.npy")
+            np.save(caminho, valores)
+            return os.path.getsize(caminho)
+
+        colunas: Dict[str, Dict[str, Any]] = {}
+
+        codigos, unicos = _dictionary_encode(df['id_cliente'])
+        if unicos.dtype == object:
+            unicos = unicos.astype(str)
+        colunas['id_cliente'] = {
+            'codificacao': 'dicionario',
+            'dtype': str(codigos.dtype),
+            'valores_unicos': int(len(unicos)),
+            'bytes': salvar('id_cliente', codigos) + salvar('id_cliente.dicionario', unicos),
+        }
+
+        codigos, unicos = pd.factorize(df['id_transacao'])
+        codigos = codigos.astype(_codes_dtype(len(unicos)))
+        colunas['id_transacao'] = {
+            'codificacao': 'codigos',
+            'dtype': str(codigos.dtype),
+            'nulos': bool((codigos < 0).any()),
+            'bytes': salvar('id_transacao', codigos),
+        }
+
+        datas = df['data'].to_numpy(dtype='datetime64[ns]')
+        dias = datas.astype('datetime64[D]')
+        if np.array_equal(dias.astype('datetime64[ns]'), datas):
+            colunas['data'] = {'codificacao': 'dias', 'dtype': 'int32',
+                               'bytes': salvar('data', (dias - _EPOCH).astype(np.int32))}
+        else:
+            colunas['data'] = {'codificacao': 'nativo', 'dtype': str(datas.dtype), 'bytes': salvar('data', datas)}
+
+        valores = df['valor'].to_numpy(dtype=value_dtype)
+        colunas['valor'] = {'codificacao': 'nativo', 'dtype': str(valores.dtype), 'bytes': salvar('valor', valores)}
+
+        total = sum(c['bytes'] for c in colunas.values())
+        bytes_dataframe = int(df.memory_usage(index=False, deep=True).sum())
+        meta = {
+            'versao': STORE_VERSION,
+            'linhas': int(len(df)),
+            'colunas': colunas,
+            'bytes_total': total,
+            'bytes_dataframe_original': bytes_dataframe,
+            'reducao': round(bytes_dataframe / total, 2) if total else None,
+        }
+        with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+    return meta
+
+
+def read_columnar_meta(directory: str) -> Optional[Dict[str, Any]]:
+    """Metadados do armazenamento (inclui o relatório de memória por coluna)"""
+    caminho = os.path.join(directory, META_FILE)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def has_columnar_store(directory: str) -> bool:
+    meta = read_columnar_meta(directory)
+    return meta is not None and meta.get('versao') == STORE_VERSION
+
+
+def open_columnar_store(directory: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Abre as colunas pedidas mapeadas em memória, sem copiar os códigos e valores
+
+    id_cliente volta como Categorical (códigos mapeados + IDs originais como categorias)
+    e data como datetime64; as agregações devem usar groupby(..., observed=True).
+    """
+    meta = read_columnar_meta(directory)
+
+    dados = {}
+    for coluna in columns or COLUNAS:
+        info = meta['colunas'][coluna]
+        valores = np.load(os.path.join(directory, f"{coluna}.npy"), mmap_mode='r')
+        if info['codificacao'] == 'dicionario':
+            unicos = np.load(os.path.join(directory, f"{coluna}.dicionario.npy"))
+            dados[coluna] = pd.Categorical.from_codes(valores, categories=pd.Index(unicos, tupleize_cols=False))
+        elif info['codificacao'] == 'codigos' and info['nulos']:
+            dados[coluna] = pd.arrays.IntegerArray(np.asarray(valores), np.asarray(valores) < 0)
+        elif info['codificacao'] == 'dias':
+            dados[coluna] = (valores + _EPOCH).astype('datetime64[ns]')
+        else:
+            dados[coluna] = valores
+
+    return pd.DataFrame(dados, copy=False)
@@ -0,0 +1,91 @@
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Formatos testados na detecção, em ordem de preferência. Em empates (ex.: 01/02/2024,
+# que é válido como dd/mm e mm/dd) vence o primeiro, então o padrão brasileiro
+# (dia primeiro) tem prioridade sobre o americano.
+CANDIDATE_FORMATS = [
+    'ISO8601',
+    '%d/%m/%Y',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%y',
+    '%d-%m-%Y',
+    '%d.%m.%Y',
+    '%Y/%m/%d',
+    '%Y%m%d',
+    '%m/%d/%Y',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M',
+]
+
+# Quantidade de valores não nulos usados na detecção
+SAMPLE_SIZE = 1000
+
+
+def is_text(valores: pd.Series) -> bool:
+    """Coluna de texto: object ou o dtype de texto do pandas (padrão do read_csv no pandas 3)"""
+    return pd.api.types.is_object_dtype(valores) or pd.api.types.is_string_dtype(valores)
+
+
+def detect_date_format(valores: pd.Series) -> Optional[str]:
+    """Detecta, em uma amostra da coluna, o formato que converte mais valores
+
+    Retorna None se a coluna não for texto ou se nenhum formato converter a amostra.
+    """
+    if not is_text(valores):
+        return None
+    # Amostra pelo início da coluna; só percorre a coluna inteira se o início tiver nulos
+    amostra = valores.head(SAMPLE_SIZE).dropna()
+    if len(amostra) < SAMPLE_SIZE:
+        amostra = valores.dropna().head(SAMPLE_SIZE)
+    amostra = amostra.astype(str)
+    if amostra.empty:
+        return None
+
+    melhor_formato, melhor_contagem = None, 0
+    for formato in CANDIDATE_FORMATS:
+        contagem = int(pd.to_datetime(amostra, format=formato, errors='coerce').notna().sum())
+        if contagem > melhor_contagem:
+            melhor_formato, melhor_contagem = formato, contagem
+            if contagem == len(amostra):
+                break
+    return melhor_formato
+
+
+def parse_dates(valores: pd.Series, formato: Optional[str]) -> Tuple[pd.Series, int]:
+    """Converte a coluna com o formato explícito (caminho vetorizado do pandas)
+
+    Colunas só com datas costumam ter poucos valores distintos (um por dia) em relação ao
+    número de linhas; nesse caso só os valores únicos são convertidos e o resultado é expandido pelos códigos do
+    factorize. Sem formato, usa a inferência padrão do pandas. Retorna também quantos
+    valores não nulos não puderam ser convertidos e viraram NaT.
+    """
+    if not is_text(valores):
+        datas = pd.to_datetime(valores, errors='coerce')
+        return datas, int((datas.isna() & valores.notna()).sum())
+
+    amostra = valores.head(SAMPLE_SIZE).dropna()
+    repetidos = len(amostra) - amostra.nunique()
+    # Distintos estimados pelos repetidos da amostra (paradoxo do aniversário: n² / 2·repetidos)
+    if repetidos == 0 or len(amostra) ** 2 / (2 * repetidos) > len(valores) // 2:
+        # Alta cardinalidade (ex.: data e hora): conversão direta
+        datas = _to_datetime(valores, formato)
+        return datas, int((datas.isna() & valores.notna()).sum())
+
+    codigos, unicos = pd.factorize(valores)
+    datas_unicas = _to_datetime(pd.Series(unicos, dtype=object), formato)
+
+    # Código -1 (valor nulo) aponta para o NaT acrescentado no final
+    tabela = np.append(datas_unicas.to_numpy(dtype='datetime64[ns]'), np.datetime64('NaT', 'ns'))
+    datas = pd.Series(tabela[codigos], index=valores.index)
+    coagidos = int(np.count_nonzero(datas_unicas.isna().to_numpy()[codigos[codigos >= 0]]))
+    return datas, coagidos
+
+
+def _to_datetime(valores: pd.Series, formato: Optional[str]) -> pd.Series:
+    if formato is None:
+        return pd.to_datetime(valores, errors='coerce')
+    return pd.to_datetime(valores, format=formato, errors='coerce')
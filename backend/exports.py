@@ -0,0 +1,109 @@
+import io
+import zlib
+from typing import Iterator, Optional
+
+import pandas as pd
+
+from storage import staged_file
+
+# Dependências opcionais: sem elas os formatos correspondentes respondem com erro
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compressões aceitas no download de CSV: extensão do arquivo e media type
+COMPRESSIONS = {
+    'gzip': ('.gz', 'application/gzip'),
+    'zstd': ('.zst', 'application/zstd'),
+}
+
+# Formatos de exportação: extensão do arquivo e media type
+EXPORT_FORMATS = {
+    'csv': ('.csv', 'text/csv'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('.arrows', 'application/vnd.apache.arrow.stream'),
+}
+
+
+def missing_dependency(formato: str, compressao: Optional[str] = None) -> Optional[str]:
+    """Nome do pacote opcional que falta para o formato/compressão pedidos (None se nenhum)"""
+    if formato in ('parquet', 'arrow') and pa is None:
+        return 'pyarrow'
+    if compressao == 'zstd' and zstandard is None:
+        return 'zstandard'
+    return None
+
+
+def iter_file_bytes(path: str, chunk_size: int) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        while True:
+            bloco = f.read(chunk_size)
+            if not bloco:
+                return
+            yield bloco
+
+
+def iter_csv_bytes(blocos: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    """Converte blocos de linhas em CSV (cabeçalho só no primeiro bloco)"""
+    cabecalho = True
+    for df in blocos:
+        yield df.to_csv(index=False, header=cabecalho).encode('utf-8')
+        cabecalho = False
+
+
+def compress_stream(blocos: Iterator[bytes], compressao: str) -> Iterator[bytes]:
+    """Comprime um fluxo de bytes bloco a bloco (gzip ou zstd), sem montar o arquivo em memória"""
+    if compressao == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    else:
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    for bloco in blocos:
+        saida = compressor.compress(bloco)
+        if saida:
+            yield saida
+    yield compressor.flush()
+
+
+def iter_arrow_stream(blocos: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    """Serializa os blocos no formato de stream IPC do Arrow, um record batch por bloco"""
+    buffer = io.BytesIO()
+    writer = None
+    for df in blocos:
+        batch = pa.RecordBatch.from_pandas(df, preserve_index=False)
+        if writer is None:
+            writer = pa.ipc.new_stream(buffer, batch.schema)
+        writer.write_batch(batch)
+        yield _drain(buffer)
+    writer.close()
+    yield _drain(buffer)
+
+
+def _drain(buffer: io.BytesIO) -> bytes:
+    dados = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return dados
+
+
+def write_parquet(blocos: Iterator[pd.DataFrame], path: str) -> None:
+    """Grava os blocos em um arquivo Parquet (um row group por bloco)
+
+    Parquet guarda os offsets no rodapé, então o arquivo é gravado em disco e
+    servido depois como arquivo comum. A gravação usa um arquivo temporário exclusivo.
+    """
+    with staged_file(path) as tmp_path:
+        writer = None
+        for df in blocos:
+            tabela = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, tabela.schema, compression='zstd')
+            writer.write_table(tabela)
+        writer.close()
@@ -0,0 +1,190 @@
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from artifacts import ArtifactStore
+from storage import staged_file
+
+# Prefixo dos artefatos com o estado dos jobs (ver JobManager)
+JOB_PREFIX = 'job_'
+
+
+class JobQueueFull(Exception):
+    """A fila de jobs atingiu o limite de jobs pendentes"""
+
+
+class Job:
+    """Estado de um job em segundo plano (fila, execução, etapa atual e resultado)"""
+
+    def __init__(self, kind: str, stages: List[str]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.stages = stages
+        self.status = "queued"  # "queued", "running", "done", "error"
+        self.stage: Optional[str] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+    def set_stage(self, stage: str) -> None:
+        self.stage = stage
+
+    @property
+    def progress(self) -> float:
+        """Fração das etapas concluídas (0 a 1)"""
+        if self.status == "done":
+            return 1.0
+        if self.stage in self.stages:
+            return self.stages.index(self.stage) / len(self.stages)
+        return 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": self.stages,
+            "progress": round(self.progress, 3),
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    @classmethod
+    def from_dict(cls, dados: Dict[str, Any]) -> "Job":
+        """Reconstrói um job a partir de to_dict (ex.: gravado por outro worker)"""
+        job = cls(dados["kind"], dados["stages"])
+        job.id = dados["job_id"]
+        job.status = dados["status"]
+        job.stage = dados["stage"]
+        job.error = dados["error"]
+        job.created_at = datetime.fromisoformat(dados["created_at"])
+        job.started_at = datetime.fromisoformat(dados["started_at"]) if dados["started_at"] else None
+        job.finished_at = datetime.fromisoformat(dados["finished_at"]) if dados["finished_at"] else None
+        return job
+
+
+class JobManager:
+    """Executa jobs em um pool de threads limitado, recusando novos jobs quando a fila está cheia
+
+    Com `store`, o estado de cada job (e o resultado, quando concluído) também é gravado
+    como artefato, então qualquer processo que use o mesmo diretório (workers do uvicorn)
+    consulta o job; esses artefatos seguem o TTL e a cota do armazenamento. O limite da
+    fila e o histórico em memória (max_finished) continuam sendo por processo.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, max_finished: int = 200,
+                 store: Optional[ArtifactStore] = None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rfv-job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, stages: List[str], fn: Callable[[Callable[[str], None]], Any]) -> Job:
+        """Enfileira fn(set_stage) e retorna o job imediatamente
+
+        Lança JobQueueFull se já houver max_workers + max_pending jobs não finalizados.
+        """
+        job = Job(kind, stages)
+        with self._lock:
+            ativos = sum(1 for j in self._jobs.values() if j.status in ("queued", "running"))
+            if ativos >= self.max_workers + self.max_pending:
+                raise JobQueueFull(f"Fila de processamento cheia ({ativos} jobs ativos)")
+            self._jobs[job.id] = job
+            self._prune()
+        self._save(job)
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Callable[[str], None]], Any]) -> None:
+        job.status = "running"
+        job.started_at = datetime.now()
+        self._save(job)
+        try:
+            job.result = fn(lambda stage: self._set_stage(job, stage))
+            job.status = "done"
+        except Exception as e:
+            job.error = getattr(e, "detail", None) or str(e)
+            job.status = "error"
+        finally:
+            job.finished_at = datetime.now()
+            self._save(job)
+
+    def _set_stage(self, job: Job, stage: str) -> None:
+        job.set_stage(stage)
+        self._save(job)
+
+    def _save(self, job: Job) -> None:
+        """Grava o estado do job (e o resultado, se concluído) no armazenamento de artefatos
+
+        Resultados binários (PDF) vão para um artefato derivado `<id>.bin`; os demais
+        vão no próprio JSON do estado.
+        """
+        if self.store is None:
+            return
+        artifact_id = f"{JOB_PREFIX}{job.id}"
+        binario = job.status == "done" and isinstance(job.result, bytes)
+        if binario:
+            with staged_file(self.store.path(f"{artifact_id}.bin")) as tmp_path:
+                with open(tmp_path, 'wb') as f:
+                    f.write(job.result)
+
+        dados = dict(job.to_dict(), result=None if binario else job.result, binary_result=binario)
+        with staged_file(self.store.path(artifact_id)) as tmp_path:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(dados, f, default=str)
+        self.store.register(artifact_id)
+        if binario:
+            self.store.register(f"{artifact_id}.bin", parent=artifact_id)
+
+    def _load(self, job_id: str) -> Optional[Job]:
+        """Lê um job gravado por _save (possivelmente por outro processo)"""
+        artifact_id = f"{JOB_PREFIX}{job_id}"
+        if not job_id.isalnum() or artifact_id not in self.store:
+            return None
+        try:
+            with open(self.store.path(artifact_id), 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+            job = Job.from_dict(dados)
+            if not dados["binary_result"]:
+                job.result = dados["result"]
+            elif f"{artifact_id}.bin" in self.store:
+                with open(self.store.path(f"{artifact_id}.bin"), 'rb') as f:
+                    job.result = f.read()
+            else:
+                job.status, job.error = "error", "Resultado do job expirou"
+        except FileNotFoundError:
+            # Removido (expirado ou pela cota) entre o registro e a leitura
+            return None
+        return job
+
+    def _prune(self) -> None:
+        """Descarta os jobs finalizados mais antigos além de max_finished"""
+        finalizados = [j.id for j in self._jobs.values() if j.status in ("done", "error")]
+        for job_id in finalizados[:max(0, len(finalizados) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Job deste processo ou, com `store`, o estado gravado por qualquer processo"""
+        job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = self._load(job_id)
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            contagem: Dict[str, int] = {}
+            for job in self._jobs.values():
+                contagem[job.status] = contagem.get(job.status, 0) + 1
+        return {"max_workers": self.max_workers, "max_pending": self.max_pending, "jobs": contagem}
@@ -1,22 +1,37 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, Response
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Callable, Iterator
 import pandas as pd
 import numpy as np
 import io
 import os
 import tempfile
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import json
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+import hashlib
+import uuid
+from cache import DatasetCache
+from artifacts import ArtifactStore, create_registry
+from columnar import COLUNAS, write_columnar_store, has_columnar_store, open_columnar_store, read_columnar_meta
+from sketch import QuantileSketch
+from jobs import JobManager, JobQueueFull
+from metrics import StageProfiler, StageMetrics, record_rows
+from dates import detect_date_format, SAMPLE_SIZE as DATE_SAMPLE_SIZE
+from timeindex import (write_time_index, write_time_index_chunked, has_time_index, open_time_index, aggregate_window,
+                       build_time_buckets_chunked, save_time_index, update_time_index_meta, merge_time_buckets,
+                       prune_time_buckets, window_first_day)
+from results import SORT_KEYS, write_result_store, has_result_store, query_result_store, iter_result_store
+from uploads import normalize_upload
+from storage import staged_file
+from pipeline import (ColumnMapping, OutlierTreatment, JANELA_DIAS, CHUNKED_MIN_BYTES, CHUNK_ROWS, RFV_WORKERS,
+                      SEGMENTOS, clean_dataset, outlier_limits, calculate_rfv_scores, calculate_rfv_scores_chunked,
+                      chunked_percentiles, score_customers, result_statistics)
+from report import generate_pdf_report
+from exports import (COMPRESSIONS, EXPORT_FORMATS, missing_dependency, iter_file_bytes, iter_csv_bytes,
+                     compress_stream, iter_arrow_stream, write_parquet)
 
 app = FastAPI(title="RFV Analysis API")
 
@@ -29,651 +44,1222 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Armazenamento temporário de arquivos processados
-temp_files = {}
+# Armazenamento temporário de arquivos processados (uploads, resultados e derivados):
+# diretório próprio, TTL por inatividade, cota de disco e registro em disco compartilhado
+# entre os workers do uvicorn ('sqlite' ou 'files', ver RFV_ARTIFACT_REGISTRY)
+ARTIFACT_DIR = os.environ.get('RFV_ARTIFACT_DIR', os.path.join(tempfile.gettempdir(), 'rfv_artifacts'))
+temp_files = ArtifactStore(
+    directory=ARTIFACT_DIR,
+    quota_bytes=int(os.environ.get('RFV_ARTIFACT_QUOTA_MB', '10240')) * 1024 * 1024,
+    default_ttl=float(os.environ.get('RFV_ARTIFACT_TTL_HOURS', '24')) * 3600,
+    registry=create_registry(os.environ.get('RFV_ARTIFACT_REGISTRY', 'sqlite'), ARTIFACT_DIR)
+)
+temp_files.start_sweeper(float(os.environ.get('RFV_ARTIFACT_SWEEP_SECONDS', '300')))
+
+# Exportações Parquet podem ser regeradas a partir do resultado, então expiram antes
+EXPORT_TTL = float(os.environ.get('RFV_EXPORT_TTL_HOURS', '1')) * 3600
+
+# Estados incrementais (ver /rfv-state) são atualizados diariamente, então vivem mais
+STATE_TTL = float(os.environ.get('RFV_STATE_TTL_HOURS', str(24 * 30))) * 3600
 
-# Modelos Pydantic
-class ColumnMapping(BaseModel):
-    id_cliente: str
-    id_transacao: str
-    data: str
-    valor: str
-    file_id: Optional[str] = None
+# Tamanho dos blocos usados para gravar uploads em disco (1 MiB)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
-class OutlierTreatment(BaseModel):
-    method: str  # "keep", "winsorize", "remove"
-    lower_limit: Optional[float] = None
-    upper_limit: Optional[float] = None
+# Linhas por bloco nas exportações em streaming (filtradas por segmento, Arrow e Parquet)
+DOWNLOAD_CHUNK_ROWS = int(os.environ.get('RFV_DOWNLOAD_CHUNK_ROWS', '100000'))
+
+# Jobs em segundo plano: processamentos simultâneos e tamanho máximo da fila de espera
+job_manager = JobManager(
+    max_workers=int(os.environ.get('RFV_JOB_WORKERS', '2')),
+    max_pending=int(os.environ.get('RFV_JOB_QUEUE_SIZE', '16')),
+    store=temp_files
+)
 
+# Medições por etapa (tempo, linhas e, em execuções perfiladas, pico de memória) para o /metrics
+stage_metrics = StageMetrics()
+
+# Largura do float usado para a coluna de valor no armazenamento colunar ('float64' ou 'float32')
+VALUE_DTYPE = os.environ.get('RFV_VALUE_DTYPE', 'float64')
+
+# Cache dos datasets já lidos e tipados (orçamento em MB configurável)
+dataset_cache = DatasetCache(int(os.environ.get('RFV_CACHE_MAX_MB', '1024')) * 1024 * 1024)
+
+# Modelos Pydantic das requisições (ColumnMapping e OutlierTreatment em pipeline.py)
 class ProcessRequest(BaseModel):
     column_mapping: ColumnMapping
     outlier_treatment: OutlierTreatment
+    exact: bool = False  # True: percentis exatos em vez do sketch de valores
+    reference_date: Optional[date] = None  # se ausente: dia seguinte à última compra
+    window_days: int = Field(JANELA_DIAS, ge=1)  # janela de análise até a data de referência
+
+class Scenario(BaseModel):
+    outlier_treatment: OutlierTreatment
+    reference_date: Optional[date] = None
+    window_days: int = Field(JANELA_DIAS, ge=1)
+
+class ScenarioRequest(BaseModel):
+    column_mapping: ColumnMapping
+    scenarios: List[Scenario] = Field(..., min_length=1, max_length=20)
+    exact: bool = False
+
+class MigrationRequest(BaseModel):
+    column_mapping: ColumnMapping
+    outlier_treatment: OutlierTreatment
+    from_date: date  # data de referência do retrato de origem
+    to_date: Optional[date] = None  # se ausente: dia seguinte à última compra
+    window_days: int = Field(JANELA_DIAS, ge=1)
+    exact: bool = False
+
+class RFVStateRequest(BaseModel):
+    column_mapping: ColumnMapping
+    outlier_treatment: OutlierTreatment
+    window_days: int = Field(JANELA_DIAS, ge=1)
+    exact: bool = False
+
+class AppendRequest(BaseModel):
+    column_mapping: ColumnMapping  # mapeamento do arquivo com as novas transações (enviado por /upload)
+
+def columnar_store_id(mapping: ColumnMapping) -> str:
+    """Identificador do armazenamento colunar de um arquivo + mapeamento de colunas"""
+    assinatura = json.dumps([mapping.id_cliente, mapping.id_transacao, mapping.data, mapping.valor, mapping.data_format])
+    return f"colunas_{mapping.file_id}_{hashlib.sha1(assinatura.encode('utf-8')).hexdigest()[:12]}"
+
+def read_mapped_csv(mapping: ColumnMapping, chunksize: Optional[int] = None):
+    """Lê do CSV enviado apenas as colunas mapeadas (inteiro ou em blocos de linhas)"""
+    return pd.read_csv(
+        temp_files[mapping.file_id],
+        encoding='utf-8',
+        usecols=list({mapping.id_cliente, mapping.id_transacao, mapping.data, mapping.valor}),
+        chunksize=chunksize
+    )
+
+def write_json_artifact(artifact_id: str, data: Any, parent: Optional[str] = None) -> str:
+    """Grava um JSON auxiliar no diretório temporário e o registra em temp_files (derivado de `parent`)"""
+    path = temp_files.path(artifact_id)
+    with staged_file(path) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+    temp_files.register(artifact_id, parent=parent)
+    return path
+
+def read_json_artifact(artifact_id: str) -> Optional[Any]:
+    path = temp_files.path(artifact_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def resolve_date_format(mapping: ColumnMapping) -> Optional[str]:
+    """Formato da coluna de data: o informado no mapeamento ou o detectado (uma vez por arquivo)"""
+    if mapping.data_format:
+        return mapping.data_format
+    
+    formatos_id = f"formatos_{mapping.file_id}"
+    formatos = read_json_artifact(formatos_id) or {}
+    if mapping.data not in formatos:
+        amostra = pd.read_csv(temp_files[mapping.file_id], encoding='utf-8', usecols=[mapping.data], nrows=DATE_SAMPLE_SIZE)
+        formatos[mapping.data] = detect_date_format(amostra[mapping.data])
+        write_json_artifact(formatos_id, formatos, parent=mapping.file_id)
+    return formatos[mapping.data]
+
+def iter_clean_chunks(mapping: ColumnMapping, relatorio: Optional[dict] = None) -> Iterator[pd.DataFrame]:
+    """Percorre o CSV enviado em blocos tipados, com o formato de data resolvido uma única vez"""
+    formato_data = resolve_date_format(mapping)
+    for chunk in read_mapped_csv(mapping, chunksize=CHUNK_ROWS):
+        yield clean_dataset(chunk, mapping, formato_data, relatorio)
+
+def iter_dataset_chunks(mapping: ColumnMapping, relatorio: Optional[dict] = None) -> Iterator[pd.DataFrame]:
+    """Percorre o CSV enviado em blocos já tipados e sem nulos (modo fora de memória)"""
+    for chunk in iter_clean_chunks(mapping, relatorio):
+        yield chunk.dropna(subset=['id_cliente', 'id_transacao'])
+
+def save_ingest_report(mapping: ColumnMapping, relatorio: dict) -> None:
+    write_json_artifact(f"ingestao_{columnar_store_id(mapping)}", relatorio, parent=mapping.file_id)
+
+def load_ingest_report(mapping: ColumnMapping) -> Optional[dict]:
+    """Relatório da leitura do arquivo: formato de data usado e datas convertidas em NaT"""
+    return read_json_artifact(f"ingestao_{columnar_store_id(mapping)}")
+
+def use_chunked_mode(file_id: str) -> bool:
+    """Arquivos acima de RFV_CHUNKED_MIN_MB são processados em blocos, sem carregar tudo em memória"""
+    return os.path.getsize(temp_files[file_id]) >= CHUNKED_MIN_BYTES
+
+def sketch_values(df: pd.DataFrame) -> np.ndarray:
+    """Valores das linhas com id de cliente e de transação (as mesmas usadas no RFV), que alimentam o sketch"""
+    com_ids = df['id_cliente'].notna().to_numpy() & df['id_transacao'].notna().to_numpy()
+    return df['valor'].to_numpy()[com_ids]
+
+def ingest_dataset(mapping: ColumnMapping) -> str:
+    """Converte o CSV enviado para o armazenamento colunar (apenas as 4 colunas mapeadas, já tipadas)"""
+    store_id = columnar_store_id(mapping)
+    store_path = temp_files.path(store_id)
+    if has_columnar_store(store_path):
+        temp_files.register(store_id, parent=mapping.file_id)
+        return store_path
+    
+    # Lê em blocos, alimentando o sketch da coluna de valor durante a leitura
+    sketch = QuantileSketch()
+    relatorio = {}
+    blocos = []
+    for chunk in iter_clean_chunks(mapping, relatorio):
+        sketch.update(sketch_values(chunk))
+        blocos.append(chunk)
+    df = pd.concat(blocos, ignore_index=True) if blocos else pd.DataFrame(columns=COLUNAS)
+    
+    write_columnar_store(df, store_path, value_dtype=VALUE_DTYPE)
+    temp_files.register(store_id, parent=mapping.file_id)
+    save_value_sketch(mapping, sketch)
+    save_ingest_report(mapping, relatorio)
+    return store_path
+
+def save_value_sketch(mapping: ColumnMapping, sketch: QuantileSketch) -> None:
+    sketch_id = f"sketch_{columnar_store_id(mapping)}"
+    write_json_artifact(sketch_id, sketch.to_dict(), parent=mapping.file_id)
+    dataset_cache.put(('sketch', sketch_id), sketch)
+
+def load_value_sketch(mapping: ColumnMapping) -> QuantileSketch:
+    """Sketch de quantis + momentos da coluna de valor (linhas com ids, data e valor válidos)
+    
+    É construído durante a ingestão (primeira análise do arquivo com um mapeamento), não
+    durante o upload, quando as colunas ainda não são conhecidas; arquivos processados em
+    blocos o constroem em uma única passada de leitura no primeiro uso.
+    """
+    sketch_id = f"sketch_{columnar_store_id(mapping)}"
+    sketch_path = temp_files.path(sketch_id)
+    sketch = dataset_cache.get(('sketch', sketch_id))
+    if sketch is not None:
+        return sketch
+    
+    if not os.path.exists(sketch_path):
+        if use_chunked_mode(mapping.file_id):
+            sketch = QuantileSketch()
+            relatorio = {}
+            for chunk in iter_dataset_chunks(mapping, relatorio):
+                sketch.update(chunk['valor'].to_numpy())
+            save_value_sketch(mapping, sketch)
+            save_ingest_report(mapping, relatorio)
+            return sketch
+        # A ingestão grava o sketch junto com o armazenamento colunar
+        store_path = ingest_dataset(mapping)
+        if not os.path.exists(sketch_path):
+            sketch = QuantileSketch()
+            sketch.update(sketch_values(open_columnar_store(store_path, ['id_cliente', 'id_transacao', 'valor'])))
+            save_value_sketch(mapping, sketch)
+            return sketch
+    
+    with open(sketch_path, 'r', encoding='utf-8') as f:
+        sketch = QuantileSketch.from_dict(json.load(f))
+    temp_files.register(sketch_id, parent=mapping.file_id)
+    dataset_cache.put(('sketch', sketch_id), sketch)
+    return sketch
+
+def load_dataset(mapping: ColumnMapping, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Retorna o dataset tipado (id_cliente, id_transacao, data, valor) do arquivo enviado
+    
+    Na primeira chamada para um arquivo + mapeamento o CSV é convertido para o
+    armazenamento colunar; depois disso as colunas pedidas são apenas mapeadas em memória.
+    O DataFrame retornado fica em cache, é compartilhado e não deve ser modificado.
+    """
+    columns = columns or COLUNAS
+    chave = ('dataset', columnar_store_id(mapping), tuple(columns))
+    return dataset_cache.get_or_load(
+        chave,
+        lambda: open_columnar_store(ingest_dataset(mapping), columns)
+    )
 
 @app.get("/")
 async def root():
     return {"message": "RFV Analysis API"}
 
+@app.get("/cache-stats")
+async def cache_stats():
+    """Estatísticas do cache de datasets (acertos, falhas e uso de memória)"""
+    return dataset_cache.stats()
+
+@app.get("/artifact-stats")
+async def artifact_stats():
+    """Uso do armazenamento de arquivos temporários (artefatos, bytes, remoções por cota e por TTL)"""
+    return temp_files.stats()
+
+@app.get("/metrics")
+async def metrics():
+    """Histogramas de tempo, linhas e memória por operação e etapa (formato texto do Prometheus)"""
+    return Response(content=stage_metrics.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+def run_profiled(operacao: str, fn: Callable[[Callable[[str], None]], Any], profile: bool = False,
+                 repassar: Optional[Callable[[str], None]] = None) -> tuple:
+    """Executa fn(etapa) medindo cada etapa e registra as medições no /metrics
+    
+    Retorna (resultado, perfil). Com profile=True mede também o pico de memória por etapa.
+    """
+    perfil = StageProfiler(memoria=profile, repassar=repassar)
+    status = 'error'
+    try:
+        resultado = fn(perfil)
+        status = 'ok'
+    finally:
+        perfil.finish()
+        stage_metrics.observe(operacao, perfil, status)
+    return resultado, perfil
+
+def profiled_json(operacao: str, fn: Callable[[Callable[[str], None]], dict], response: Response, profile: bool) -> dict:
+    """run_profiled para endpoints JSON: header Server-Timing e, se pedido, o campo `profile`"""
+    resultado, perfil = run_profiled(operacao, fn, profile)
+    if perfil.etapas:
+        response.headers['Server-Timing'] = perfil.server_timing()
+    if profile:
+        resultado = {**resultado, "profile": perfil.to_dict()}
+    return resultado
+
+@app.post("/dataset-memory")
+def dataset_memory(mapping: ColumnMapping):
+    """Relatório de memória do dataset ingerido: codificação, dtype e bytes por coluna"""
+    if not mapping.file_id or mapping.file_id not in temp_files:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    try:
+        return read_columnar_meta(ingest_dataset(mapping))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Erro ao ler o dataset: {str(e)}")
+
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
-    """Recebe um arquivo CSV e retorna a lista de colunas"""
+    """Recebe um arquivo CSV (também .csv.gz, .zip ou .xlsx) e retorna a lista de colunas
+    
+    O arquivo é identificado pelo hash SHA-256 do conteúdo enviado: reenviar o mesmo arquivo
+    devolve o mesmo file_id e reaproveita o que já foi calculado para ele. Arquivos
+    comprimidos, planilhas e CSVs em outra codificação ou delimitador são convertidos
+    em fluxo para CSV UTF-8 separado por vírgula, o formato lido pelo restante da API.
+    """
+    temp_path = temp_files.path(f"parcial_{uuid.uuid4().hex}")
+    csv_path = f"{temp_path}.csv"
     try:
-        contents = await file.read()
-        df = pd.read_csv(io.BytesIO(contents), encoding='utf-8', nrows=1000)  # Lê primeiras 1000 linhas para preview
-        
-        # Salva o arquivo completo temporariamente
-        file_id = f"{datetime.now().timestamp()}_{file.filename}"
-        temp_path = os.path.join(tempfile.gettempdir(), file_id)
-        
+        # Grava o arquivo em blocos de tamanho fixo, sem mantê-lo inteiro em memória,
+        # calculando o hash durante a gravação
+        hash_conteudo = hashlib.sha256()
         with open(temp_path, 'wb') as f:
-            f.write(contents)
-        
-        temp_files[file_id] = temp_path
+            def gravar(chunk: bytes) -> None:
+                hash_conteudo.update(chunk)
+                f.write(chunk)
+            
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await run_in_threadpool(gravar, chunk)
+        
+        file_id = f"upload_{hash_conteudo.hexdigest()[:32]}"
+        duplicado = file_id in temp_files
+        if duplicado:
+            os.remove(temp_path)
+            csv_path = temp_files.path(file_id)
+            entrada = read_json_artifact(f"entrada_{file_id}")
+        else:
+            entrada = await run_in_threadpool(normalize_upload, temp_path, csv_path)
+        
+        # Colunas e preview saem apenas do primeiro bloco (descarta a última linha se estiver incompleta)
+        with open(csv_path, 'rb') as f:
+            primeiro_bloco = f.read(UPLOAD_CHUNK_SIZE)
+        amostra = primeiro_bloco
+        fim_linha = primeiro_bloco.rfind(b"\n")
+        if len(primeiro_bloco) == UPLOAD_CHUNK_SIZE and fim_linha >= 0:
+            amostra = primeiro_bloco[:fim_linha + 1]
+        df = pd.read_csv(io.BytesIO(amostra), encoding='utf-8', nrows=DATE_SAMPLE_SIZE)
+        
+        if not duplicado:
+            os.replace(csv_path, temp_files.path(file_id))
+            temp_files.register(file_id)
+            write_json_artifact(f"entrada_{file_id}", entrada, parent=file_id)
+        
+        # Detecta o formato das colunas de texto que parecem datas (reaproveitado no processamento)
+        formatos = read_json_artifact(f"formatos_{file_id}") if duplicado else None
+        if formatos is None:
+            formatos = {coluna: detect_date_format(df[coluna]) for coluna in df.columns}
+            write_json_artifact(f"formatos_{file_id}", formatos, parent=file_id)
         
         return {
             "file_id": file_id,
+            "duplicate": duplicado,
             "columns": df.columns.tolist(),
-            "preview": df.head(10).to_dict(orient='records')
+            "preview": df.head(10).to_dict(orient='records'),
+            "date_formats": {coluna: formato for coluna, formato in formatos.items() if formato},
+            "input_format": entrada
         }
     except Exception as e:
+        for caminho in (temp_path, f"{temp_path}.csv"):
+            if os.path.exists(caminho):
+                os.remove(caminho)
         raise HTTPException(status_code=400, detail=f"Erro ao processar arquivo: {str(e)}")
 
-@app.post("/analyze-outliers")
-async def analyze_outliers(request: ProcessRequest):
-    """Analisa outliers na coluna de valor monetário"""
-    try:
-        # Carrega o arquivo completo
-        file_id = request.column_mapping.file_id
-        if not file_id or file_id not in temp_files:
-            raise HTTPException(status_code=404, detail="Arquivo não encontrado")
-        
-        df = pd.read_csv(temp_files[file_id], encoding='utf-8')
-        
-        # Mapeia colunas
-        mapping = request.column_mapping
-        df_mapped = df.rename(columns={
-            mapping.id_cliente: 'id_cliente',
-            mapping.id_transacao: 'id_transacao',
-            mapping.data: 'data',
-            mapping.valor: 'valor'
-        })
-        
-        # Converte data
-        df_mapped['data'] = pd.to_datetime(df_mapped['data'], errors='coerce', infer_datetime_format=True)
-        df_mapped['valor'] = pd.to_numeric(df_mapped['valor'], errors='coerce')
-        
-        # Remove linhas com valores nulos
-        df_mapped = df_mapped.dropna(subset=['data', 'valor'])
-        
-        # Calcula estatísticas para box plot
-        valores = df_mapped['valor'].dropna()
+def run_analyze_outliers(request: ProcessRequest, etapa: Callable[[str], None] = lambda nome: None) -> dict:
+    """Calcula as estatísticas de outliers da coluna de valor monetário"""
+    # Carrega o arquivo completo
+    file_id = request.column_mapping.file_id
+    if not file_id or file_id not in temp_files:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    
+    etapa('leitura')
+    if request.exact:
+        # Estatísticas exatas sobre a coluna de valor completa (mesmas linhas do sketch)
+        valores = pd.Series(sketch_values(load_dataset(request.column_mapping, ['id_cliente', 'id_transacao', 'valor'])))
         q1 = valores.quantile(0.25)
         q3 = valores.quantile(0.75)
-        iqr = q3 - q1
-        lower_bound = q1 - 1.5 * iqr
-        upper_bound = q3 + 1.5 * iqr
         median = valores.median()
         mean = valores.mean()
         min_val = valores.min()
         max_val = valores.max()
-        
-        outliers_count = len(valores[(valores < lower_bound) | (valores > upper_bound)])
-        
-        return {
-            "statistics": {
-                "q1": float(q1),
-                "median": float(median),
-                "q3": float(q3),
-                "mean": float(mean),
-                "min": float(min_val),
-                "max": float(max_val),
-                "iqr": float(iqr),
-                "lower_bound": float(lower_bound),
-                "upper_bound": float(upper_bound),
-                "outliers_count": int(outliers_count),
-                "total_count": int(len(valores))
-            }
-        }
+        total_count = len(valores)
+        record_rows(etapa, total_count)
+        contar_outliers = lambda lower, upper: len(valores[(valores < lower) | (valores > upper)])
+    else:
+        # Estatísticas a partir do sketch da ingestão (quantis com erro relativo <= 0,5%)
+        sketch = load_value_sketch(request.column_mapping)
+        q1 = sketch.quantile(0.25)
+        q3 = sketch.quantile(0.75)
+        median = sketch.quantile(0.5)
+        mean = sketch.mean
+        min_val = sketch.min
+        max_val = sketch.max
+        total_count = sketch.count
+        contar_outliers = sketch.count_outside
+        record_rows(etapa, total_count)
+    
+    # Calcula estatísticas para box plot
+    etapa('estatisticas')
+    iqr = q3 - q1
+    lower_bound = q1 - 1.5 * iqr
+    upper_bound = q3 + 1.5 * iqr
+    outliers_count = contar_outliers(lower_bound, upper_bound)
+    
+    return {
+        "statistics": {
+            "q1": float(q1),
+            "median": float(median),
+            "q3": float(q3),
+            "mean": float(mean),
+            "min": float(min_val),
+            "max": float(max_val),
+            "iqr": float(iqr),
+            "lower_bound": float(lower_bound),
+            "upper_bound": float(upper_bound),
+            "outliers_count": int(outliers_count),
+            "total_count": int(total_count)
+        },
+        "exact": request.exact,
+        "date_parsing": load_ingest_report(request.column_mapping)
+    }
+
+@app.post("/analyze-outliers")
+def analyze_outliers(request: ProcessRequest, response: Response, profile: bool = False):
+    """Analisa outliers na coluna de valor monetário"""
+    try:
+        return profiled_json('analyze-outliers', lambda etapa: run_analyze_outliers(request, etapa), response, profile)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Erro ao analisar outliers: {str(e)}")
 
-def calculate_rfv_scores(df: pd.DataFrame, outlier_treatment: OutlierTreatment) -> tuple:
-    """Calcula os scores RFV para cada cliente e retorna também os quintis calculados"""
-    
-    # Aplica tratamento de outliers
-    if outlier_treatment.method == "winsorize":
-        lower = outlier_treatment.lower_limit if outlier_treatment.lower_limit else df['valor'].quantile(0.05)
-        upper = outlier_treatment.upper_limit if outlier_treatment.upper_limit else df['valor'].quantile(0.95)
-        df['valor'] = df['valor'].clip(lower=lower, upper=upper)
-    elif outlier_treatment.method == "remove":
-        lower = outlier_treatment.lower_limit if outlier_treatment.lower_limit else df['valor'].quantile(0.05)
-        upper = outlier_treatment.upper_limit if outlier_treatment.upper_limit else df['valor'].quantile(0.95)
-        df = df[(df['valor'] >= lower) & (df['valor'] <= upper)]
-    
-    # Define data de referência (última data + 1 dia)
-    data_referencia = df['data'].max() + timedelta(days=1)
-    
-    # Filtra últimos 12 meses
-    data_limite = data_referencia - timedelta(days=365)
-    df = df[df['data'] >= data_limite]
-    
-    # Agrega por cliente
-    df_agg = df.groupby('id_cliente').agg({
-        'data': 'max',  # Última compra
-        'id_transacao': 'count',  # Frequência
-        'valor': 'sum'  # Valor total
-    }).reset_index()
-    
-    df_agg.columns = ['id_cliente', 'ultima_compra', 'frequencia', 'valor_total']
-    
-    # Calcula Recência (dias desde última compra)
-    df_agg['recencia_dias'] = (data_referencia - df_agg['ultima_compra']).dt.days
-    
-    # Calcula quintis para Recência (R)
-    recencia_quintis = df_agg['recencia_dias'].quantile([0.2, 0.4, 0.6, 0.8]).tolist()
-    recencia_quintis = [float(q) for q in recencia_quintis]
-    
-    # Calcula quintis para Frequência (F)
-    frequencia_quintis = df_agg['frequencia'].quantile([0.2, 0.4, 0.6, 0.8]).tolist()
-    frequencia_quintis = [float(q) for q in frequencia_quintis]
-    
-    # Calcula quintis para Valor (V)
-    valor_quintis = df_agg['valor_total'].quantile([0.2, 0.4, 0.6, 0.8]).tolist()
-    valor_quintis = [float(q) for q in valor_quintis]
-    
-    # Score de Recência (R) - baseado em quintis (maior recência = menor score)
-    def score_recencia(dias):
-        if dias >= recencia_quintis[3]:  # >= 80º percentil
-            return 1
-        elif dias >= recencia_quintis[2]:  # >= 60º percentil
-            return 2
-        elif dias >= recencia_quintis[1]:  # >= 40º percentil
-            return 3
-        elif dias >= recencia_quintis[0]:  # >= 20º percentil
-            return 4
-        else:  # < 20º percentil (mais recente)
-            return 5
-    
-    # Score de Frequência (F) - baseado em quintis (maior frequência = maior score)
-    def score_frequencia(freq):
-        if freq <= frequencia_quintis[0]:  # <= 20º percentil
-            return 1
-        elif freq <= frequencia_quintis[1]:  # <= 40º percentil
-            return 2
-        elif freq <= frequencia_quintis[2]:  # <= 60º percentil
-            return 3
-        elif freq <= frequencia_quintis[3]:  # <= 80º percentil
-            return 4
-        else:  # > 80º percentil
-            return 5
-    
-    # Score de Valor (V) - baseado em quintis (maior valor = maior score)
-    def score_valor(valor):
-        if valor <= valor_quintis[0]:  # <= 20º percentil
-            return 1
-        elif valor <= valor_quintis[1]:  # <= 40º percentil
-            return 2
-        elif valor <= valor_quintis[2]:  # <= 60º percentil
-            return 3
-        elif valor <= valor_quintis[3]:  # <= 80º percentil
-            return 4
-        else:  # > 80º percentil
-            return 5
-    
-    df_agg['R_score'] = df_agg['recencia_dias'].apply(score_recencia)
-    df_agg['F_score'] = df_agg['frequencia'].apply(score_frequencia)
-    df_agg['V_score'] = df_agg['valor_total'].apply(score_valor)
-    
-    # Calcula média de F e V para segmentação
-    df_agg['media_fv'] = (df_agg['F_score'] + df_agg['V_score']) / 2
-    
-    # Segmentação de clientes (ordem de prioridade: código 1 a 9)
-    def segmentar_cliente(row):
-        r = row['R_score']
-        f = row['F_score']
-        v = row['V_score']
-        media = row['media_fv']
-        recencia_dias = row['recencia_dias']
-        
-        # Código 1: NOVOS - 1ª compra nos últimos 60 dias
-        if recencia_dias <= 60 and row['frequencia'] == 1:
-            return 'NOVOS'
-        
-        # Código 2: CAMPEÃO - R=5, F>=3, V=5
-        if r == 5 and f >= 3 and v == 5:
-            return 'CAMPEÃO'
-        
-        # Código 3: LEAIS - R=3 ou 4 e média de F+V >= 3
-        if r in [3, 4] and media >= 3:
-            return 'LEAIS'
-        
-        # Código 4: POTENCIAIS - (R=5 e média>=3 e V>=3) OU (R=4 e média>=2 e V=3 ou 4)
-        if (r == 5 and media >= 3 and v >= 3) or (r == 4 and media >= 2 and v in [3, 4]):
-            return 'POTENCIAIS'
-        
-        # Código 5: PROMISSORES - (R=4 e média<=2) OU (R=3 e média<3) OU (R=5 e média<=3)
-        if (r == 4 and media <= 2) or (r == 3 and media < 3) or (r == 5 and media <= 3):
-            return 'PROMISSORES'
-        
-        # Código 6: HIBERNANDO - R=2 e média < 4
-        if r == 2 and media < 4:
-            return 'HIBERNANDO'
-        
-        # Código 7: PREOCUPANTES - R=2 e média >= 4
-        if r == 2 and media >= 4:
-            return 'PREOCUPANTES'
-        
-        # Código 8: RISCO - R=1 e média < 4
-        if r == 1 and media < 4:
-            return 'RISCO'
+def save_result_metadata(result_file_id: str, statistics: Dict[str, Any], preview: Optional[list] = None) -> None:
+    write_json_artifact(f"metadados_{result_file_id}", {
+        "statistics": statistics,
+        "preview": preview,
+        "criado_em": datetime.now().isoformat()
+    }, parent=result_file_id)
+
+def rfv_request_id(request: ProcessRequest) -> str:
+    """Identificador do resultado de um processamento: arquivo (por conteúdo) + mapeamento + tratamento"""
+    assinatura = json.dumps([
+        columnar_store_id(request.column_mapping),
+        request.outlier_treatment.model_dump(),
+        request.exact,
+        VALUE_DTYPE,
+        request.reference_date.isoformat() if request.reference_date else None,
+        request.window_days
+    ], sort_keys=True)
+    return f"rfv_{hashlib.sha1(assinatura.encode('utf-8')).hexdigest()[:16]}"
+
+def load_cached_rfv(request: ProcessRequest) -> Optional[dict]:
+    """Resposta de um processamento idêntico já feito, se o resultado ainda estiver armazenado"""
+    anterior = read_json_artifact(rfv_request_id(request))
+    if anterior is None or anterior['result_file_id'] not in temp_files:
+        return None
+    metadados = read_json_artifact(f"metadados_{anterior['result_file_id']}")
+    if metadados is None or metadados.get('preview') is None:
+        return None
+    return {
+        "file_id": anterior['result_file_id'],
+        "statistics": metadados['statistics'],
+        "preview": metadados['preview'],
+        "date_parsing": load_ingest_report(request.column_mapping)
+    }
+
+def load_result_statistics(result_file_id: str) -> Dict[str, Any]:
+    """Estatísticas do registro de metadados; resultados sem registro são recalculados uma vez a partir do CSV"""
+    metadados = read_json_artifact(f"metadados_{result_file_id}")
+    if metadados is not None:
+        return metadados["statistics"]
+    
+    df_rfv = dataset_cache.get_or_load(
+        ('resultado', result_file_id),
+        lambda: pd.read_csv(temp_files[result_file_id], encoding='utf-8')
+    )
+    statistics = result_statistics(df_rfv)
+    save_result_metadata(result_file_id, statistics)
+    return statistics
+
+def save_result_store(result_file_id: str, df_rfv: pd.DataFrame) -> str:
+    """Grava o resultado em formato colunar indexado por segmento (usado por /results)"""
+    store_id = f"indice_{result_file_id}"
+    store_path = temp_files.path(store_id)
+    write_result_store(df_rfv, store_path)
+    temp_files.register(store_id, parent=result_file_id)
+    return store_path
+
+def load_result_store(result_file_id: str) -> str:
+    """Caminho do resultado indexado; resultados sem índice o constroem uma vez a partir do CSV"""
+    store_path = temp_files.path(f"indice_{result_file_id}")
+    if has_result_store(store_path):
+        return store_path
+    df_rfv = dataset_cache.get_or_load(
+        ('resultado', result_file_id),
+        lambda: pd.read_csv(temp_files[result_file_id], encoding='utf-8')
+    )
+    return save_result_store(result_file_id, df_rfv)
+
+def apply_outlier_limits(df: pd.DataFrame, method: str, limites: Optional[List[float]]) -> pd.DataFrame:
+    """Aplica o tratamento de outliers com limites já resolvidos (winsorize corta, remove filtra)"""
+    if method == "winsorize":
+        return df.assign(valor=df['valor'].clip(lower=limites[0], upper=limites[1]))
+    if method == "remove":
+        return df[(df['valor'] >= limites[0]) & (df['valor'] <= limites[1])]
+    return df
+
+def load_time_index(request: ProcessRequest, percentis: Optional[Callable[[], tuple]]) -> Dict[str, Any]:
+    """Índice diário por cliente do dataset com o tratamento de outliers do pedido
+    
+    É construído uma vez por arquivo + mapeamento + tratamento (limites já resolvidos)
+    e permite calcular o RFV em qualquer data de referência e janela sem reler as transações.
+    Arquivos grandes (ver use_chunked_mode) são lidos em blocos: só os baldes diários
+    ficam em memória, nunca as transações.
+    """
+    mapping = request.column_mapping
+    ot = request.outlier_treatment
+    em_blocos = use_chunked_mode(mapping.file_id)
+    carregar = lambda: load_dataset(mapping).dropna(subset=['id_cliente', 'id_transacao'])
+    if percentis is None and em_blocos:
+        percentis = lambda: chunked_percentiles(lambda: iter_dataset_chunks(mapping))
+    elif percentis is None:
+        percentis = lambda: tuple(carregar()['valor'].quantile([0.05, 0.95]))
+    limites = [float(l) for l in outlier_limits(ot, percentis)] if ot.method in ("winsorize", "remove") else None
+    
+    assinatura = json.dumps([ot.method, limites])
+    index_id = f"tempo_{columnar_store_id(mapping)}_{hashlib.sha1(assinatura.encode('utf-8')).hexdigest()[:12]}"
+    index_path = temp_files.path(index_id)
+    if not has_time_index(index_path) and em_blocos:
+        relatorio = {}
+        blocos = (
+            apply_outlier_limits(chunk[['id_cliente', 'data', 'valor']], ot.method, limites)
+            for chunk in iter_dataset_chunks(mapping, relatorio)
+        )
+        write_time_index_chunked(blocos, index_path, {'method': ot.method, 'limites': limites})
+        save_ingest_report(mapping, relatorio)
+    elif not has_time_index(index_path):
+        df = apply_outlier_limits(carregar()[['id_cliente', 'data', 'valor']], ot.method, limites)
+        write_time_index(df, index_path, {'method': ot.method, 'limites': limites})
+    temp_files.register(index_id, parent=mapping.file_id)
+    return dataset_cache.get_or_load(('tempo', index_id), lambda: open_time_index(index_path))
+
+def calculate_rfv_scores_indexed(request: ProcessRequest, percentis: Optional[Callable[[], tuple]] = None,
+                                 etapa: Callable[[str], None] = lambda nome: None) -> tuple:
+    """RFV em uma data de referência e janela quaisquer a partir do índice temporal"""
+    indice = load_time_index(request, percentis)
+    record_rows(etapa, indice['meta']['transacoes'])
+    
+    etapa('agregacao')
+    if request.reference_date is not None:
+        data_referencia = pd.Timestamp(request.reference_date)
+    else:
+        data_referencia = pd.Timestamp(indice['meta']['data_maxima']) + timedelta(days=1)
+    df_agg = aggregate_window(indice, data_referencia, request.window_days)
+    record_rows(etapa, indice['meta']['baldes'])
+    
+    etapa('pontuacao')
+    record_rows(etapa, len(df_agg))
+    return score_customers(df_agg, data_referencia)
+
+def run_process_rfv(request: ProcessRequest, etapa: Callable[[str], None] = lambda nome: None) -> dict:
+    """Calcula os scores RFV, grava o resultado e retorna as estatísticas do dashboard"""
+    # Carrega o arquivo
+    file_id = request.column_mapping.file_id
+    if not file_id or file_id not in temp_files:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    
+    # Limites padrão de outliers (percentis 5/95) a partir do sketch, salvo se pedido exato
+    percentis = None
+    if not request.exact:
+        percentis = lambda: tuple(load_value_sketch(request.column_mapping).quantile(q) for q in (0.05, 0.95))
+    
+    # Uploads são identificados pelo conteúdo: o mesmo arquivo com o mesmo pedido reaproveita o resultado
+    resposta = load_cached_rfv(request)
+    if resposta is not None:
+        return resposta
+    
+    etapa('leitura')
+    if request.reference_date is not None or request.window_days != JANELA_DIAS:
+        # Data de referência ou janela diferentes do padrão: agrega a partir do índice temporal
+        df_rfv, quintis_info = calculate_rfv_scores_indexed(request, percentis, etapa)
+    elif use_chunked_mode(file_id):
+        # Arquivo grande: agrega em blocos sem carregar as transações em memória
+        relatorio = {}
+        
+        def ler_blocos():
+            relatorio.clear()
+            return iter_dataset_chunks(request.column_mapping, relatorio)
+        
+        df_rfv, quintis_info = calculate_rfv_scores_chunked(
+            ler_blocos,
+            request.outlier_treatment,
+            percentis=percentis,
+            etapa=etapa
+        )
+        save_ingest_report(request.column_mapping, relatorio)
+    else:
+        df_mapped = load_dataset(request.column_mapping)
         
-        # Código 9: NAO_PODEMOS_PERDER - R=1 e média >= 4
-        if r == 1 and media >= 4:
-            return 'NAO_PODEMOS_PERDER'
+        # Remove nulos nos identificadores
+        df_mapped = df_mapped.dropna(subset=['id_cliente', 'id_transacao'])
+        record_rows(etapa, len(df_mapped))
         
-        return 'OUTROS'
+        # Calcula RFV
+        df_rfv, quintis_info = calculate_rfv_scores(
+            df_mapped, request.outlier_treatment, workers=RFV_WORKERS, percentis=percentis, etapa=etapa
+        )
     
-    df_agg['Segmento'] = df_agg.apply(segmentar_cliente, axis=1)
+    etapa('gravacao')
+    record_rows(etapa, len(df_rfv))
+    result_file_id, statistics, preview = save_rfv_result(df_rfv, quintis_info)
+    write_json_artifact(rfv_request_id(request), {"result_file_id": result_file_id}, parent=result_file_id)
     
-    # Retorna o dataframe e os quintis calculados
-    quintis_info = {
-        'recencia': recencia_quintis,
-        'frequencia': frequencia_quintis,
-        'valor': valor_quintis
+    return {
+        "file_id": result_file_id,
+        "statistics": statistics,
+        "preview": preview,
+        "date_parsing": load_ingest_report(request.column_mapping)
     }
+
+def save_rfv_result(df_rfv: pd.DataFrame, quintis_info: dict) -> tuple:
+    """Grava um resultado RFV (CSV, índice de consulta, quintis e metadados)
+    
+    Retorna (result_file_id, statistics, preview).
+    """
+    # Salva resultado processado
+    result_file_id = f"result_{uuid.uuid4().hex}"
+    result_path = temp_files.path(result_file_id)
+    with staged_file(result_path) as tmp_path:
+        df_rfv.to_csv(tmp_path, index=False, encoding='utf-8')
+    temp_files.register(result_file_id)
+    dataset_cache.put(('resultado', result_file_id), df_rfv)
+    save_result_store(result_file_id, df_rfv)
+    
+    # Salva os quintis em um arquivo JSON separado
+    quintis_file_id = f"quintis_{result_file_id}"
+    quintis_path = temp_files.path(quintis_file_id)
+    with staged_file(quintis_path) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(quintis_info, f, indent=2)
+    temp_files.register(quintis_file_id, parent=result_file_id)
+    print(f"Quintis salvos em: {quintis_path}")
+    print(f"Quintis info: {quintis_info}")
     
-    return df_agg[['id_cliente', 'R_score', 'F_score', 'V_score', 'Segmento', 'recencia_dias', 'frequencia', 'valor_total']], quintis_info
+    # Estatísticas para dashboard, gravadas junto do resultado para o relatório PDF
+    statistics = result_statistics(df_rfv)
+    preview = df_rfv.head(20).to_dict(orient='records')
+    save_result_metadata(result_file_id, statistics, preview)
+    return result_file_id, statistics, preview
 
 @app.post("/process-rfv")
-async def process_rfv(request: ProcessRequest):
+def process_rfv(request: ProcessRequest, response: Response, profile: bool = False):
     """Processa o arquivo e calcula os scores RFV"""
     try:
-        # Carrega o arquivo
-        file_id = request.column_mapping.file_id
-        if not file_id or file_id not in temp_files:
-            raise HTTPException(status_code=404, detail="Arquivo não encontrado")
-        
-        df = pd.read_csv(temp_files[file_id], encoding='utf-8')
-        
-        # Mapeia colunas
-        mapping = request.column_mapping
-        df_mapped = df.rename(columns={
-            mapping.id_cliente: 'id_cliente',
-            mapping.id_transacao: 'id_transacao',
-            mapping.data: 'data',
-            mapping.valor: 'valor'
-        })
-        
-        # Converte tipos
-        df_mapped['data'] = pd.to_datetime(df_mapped['data'], errors='coerce', infer_datetime_format=True)
-        df_mapped['valor'] = pd.to_numeric(df_mapped['valor'], errors='coerce')
-        
-        # Remove nulos
-        df_mapped = df_mapped.dropna(subset=['data', 'valor', 'id_cliente', 'id_transacao'])
-        
-        # Calcula RFV
-        df_rfv, quintis_info = calculate_rfv_scores(df_mapped, request.outlier_treatment)
-        
-        # Salva resultado processado
-        result_file_id = f"result_{datetime.now().timestamp()}"
-        result_path = os.path.join(tempfile.gettempdir(), result_file_id)
-        df_rfv.to_csv(result_path, index=False, encoding='utf-8')
-        temp_files[result_file_id] = result_path
-        
-        # Salva os quintis em um arquivo JSON separado
-        quintis_file_id = f"quintis_{result_file_id}"
-        quintis_path = os.path.join(tempfile.gettempdir(), quintis_file_id)
-        with open(quintis_path, 'w', encoding='utf-8') as f:
-            json.dump(quintis_info, f, indent=2)
-        temp_files[quintis_file_id] = quintis_path
-        print(f"Quintis salvos em: {quintis_path}")
-        print(f"Quintis info: {quintis_info}")
-        
-        # Estatísticas para dashboard
-        total_clientes = len(df_rfv)
-        receita_total = df_rfv['valor_total'].sum()
-        segmentos = df_rfv['Segmento'].value_counts().to_dict()
-        
-        return {
-            "file_id": result_file_id,
-            "statistics": {
-                "total_clientes": int(total_clientes),
-                "receita_total": float(receita_total),
-                "segmentos": {k: int(v) for k, v in segmentos.items()}
-            },
-            "preview": df_rfv.head(20).to_dict(orient='records')
-        }
+        return profiled_json('process-rfv', lambda etapa: run_process_rfv(request, etapa), response, profile)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Erro ao processar RFV: {str(e)}")
 
-@app.get("/download/{file_id}")
-async def download_file(file_id: str):
-    """Download do arquivo processado"""
-    if file_id not in temp_files:
+def group_transactions_by_customer(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Ordena as transações por cliente uma única vez para os cenários de run_rfv_scenarios
+    
+    Cada cenário reduz os mesmos grupos com sua própria máscara de linhas e coluna de
+    valor, sem refazer a leitura nem a fatoração dos clientes.
+    """
+    # Clientes na mesma ordem do groupby de aggregate_customers (ordenados)
+    codigos, clientes = pd.factorize(df['id_cliente'], sort=True)
+    ordem = np.argsort(codigos, kind='stable')
+    codigos = codigos[ordem]
+    inicios = np.flatnonzero(np.r_[True, codigos[1:] != codigos[:-1]]) if len(codigos) else np.array([], dtype=np.int64)
+    return {
+        'clientes': np.asarray(clientes)[codigos[inicios]],
+        'codigos': codigos,
+        'inicios': inicios,
+        'datas': df['data'].to_numpy(dtype='datetime64[ns]')[ordem],
+        'valores': np.asarray(df['valor'].to_numpy())[ordem],
+    }
+
+def score_scenario(grupos: Dict[str, np.ndarray], cenario: Scenario, percentis: Callable[[], tuple]) -> dict:
+    """Distribuição de segmentos e quintis de um cenário, com as mesmas regras de calculate_rfv_scores"""
+    ot = cenario.outlier_treatment
+    valores, datas, inicios = grupos['valores'], grupos['datas'], grupos['inicios']
+    mascara = np.ones(len(valores), dtype=bool)
+    limites = None
+    if ot.method == "winsorize":
+        limites = outlier_limits(ot, percentis)
+        valores = valores.clip(*limites).astype(valores.dtype, copy=False)
+    elif ot.method == "remove":
+        limites = outlier_limits(ot, percentis)
+        mascara = (valores >= limites[0]) & (valores <= limites[1])
+    
+    # Data de referência (informada ou última data + 1 dia) e janela de análise
+    if cenario.reference_date is not None:
+        data_referencia = pd.Timestamp(cenario.reference_date)
+        mascara &= datas < data_referencia.to_datetime64()
+    else:
+        data_referencia = pd.Timestamp(datas[mascara].max()) + timedelta(days=1)
+    mascara &= datas >= (data_referencia - timedelta(days=cenario.window_days)).to_datetime64()
+    
+    # Agregados por cliente reduzindo os grupos já ordenados. A soma de valores usa o
+    # groupby do pandas (soma compensada, na ordem original das linhas) para reproduzir
+    # exatamente os totais de aggregate_customers, dos quais dependem os quintis.
+    frequencia = np.add.reduceat(mascara.astype(np.int64), inicios)
+    ultima_compra = np.maximum.reduceat(np.where(mascara, datas, np.datetime64('NaT', 'ns')).view(np.int64), inicios)
+    valor_total = pd.Series(valores[mascara]).groupby(grupos['codigos'][mascara], sort=True).sum().to_numpy()
+    ativos = frequencia > 0
+    df_agg = pd.DataFrame({
+        'id_cliente': grupos['clientes'][ativos],
+        'ultima_compra': ultima_compra[ativos].view('datetime64[ns]'),
+        'frequencia': frequencia[ativos],
+        'valor_total': valor_total
+    })
+    
+    df_rfv, quintis_info = score_customers(df_agg, data_referencia)
+    return {
+        "outlier_treatment": ot.model_dump(),
+        "window_days": cenario.window_days,
+        "limits": [float(limite) for limite in limites] if limites else None,
+        "reference_date": data_referencia.isoformat(),
+        "statistics": result_statistics(df_rfv),
+        "quintis": quintis_info
+    }
+
+def score_scenario_indexed(mapping: ColumnMapping, cenario: Scenario, percentis: Callable[[], tuple]) -> dict:
+    """Mesmo resultado de score_scenario, a partir do índice temporal (arquivos grandes)"""
+    ot = cenario.outlier_treatment
+    indice = load_time_index(ProcessRequest(column_mapping=mapping, outlier_treatment=ot), percentis)
+    if cenario.reference_date is not None:
+        data_referencia = pd.Timestamp(cenario.reference_date)
+    else:
+        data_referencia = pd.Timestamp(indice['meta']['data_maxima']) + timedelta(days=1)
+    df_rfv, quintis_info = score_customers(aggregate_window(indice, data_referencia, cenario.window_days), data_referencia)
+    limites = indice['meta']['limites']
+    return {
+        "outlier_treatment": ot.model_dump(),
+        "window_days": cenario.window_days,
+        "limits": limites,
+        "reference_date": data_referencia.isoformat(),
+        "statistics": result_statistics(df_rfv),
+        "quintis": quintis_info
+    }
+
+def run_rfv_scenarios(request: ScenarioRequest, etapa: Callable[[str], None] = lambda nome: None) -> dict:
+    """Compara vários tratamentos de outliers e janelas lendo e agrupando o arquivo uma única vez
+    
+    Arquivos grandes não são carregados em memória: cada cenário usa o índice temporal do
+    seu tratamento de outliers (ver score_scenario_indexed).
+    """
+    file_id = request.column_mapping.file_id
+    if not file_id or file_id not in temp_files:
         raise HTTPException(status_code=404, detail="Arquivo não encontrado")
     
-    file_path = temp_files[file_id]
-    return FileResponse(
-        file_path,
-        media_type='text/csv',
-        filename=f"rfv_analysis_{file_id}.csv"
+    em_blocos = use_chunked_mode(file_id)
+    if not em_blocos:
+        etapa('leitura')
+        df_mapped = load_dataset(request.column_mapping).dropna(subset=['id_cliente', 'id_transacao'])
+        record_rows(etapa, len(df_mapped))
+    
+    # Percentis 5/95 calculados no máximo uma vez e compartilhados entre os cenários
+    memo = {}
+    def percentis() -> tuple:
+        if 'p' not in memo:
+            if request.exact and em_blocos:
+                memo['p'] = chunked_percentiles(lambda: iter_dataset_chunks(request.column_mapping))
+            elif request.exact:
+                memo['p'] = tuple(df_mapped['valor'].quantile([0.05, 0.95]))
+            else:
+                sketch = load_value_sketch(request.column_mapping)
+                memo['p'] = (sketch.quantile(0.05), sketch.quantile(0.95))
+        return memo['p']
+    
+    if em_blocos:
+        # Arquivo grande: cada cenário sai do índice temporal do seu tratamento de outliers,
+        # construído em blocos (uma leitura do arquivo por tratamento ainda sem índice)
+        etapa('agregacao')
+        cenarios = [score_scenario_indexed(request.column_mapping, cenario, percentis) for cenario in request.scenarios]
+    else:
+        etapa('agregacao')
+        grupos = group_transactions_by_customer(df_mapped[['id_cliente', 'data', 'valor']])
+        
+        etapa('pontuacao')
+        record_rows(etapa, len(grupos['clientes']))
+        cenarios = [score_scenario(grupos, cenario, percentis) for cenario in request.scenarios]
+    return {
+        "scenarios": cenarios,
+        "date_parsing": load_ingest_report(request.column_mapping)
+    }
+
+@app.post("/rfv-scenarios")
+def rfv_scenarios(request: ScenarioRequest, response: Response, profile: bool = False):
+    """Distribuição de segmentos e quintis de vários cenários lado a lado"""
+    try:
+        return profiled_json('rfv-scenarios', lambda etapa: run_rfv_scenarios(request, etapa), response, profile)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Erro ao comparar cenários: {str(e)}")
+
+def run_rfv_migration(request: MigrationRequest, etapa: Callable[[str], None] = lambda nome: None) -> dict:
+    """Matriz de migração entre segmentos de dois retratos RFV (clientes e receita por célula)
+    
+    Os dois retratos saem do mesmo índice temporal e são juntados pelo código do cliente.
+    Clientes ativos em só um dos retratos entram em `entradas` (só no destino) ou
+    `saidas` (só na origem). A receita de cada célula é a da janela de origem e a de destino.
+    """
+    file_id = request.column_mapping.file_id
+    if not file_id or file_id not in temp_files:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    
+    percentis = None
+    if not request.exact:
+        percentis = lambda: tuple(load_value_sketch(request.column_mapping).quantile(q) for q in (0.05, 0.95))
+    
+    etapa('leitura')
+    indice = load_time_index(ProcessRequest(
+        column_mapping=request.column_mapping,
+        outlier_treatment=request.outlier_treatment,
+        exact=request.exact
+    ), percentis)
+    record_rows(etapa, indice['meta']['transacoes'])
+    
+    data_origem = pd.Timestamp(request.from_date)
+    if request.to_date is not None:
+        data_destino = pd.Timestamp(request.to_date)
+    else:
+        data_destino = pd.Timestamp(indice['meta']['data_maxima']) + timedelta(days=1)
+    
+    etapa('agregacao')
+    agregados = [(aggregate_window(indice, data, request.window_days), data) for data in (data_origem, data_destino)]
+    record_rows(etapa, indice['meta']['baldes'])
+    
+    # Código de segmento e receita de cada cliente do índice em cada retrato (AUSENTE se inativo)
+    etapa('pontuacao')
+    record_rows(etapa, len(indice['clientes']))
+    ausente = len(SEGMENTOS)
+    retratos = []
+    for df_agg, data_referencia in agregados:
+        df_rfv, _ = score_customers(df_agg, data_referencia)
+        segmentos = np.full(len(indice['clientes']), ausente, dtype=np.intp)
+        receita = np.zeros(len(indice['clientes']), dtype=np.float64)
+        codigos = df_rfv.index.to_numpy()
+        segmentos[codigos] = pd.Categorical(df_rfv['Segmento'], categories=SEGMENTOS).codes
+        receita[codigos] = df_rfv['valor_total'].to_numpy(dtype=np.float64)
+        retratos.append((segmentos, receita))
+    (origem, receita_origem), (destino, receita_destino) = retratos
+    
+    # Matriz (n+1)x(n+1) com a linha/coluna AUSENTE, montada com um único bincount por medida
+    lado = ausente + 1
+    celula = origem * lado + destino
+    def matriz(pesos: Optional[np.ndarray] = None) -> np.ndarray:
+        return np.bincount(celula, weights=pesos, minlength=lado * lado).reshape(lado, lado)
+    clientes = matriz().astype(np.int64)
+    receitas_origem = matriz(receita_origem)
+    receitas_destino = matriz(receita_destino)
+    
+    return {
+        "from_date": data_origem.isoformat(),
+        "to_date": data_destino.isoformat(),
+        "window_days": request.window_days,
+        "segmentos": SEGMENTOS.tolist(),
+        "matriz": {
+            "clientes": clientes[:ausente, :ausente].tolist(),
+            "receita_origem": receitas_origem[:ausente, :ausente].round(2).tolist(),
+            "receita_destino": receitas_destino[:ausente, :ausente].round(2).tolist()
+        },
+        "entradas": {
+            "clientes": clientes[ausente, :ausente].tolist(),
+            "receita": receitas_destino[ausente, :ausente].round(2).tolist()
+        },
+        "saidas": {
+            "clientes": clientes[:ausente, ausente].tolist(),
+            "receita": receitas_origem[:ausente, ausente].round(2).tolist()
+        }
+    }
+
+@app.post("/rfv-migration")
+def rfv_migration(request: MigrationRequest, response: Response, profile: bool = False):
+    """Migração de clientes entre segmentos de duas datas de referência"""
+    try:
+        return profiled_json('rfv-migration', lambda etapa: run_rfv_migration(request, etapa), response, profile)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Erro ao calcular migração: {str(e)}")
+
+def rfv_state_path(state_id: str) -> str:
+    if not state_id.startswith("estado_") or state_id not in temp_files:
+        raise HTTPException(status_code=404, detail="Estado não encontrado")
+    return temp_files[state_id]
+
+def score_rfv_state(indice: Dict[str, Any], meta: Dict[str, Any], etapa: Callable[[str], None]) -> tuple:
+    """Pontua todos os clientes da janela do estado e grava o resultado (os quintis dependem de todos)"""
+    data_referencia = pd.Timestamp(meta['data_maxima']) + timedelta(days=1)
+    df_agg = aggregate_window(indice, data_referencia, meta['window_days'])
+    
+    etapa('pontuacao')
+    record_rows(etapa, len(df_agg))
+    df_rfv, quintis_info = score_customers(df_agg, data_referencia)
+    
+    etapa('gravacao')
+    record_rows(etapa, len(df_rfv))
+    return save_rfv_result(df_rfv, quintis_info)
+
+def run_create_rfv_state(request: RFVStateRequest, etapa: Callable[[str], None] = lambda nome: None) -> dict:
+    """Cria o estado incremental de um arquivo: baldes diários por cliente só da janela atual
+    
+    Os limites de outliers (percentis 5/95 ou informados) ficam congelados no estado e são
+    aplicados às transações de cada atualização.
+    """
+    file_id = request.column_mapping.file_id
+    if not file_id or file_id not in temp_files:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    
+    percentis = None
+    if not request.exact:
+        percentis = lambda: tuple(load_value_sketch(request.column_mapping).quantile(q) for q in (0.05, 0.95))
+    
+    etapa('leitura')
+    indice = load_time_index(ProcessRequest(
+        column_mapping=request.column_mapping,
+        outlier_treatment=request.outlier_treatment,
+        exact=request.exact
+    ), percentis)
+    meta = indice['meta']
+    record_rows(etapa, meta['transacoes'])
+    
+    assinatura = json.dumps([columnar_store_id(request.column_mapping), meta['method'], meta['limites'], request.window_days])
+    state_id = f"estado_{hashlib.sha1(assinatura.encode('utf-8')).hexdigest()[:16]}"
+    
+    etapa('agregacao')
+    if state_id in temp_files:
+        # Mesmo arquivo e parâmetros: reaproveita o estado e, se ainda existir, o resultado
+        estado = dataset_cache.get_or_load(('estado', state_id), lambda: open_time_index(temp_files[state_id]))
+        meta_estado = estado['meta']
+    else:
+        data_referencia = pd.Timestamp(meta['data_maxima']) + timedelta(days=1)
+        estado = prune_time_buckets(indice, window_first_day(data_referencia, request.window_days))
+        meta_estado = {
+            'origem': file_id,
+            'anterior': None,
+            'atualizacoes': 0,
+            'transacoes': meta['transacoes'],
+            'data_maxima': meta['data_maxima'],
+            'method': meta['method'],
+            'limites': meta['limites'],
+            'window_days': request.window_days,
+            'result_file_id': None
+        }
+    record_rows(etapa, len(estado['dia']))
+    return save_rfv_state(state_id, estado, meta_estado, etapa, {"linhas": meta['transacoes']})
+
+def save_rfv_state(state_id: str, estado: Dict[str, Any], meta: Dict[str, Any],
+                   etapa: Callable[[str], None], atualizacao: dict) -> dict:
+    """Grava o estado (se ainda não gravado) e o resultado RFV correspondente"""
+    if meta.get('result_file_id') not in temp_files:
+        result_file_id, statistics, preview = score_rfv_state(estado, meta, etapa)
+        state_path = temp_files.path(state_id)
+        if has_time_index(state_path):
+            # Estado já gravado (só o resultado tinha expirado): atualiza apenas o meta
+            meta = dict(meta, result_file_id=result_file_id)
+            update_time_index_meta(state_path, meta)
+        else:
+            meta = save_time_index(estado, state_path, dict(meta, result_file_id=result_file_id))
+        temp_files.register(state_id, ttl=STATE_TTL)
+        dataset_cache.put(('estado', state_id), open_time_index(temp_files.path(state_id)))
+    else:
+        statistics = load_result_statistics(meta['result_file_id'])
+        preview = read_json_artifact(f"metadados_{meta['result_file_id']}").get('preview')
+    
+    return {
+        "state_id": state_id,
+        "file_id": meta['result_file_id'],
+        "statistics": statistics,
+        "preview": preview,
+        "state": meta,
+        "update": atualizacao
+    }
+
+def run_append_rfv_state(state_id: str, request: AppendRequest, etapa: Callable[[str], None] = lambda nome: None) -> dict:
+    """Acrescenta um lote de transações novas ao estado e recalcula o RFV
+    
+    Só o lote é lido: os baldes dele são somados aos do estado, os dias que saem da
+    janela são descartados e todos os clientes são pontuados de novo (quintis e
+    segmentos dependem da distribuição inteira). O custo acompanha o tamanho do lote e
+    dos baldes da janela, não o histórico. O estado anterior continua disponível;
+    reenviar o mesmo lote ao mesmo estado devolve o estado já calculado.
+    """
+    state_path = rfv_state_path(state_id)
+    file_id = request.column_mapping.file_id
+    if not file_id or file_id not in temp_files:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    
+    etapa('leitura')
+    base = dataset_cache.get_or_load(('estado', state_id), lambda: open_time_index(state_path))
+    meta = base['meta']
+    
+    assinatura = json.dumps([state_id, columnar_store_id(request.column_mapping)])
+    novo_id = f"estado_{hashlib.sha1(assinatura.encode('utf-8')).hexdigest()[:16]}"
+    if novo_id in temp_files:
+        estado = dataset_cache.get_or_load(('estado', novo_id), lambda: open_time_index(temp_files[novo_id]))
+        return save_rfv_state(novo_id, estado, estado['meta'], etapa, estado['meta']['lote'])
+    
+    # Baldes diários do lote (em blocos se o arquivo for grande, sem carregar as transações)
+    if use_chunked_mode(file_id):
+        relatorio = {}
+        blocos = iter_dataset_chunks(request.column_mapping, relatorio)
+    else:
+        relatorio = None
+        blocos = [load_dataset(request.column_mapping).dropna(subset=['id_cliente', 'id_transacao'])]
+    baldes_lote, linhas, data_lote = build_time_buckets_chunked(
+        apply_outlier_limits(chunk[['id_cliente', 'data', 'valor']], meta['method'], meta['limites'])
+        for chunk in blocos
+    )
+    if relatorio is not None:
+        save_ingest_report(request.column_mapping, relatorio)
+    record_rows(etapa, linhas)
+    
+    etapa('agregacao')
+    data_maxima = pd.Timestamp(meta['data_maxima'])
+    if data_lote is not None:
+        data_maxima = max(data_maxima, data_lote)
+    dia_minimo = window_first_day(data_maxima + timedelta(days=1), meta['window_days'])
+    
+    # Transações anteriores à janela atual não afetam o resultado
+    descartadas = int(np.asarray(baldes_lote['contagem'])[np.asarray(baldes_lote['dia']) < dia_minimo].sum())
+    delta = prune_time_buckets(baldes_lote, dia_minimo)
+    estado = merge_time_buckets(base, delta, dia_minimo)
+    record_rows(etapa, len(estado['dia']))
+    
+    lote = {
+        "linhas": linhas,
+        "descartadas": descartadas,
+        "clientes_afetados": int(len(delta['clientes'])),
+        "dias_expirados": int((np.asarray(base['dia']) < dia_minimo).sum())
+    }
+    meta_estado = dict(
+        meta,
+        anterior=state_id,
+        atualizacoes=meta['atualizacoes'] + 1,
+        transacoes=meta['transacoes'] + linhas - descartadas,
+        data_maxima=str(data_maxima),
+        result_file_id=None,
+        lote=lote
     )
+    return save_rfv_state(novo_id, estado, meta_estado, etapa, lote)
 
-def generate_pdf_report(df_rfv: pd.DataFrame, statistics: dict, quintis_info: dict) -> bytes:
-    """Gera relatório PDF com análise RFV"""
+def load_rfv_state(state_id: str) -> dict:
+    """Metadados de um estado incremental"""
+    state_path = rfv_state_path(state_id)
+    return dataset_cache.get_or_load(('estado', state_id), lambda: open_time_index(state_path))['meta']
+
+@app.post("/rfv-state")
+def create_rfv_state(request: RFVStateRequest, response: Response, profile: bool = False):
+    """Cria o estado incremental (baldes diários da janela) e calcula o RFV inicial"""
     try:
-        # Valida e converte quintis
-        recencia_quintis = [float(q) for q in quintis_info.get('recencia', [])]
-        frequencia_quintis = [float(q) for q in quintis_info.get('frequencia', [])]
-        valor_quintis = [float(q) for q in quintis_info.get('valor', [])]
-        
-        if len(recencia_quintis) != 4 or len(frequencia_quintis) != 4 or len(valor_quintis) != 4:
-            raise ValueError("Quintis devem ter exatamente 4 valores cada")
-        
-        # Verifica se há valores NaN
-        for q_list, name in [(recencia_quintis, 'recencia'), (frequencia_quintis, 'frequencia'), (valor_quintis, 'valor')]:
-            if any(pd.isna(q) or q is None for q in q_list):
-                raise ValueError(f"Quintis de {name} contém valores inválidos: {q_list}")
-        
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        story = []
-        styles = getSampleStyleSheet()
-        
-        # Estilos personalizados
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=20,
-            textColor=colors.HexColor('#1e40af'),
-            spaceAfter=30,
-            alignment=1  # Centralizado
-        )
-        
-        heading_style = ParagraphStyle(
-            'CustomHeading',
-            parent=styles['Heading2'],
-            fontSize=14,
-            textColor=colors.HexColor('#1e40af'),
-            spaceAfter=12,
-            spaceBefore=20
-        )
-        
-        # Título
-        story.append(Paragraph("Relatório de Análise RFV", title_style))
-        story.append(Paragraph(f"Data de geração: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", styles['Normal']))
-        story.append(Spacer(1, 20))
-        
-        # Seção 1: Conceitos
-        story.append(Paragraph("Conceitos", heading_style))
-        
-        # Recência - usando quintis dinâmicos
-        story.append(Paragraph("<b>Recência (R)</b>", styles['Heading3']))
-        
-        # Texto descritivo dos conceitos
-        story.append(Paragraph(
-            f"<b>1</b> - Última compra ocorreu há {recencia_quintis[3]:.0f} dias ou mais;<br/>"
-            f"<b>2</b> - Última compra ocorreu entre {recencia_quintis[2]:.0f} e {recencia_quintis[3]:.0f} dias atrás;<br/>"
-            f"<b>3</b> - Última compra ocorreu entre {recencia_quintis[1]:.0f} e {recencia_quintis[2]:.0f} dias atrás;<br/>"
-            f"<b>4</b> - Última compra ocorreu entre {recencia_quintis[0]:.0f} e {recencia_quintis[1]:.0f} dias atrás;<br/>"
-            f"<b>5</b> - Última compra ocorreu nos últimos {recencia_quintis[0]:.0f} dias.",
-            styles['Normal']
-        ))
-        story.append(Spacer(1, 10))
-        
-        # Tabela
-        recencia_data = [
-            ['Score', 'Período (dias)'],
-            ['1', f'≥ {recencia_quintis[3]:.0f} dias'],
-            ['2', f'{recencia_quintis[2]:.0f} a {recencia_quintis[3]:.0f} dias'],
-            ['3', f'{recencia_quintis[1]:.0f} a {recencia_quintis[2]:.0f} dias'],
-            ['4', f'{recencia_quintis[0]:.0f} a {recencia_quintis[1]:.0f} dias'],
-            ['5', f'< {recencia_quintis[0]:.0f} dias'],
-        ]
-        recencia_table = Table(recencia_data, colWidths=[1*inch, 4.5*inch])
-        recencia_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3b82f6')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-        ]))
-        story.append(recencia_table)
-        story.append(Spacer(1, 15))
-        
-        # Frequência - usando quintis dinâmicos
-        story.append(Paragraph("<b>Frequência (F)</b>", styles['Heading3']))
-        story.append(Paragraph("Os limiares de quantidade de pedidos para a atribuição do score de frequência foram calculados através dos quintis", styles['Normal']))
-        story.append(Spacer(1, 10))
-        
-        # Texto descritivo dos conceitos
-        story.append(Paragraph(
-            f"<b>1</b> - Realizou de 1 a {frequencia_quintis[0]:.0f} compras nos últimos doze meses;<br/>"
-            f"<b>2</b> - Realizou de {frequencia_quintis[0]:.0f} a {frequencia_quintis[1]:.0f} compras nos últimos doze meses;<br/>"
-            f"<b>3</b> - Realizou de {frequencia_quintis[1]:.0f} a {frequencia_quintis[2]:.0f} compras nos últimos doze meses;<br/>"
-            f"<b>4</b> - Realizou de {frequencia_quintis[2]:.0f} a {frequencia_quintis[3]:.0f} compras nos últimos doze meses;<br/>"
-            f"<b>5</b> - Realizou {frequencia_quintis[3]:.0f} ou mais compras nos últimos doze meses.",
-            styles['Normal']
-        ))
-        story.append(Spacer(1, 10))
-        
-        # Tabela
-        frequencia_data = [
-            ['Score', 'Quantidade de Compras'],
-            ['1', f'1 a {frequencia_quintis[0]:.0f} compras'],
-            ['2', f'{frequencia_quintis[0]:.0f} a {frequencia_quintis[1]:.0f} compras'],
-            ['3', f'{frequencia_quintis[1]:.0f} a {frequencia_quintis[2]:.0f} compras'],
-            ['4', f'{frequencia_quintis[2]:.0f} a {frequencia_quintis[3]:.0f} compras'],
-            ['5', f'{frequencia_quintis[3]:.0f} ou mais compras'],
-        ]
-        frequencia_table = Table(frequencia_data, colWidths=[1*inch, 4.5*inch])
-        frequencia_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10b981')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-        ]))
-        story.append(frequencia_table)
-        story.append(Spacer(1, 15))
-        
-        # Valor Monetário - usando quintis dinâmicos
-        story.append(Paragraph("<b>Valor Monetário (V)</b>", styles['Heading3']))
-        story.append(Paragraph("Os limiares de valores monetários para a atribuição do score de valor foram calculados através dos quintis", styles['Normal']))
-        story.append(Spacer(1, 10))
-        
-        # Texto descritivo dos conceitos
-        story.append(Paragraph(
-            f"<b>1</b> - Gastou de R$ 0,01 a R$ {valor_quintis[0]:,.2f} nos últimos doze meses;<br/>"
-            f"<b>2</b> - Gastou entre R$ {valor_quintis[0]:,.2f} e R$ {valor_quintis[1]:,.2f} nos últimos doze meses;<br/>"
-            f"<b>3</b> - Gastou entre R$ {valor_quintis[1]:,.2f} e R$ {valor_quintis[2]:,.2f} nos últimos doze meses;<br/>"
-            f"<b>4</b> - Gastou entre R$ {valor_quintis[2]:,.2f} e R$ {valor_quintis[3]:,.2f} nos últimos doze meses;<br/>"
-            f"<b>5</b> - Gastou R$ {valor_quintis[3]:,.2f} ou mais nos últimos doze meses.",
-            styles['Normal']
-        ))
-        story.append(Spacer(1, 10))
-        
-        # Tabela
-        valor_data = [
-            ['Score', 'Valor Total (R$)'],
-            ['1', f'R$ 0,01 a R$ {valor_quintis[0]:,.2f}'],
-            ['2', f'R$ {valor_quintis[0]:,.2f} a R$ {valor_quintis[1]:,.2f}'],
-            ['3', f'R$ {valor_quintis[1]:,.2f} a R$ {valor_quintis[2]:,.2f}'],
-            ['4', f'R$ {valor_quintis[2]:,.2f} a R$ {valor_quintis[3]:,.2f}'],
-            ['5', f'R$ {valor_quintis[3]:,.2f} ou mais'],
-        ]
-        valor_table = Table(valor_data, colWidths=[1*inch, 4.5*inch])
-        valor_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f59e0b')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-        ]))
-        story.append(valor_table)
-        story.append(PageBreak())
-        
-        # Seção 2: Estatísticas Gerais
-        story.append(Paragraph("Estatísticas Gerais", heading_style))
-        stats_data = [
-            ['Métrica', 'Valor'],
-            ['Total de Clientes', f"{statistics['total_clientes']:,}"],
-            ['Receita Total (12 meses)', f"R$ {statistics['receita_total']:,.2f}"],
-        ]
-        stats_table = Table(stats_data, colWidths=[3*inch, 2.5*inch])
-        stats_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#6366f1')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ]))
-        story.append(stats_table)
-        story.append(Spacer(1, 20))
-        
-        # Seção 3: Distribuição por Segmento
-        story.append(Paragraph("Distribuição por Segmento", heading_style))
-        segmentos_data = [['Segmento', 'Quantidade', 'Percentual']]
-        total = statistics['total_clientes']
-        for segmento, quantidade in sorted(statistics['segmentos'].items()):
-            percentual = (quantidade / total * 100) if total > 0 else 0
-            segmentos_data.append([segmento, f"{quantidade:,}", f"{percentual:.2f}%"])
-        
-        segmentos_table = Table(segmentos_data, colWidths=[2.5*inch, 1.5*inch, 1.5*inch])
-        segmentos_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#8b5cf6')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-            ('ALIGN', (2, 0), (2, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-        ]))
-        story.append(segmentos_table)
-        story.append(PageBreak())
-        
-        # Seção 4: Definições dos Segmentos
-        story.append(Paragraph("Definições dos Segmentos", heading_style))
-        story.append(Paragraph("<i>Importante: Os segmentos estão na ordem de priorização de classificação. Clientes que se encaixarem em mais de um perfil, terão o perfil de menor código atribuído.</i>", styles['Italic']))
-        story.append(Spacer(1, 15))
-        
-        segmentos_def = [
-            ['Código', 'Segmento', 'Definição', 'Perfil'],
-            ['1', 'NOVOS', 'Clientes que realizaram sua primeira compra nos últimos 60 dias.', 'Clientes que compraram pela primeira vez na marca. Ainda não é possível determinar seu perfil de compra.'],
-            ['2', 'CAMPEÃO', 'R = 5, F ≥ 3, V = 5', 'Compraram recentemente, com frequência e gastam muito.'],
-            ['3', 'LEAIS', 'R = 3 ou 4 e média de F+V >= 3', 'Compraram recentemente com valor e/ou frequência alta.'],
-            ['4', 'POTENCIAIS', 'R = 5 e média de F+V >= 3 e V >= 3 ou R = 4 e média de F+V >= 2 e V = 3 ou 4', 'Compraram recentemente, com alto valor, independentemente da frequência.'],
-            ['5', 'PROMISSORES', 'R = 4 e média de F+V <= 2 ou R = 3 e média de F+V < 3 ou R = 5 e média de F+V <= 3', 'Compraram recentemente, mas não compram muitas vezes e as compras não tem valor alto.'],
-            ['6', 'HIBERNANDO', 'R = 2 e média de F+V < 4', 'Clientes Hibernando realizaram sua última compra há muito tempo, mas compravam com frequência e/ou com valor considerável.'],
-            ['7', 'PREOCUPANTES', 'R = 2 e média de F+V >= 4', 'Clientes Preocupantes também realizaram sua última compra há muito tempo, mas compravam com muita frequência e também gastavam muito.'],
-            ['8', 'RISCO', 'R = 1 e média de F+V < 4', 'São clientes que não compram há mais de 270 dias (Recência = 1), mas compraram poucas vezes e/ou com baixo valor.'],
-            ['9', 'NAO_PODEMOS_PERDER', 'R = 1 e média de F+V >= 4', 'São clientes que não compram há mais de 270 dias (Recência = 1), mas quando compravam, gastavam bastante e com frequência.'],
-        ]
-        
-        segmentos_def_table = Table(segmentos_def, colWidths=[0.5*inch, 1.2*inch, 2*inch, 2.3*inch])
-        segmentos_def_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#ec4899')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 8),
-            ('FONTSIZE', (0, 1), (-1, -1), 7),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('TOPPADDING', (0, 1), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ]))
-        story.append(segmentos_def_table)
-        
-        # Gera o PDF
-        doc.build(story)
-        buffer.seek(0)
-        return buffer.getvalue()
+        return profiled_json('rfv-state', lambda etapa: run_create_rfv_state(request, etapa), response, profile)
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
-        print(f"Erro na geração do PDF: {str(e)}")
-        print(traceback.format_exc())
+        raise HTTPException(status_code=400, detail=f"Erro ao criar estado RFV: {str(e)}")
+
+@app.post("/rfv-state/{state_id}/append")
+def append_rfv_state(state_id: str, request: AppendRequest, response: Response, profile: bool = False):
+    """Acrescenta um lote de transações ao estado e recalcula o RFV"""
+    try:
+        return profiled_json('rfv-state-append', lambda etapa: run_append_rfv_state(state_id, request, etapa), response, profile)
+    except HTTPException:
         raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Erro ao atualizar estado RFV: {str(e)}")
+
+@app.get("/rfv-state/{state_id}")
+def get_rfv_state(state_id: str):
+    """Metadados do estado: data máxima, janela, atualizações e resultado atual"""
+    return load_rfv_state(state_id)
+
+@app.get("/results/{file_id}")
+def query_results(
+    file_id: str,
+    segmento: Optional[List[str]] = Query(None),
+    r_min: int = Query(1, ge=1, le=5), r_max: int = Query(5, ge=1, le=5),
+    f_min: int = Query(1, ge=1, le=5), f_max: int = Query(5, ge=1, le=5),
+    v_min: int = Query(1, ge=1, le=5), v_max: int = Query(5, ge=1, le=5),
+    sort_by: Optional[str] = None,
+    order: str = 'asc',
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=1000)
+):
+    """Consulta paginada do resultado: filtro por segmento e faixas de score, ordenação por R, F ou V"""
+    if file_id not in temp_files:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    if sort_by is not None and sort_by not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort_by inválido: use um de {list(SORT_KEYS)}")
+    if order not in ('asc', 'desc'):
+        raise HTTPException(status_code=400, detail="order inválido: use 'asc' ou 'desc'")
+    
+    total, pagina = query_result_store(
+        load_result_store(file_id),
+        segmentos=segmento,
+        faixas={'R_score': (r_min, r_max), 'F_score': (f_min, f_max), 'V_score': (v_min, v_max)},
+        ordenar_por=sort_by,
+        decrescente=order == 'desc',
+        offset=offset,
+        limit=limit
+    )
+    return {
+        "file_id": file_id,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "rows": pagina.to_dict(orient='records')
+    }
+
+@app.get("/download/{file_id}")
+def download_file(
+    file_id: str,
+    fmt: str = Query('csv', alias='format'),
+    compression: Optional[str] = None,
+    segmento: Optional[List[str]] = Query(None)
+):
+    """Download do arquivo processado
+    
+    O CSV completo sem compressão é servido como arquivo (com suporte a Range para
+    retomar downloads). Compressão (gzip/zstd), filtro por segmento e Arrow são gerados
+    em streaming; Parquet é gravado uma vez em disco e reaproveitado.
+    """
+    if file_id not in temp_files:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato inválido: use um de {list(EXPORT_FORMATS)}")
+    if compression is not None and compression not in COMPRESSIONS:
+        raise HTTPException(status_code=400, detail=f"Compressão inválida: use um de {list(COMPRESSIONS)}")
+    if compression is not None and fmt != 'csv':
+        raise HTTPException(status_code=400, detail="Compressão só se aplica ao formato csv")
+    pacote = missing_dependency(fmt, compression)
+    if pacote:
+        raise HTTPException(status_code=400, detail=f"Instale o pacote opcional '{pacote}' para usar este formato")
+    
+    extensao, media_type = EXPORT_FORMATS[fmt]
+    nome_arquivo = f"rfv_analysis_{file_id}{extensao}"
+    
+    if fmt == 'csv' and not segmento and compression is None:
+        return FileResponse(temp_files[file_id], media_type=media_type, filename=nome_arquivo)
+    
+    if fmt == 'parquet':
+        return FileResponse(load_parquet_export(file_id, segmento), media_type=media_type, filename=nome_arquivo)
+    
+    if fmt == 'arrow' or segmento:
+        blocos = iter_result_store(load_result_store(file_id), segmento, DOWNLOAD_CHUNK_ROWS)
+    if fmt == 'arrow':
+        conteudo = iter_arrow_stream(blocos)
+    elif segmento:
+        conteudo = iter_csv_bytes(blocos)
+    else:
+        # Sem filtro, o CSV gravado é repassado como está (mesma ordem das linhas)
+        conteudo = iter_file_bytes(temp_files[file_id], UPLOAD_CHUNK_SIZE)
+    
+    if compression is not None:
+        sufixo, media_type = COMPRESSIONS[compression]
+        nome_arquivo += sufixo
+        conteudo = compress_stream(conteudo, compression)
+    
+    return StreamingResponse(
+        conteudo,
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{nome_arquivo}"'}
+    )
+
+def load_parquet_export(file_id: str, segmentos: Optional[List[str]]) -> str:
+    """Caminho do Parquet do resultado (ou dos segmentos pedidos), gravado na primeira exportação"""
+    export_id = f"parquet_{file_id}"
+    if segmentos:
+        export_id += "_" + hashlib.sha1(json.dumps(sorted(set(segmentos))).encode('utf-8')).hexdigest()[:12]
+    export_path = temp_files.path(export_id)
+    if not os.path.exists(export_path):
+        write_parquet(iter_result_store(load_result_store(file_id), segmentos, DOWNLOAD_CHUNK_ROWS), export_path)
+    temp_files.register(export_id, parent=file_id, ttl=EXPORT_TTL)
+    return export_path
+
+def run_generate_pdf(file_id: str, etapa: Callable[[str], None] = lambda nome: None) -> bytes:
+    """Carrega o resultado e os quintis de um processamento e renderiza o relatório PDF"""
+    if file_id not in temp_files:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    
+    # O PDF de um resultado não muda; chamadas repetidas são servidas do cache
+    return dataset_cache.get_or_load(('pdf', file_id), lambda: render_result_pdf(file_id, etapa))
+
+def render_result_pdf(file_id: str, etapa: Callable[[str], None]) -> bytes:
+    """Renderiza o PDF a partir do registro de metadados e dos quintis do resultado"""
+    # Carrega as estatísticas gravadas no processamento (sem ler o CSV por cliente)
+    etapa('leitura')
+    statistics = load_result_statistics(file_id)
+    
+    # Carrega os quintis
+    quintis_file_id = f"quintis_{file_id}"
+    print(f"Procurando quintis: {quintis_file_id}")
+    print(f"Arquivos disponíveis: {list(temp_files.keys())[:5]}...")
+    
+    if quintis_file_id not in temp_files:
+        raise HTTPException(status_code=404, detail=f"Arquivo de quintis não encontrado. Processe o RFV primeiro. Procurando: {quintis_file_id}")
+    
+    quintis_path = temp_files[quintis_file_id]
+    print(f"Carregando quintis de: {quintis_path}")
+    
+    if not os.path.exists(quintis_path):
+        raise HTTPException(status_code=404, detail=f"Arquivo de quintis não existe no disco: {quintis_path}")
+    
+    with open(quintis_path, 'r', encoding='utf-8') as f:
+        quintis_info = json.load(f)
+    
+    print(f"Quintis carregados: {quintis_info}")
+    
+    # Valida os quintis
+    for key in ['recencia', 'frequencia', 'valor']:
+        if key not in quintis_info:
+            raise HTTPException(status_code=400, detail=f"Quintis incompletos: falta '{key}'")
+        if len(quintis_info[key]) != 4:
+            raise HTTPException(status_code=400, detail=f"Quintis inválidos: '{key}' deve ter 4 valores, tem {len(quintis_info[key])}")
+    
+    # Gera o PDF
+    etapa('renderizacao')
+    return generate_pdf_report(statistics, quintis_info)
+
+def pdf_response(pdf_bytes: bytes) -> Response:
+    return Response(
+        content=pdf_bytes,
+        media_type='application/pdf',
+        headers={
+            "Content-Disposition": f"attachment; filename=relatorio_rfv_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        }
+    )
 
 @app.get("/generate-pdf/{file_id}")
-async def generate_pdf(file_id: str):
+def generate_pdf(file_id: str, profile: bool = False):
     """Gera relatório PDF com análise RFV"""
     try:
-        if file_id not in temp_files:
-            raise HTTPException(status_code=404, detail="Arquivo não encontrado")
-        
-        # Carrega os dados processados
-        df_rfv = pd.read_csv(temp_files[file_id], encoding='utf-8')
-        
-        # Carrega os quintis
-        quintis_file_id = f"quintis_{file_id}"
-        print(f"Procurando quintis: {quintis_file_id}")
-        print(f"Arquivos disponíveis: {list(temp_files.keys())[:5]}...")
-        
-        if quintis_file_id not in temp_files:
-            raise HTTPException(status_code=404, detail=f"Arquivo de quintis não encontrado. Processe o RFV primeiro. Procurando: {quintis_file_id}")
-        
-        quintis_path = temp_files[quintis_file_id]
-        print(f"Carregando quintis de: {quintis_path}")
-        
-        if not os.path.exists(quintis_path):
-            raise HTTPException(status_code=404, detail=f"Arquivo de quintis não existe no disco: {quintis_path}")
-        
-        with open(quintis_path, 'r', encoding='utf-8') as f:
-            quintis_info = json.load(f)
-        
-        print(f"Quintis carregados: {quintis_info}")
-        
-        # Valida os quintis
-        for key in ['recencia', 'frequencia', 'valor']:
-            if key not in quintis_info:
-                raise HTTPException(status_code=400, detail=f"Quintis incompletos: falta '{key}'")
-            if len(quintis_info[key]) != 4:
-                raise HTTPException(status_code=400, detail=f"Quintis inválidos: '{key}' deve ter 4 valores, tem {len(quintis_info[key])}")
-        
-        # Calcula estatísticas
-        total_clientes = len(df_rfv)
-        receita_total = df_rfv['valor_total'].sum()
-        segmentos = df_rfv['Segmento'].value_counts().to_dict()
-        
-        statistics = {
-            'total_clientes': int(total_clientes),
-            'receita_total': float(receita_total),
-            'segmentos': {k: int(v) for k, v in segmentos.items()}
-        }
-        
-        # Gera o PDF
-        pdf_bytes = generate_pdf_report(df_rfv, statistics, quintis_info)
-        
-        return Response(
-            content=pdf_bytes,
-            media_type='application/pdf',
-            headers={
-                "Content-Disposition": f"attachment; filename=relatorio_rfv_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            }
-        )
+        pdf_bytes, perfil = run_profiled('generate-pdf', lambda etapa: run_generate_pdf(file_id, etapa), profile)
+        resposta = pdf_response(pdf_bytes)
+        if perfil.etapas:
+            resposta.headers['Server-Timing'] = perfil.server_timing()
+        return resposta
     except HTTPException:
         raise
     except Exception as e:
@@ -682,7 +1268,85 @@ async def generate_pdf(file_id: str):
         print(f"Erro detalhado: {traceback.format_exc()}")
         raise HTTPException(status_code=400, detail=error_msg)
 
+# Jobs em segundo plano: o endpoint de envio retorna o job_id imediatamente e o
+# processamento roda no pool limitado de job_manager
+def submit_job(kind: str, stages: List[str], fn: Callable[[Callable[[str], None]], Any]) -> dict:
+    try:
+        job = job_manager.submit(kind, stages, lambda set_stage: run_profiled(kind, fn, repassar=set_stage)[0])
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return job.to_dict()
+
+@app.post("/jobs/analyze-outliers", status_code=202)
+def submit_analyze_outliers(request: ProcessRequest):
+    """Enfileira a análise de outliers"""
+    return submit_job('analyze-outliers', ['leitura', 'estatisticas'],
+                      lambda etapa: run_analyze_outliers(request, etapa))
+
+@app.post("/jobs/process-rfv", status_code=202)
+def submit_process_rfv(request: ProcessRequest):
+    """Enfileira o processamento RFV"""
+    return submit_job('process-rfv', ['leitura', 'agregacao', 'pontuacao', 'gravacao'],
+                      lambda etapa: run_process_rfv(request, etapa))
+
+@app.post("/jobs/rfv-scenarios", status_code=202)
+def submit_rfv_scenarios(request: ScenarioRequest):
+    """Enfileira a comparação de cenários"""
+    return submit_job('rfv-scenarios', ['leitura', 'agregacao', 'pontuacao'],
+                      lambda etapa: run_rfv_scenarios(request, etapa))
+
+@app.post("/jobs/rfv-migration", status_code=202)
+def submit_rfv_migration(request: MigrationRequest):
+    """Enfileira o cálculo da matriz de migração"""
+    return submit_job('rfv-migration', ['leitura', 'agregacao', 'pontuacao'],
+                      lambda etapa: run_rfv_migration(request, etapa))
+
+@app.post("/jobs/rfv-state", status_code=202)
+def submit_create_rfv_state(request: RFVStateRequest):
+    """Enfileira a criação do estado incremental"""
+    return submit_job('rfv-state', ['leitura', 'agregacao', 'pontuacao', 'gravacao'],
+                      lambda etapa: run_create_rfv_state(request, etapa))
+
+@app.post("/jobs/rfv-state/{state_id}/append", status_code=202)
+def submit_append_rfv_state(state_id: str, request: AppendRequest):
+    """Enfileira a atualização do estado incremental com um lote de transações"""
+    return submit_job('rfv-state-append', ['leitura', 'agregacao', 'pontuacao', 'gravacao'],
+                      lambda etapa: run_append_rfv_state(state_id, request, etapa))
+
+@app.post("/jobs/generate-pdf/{file_id}", status_code=202)
+def submit_generate_pdf(file_id: str):
+    """Enfileira a geração do relatório PDF"""
+    return submit_job('generate-pdf', ['leitura', 'renderizacao'],
+                      lambda etapa: run_generate_pdf(file_id, etapa))
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    """Estado do job: etapa atual, progresso e, quando concluído, o resultado"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    status = job.to_dict()
+    if job.status == "done" and not isinstance(job.result, bytes):
+        status["result"] = job.result
+    return status
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    """Resultado de um job concluído (JSON ou, para generate-pdf, o arquivo PDF)"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    if job.status == "error":
+        raise HTTPException(status_code=400, detail=job.error)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Job ainda não concluído (status: {job.status})")
+    if isinstance(job.result, bytes):
+        return pdf_response(job.result)
+    return job.result
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Com mais de um worker o uvicorn precisa importar a aplicação pelo nome
+    workers = int(os.environ.get('RFV_API_WORKERS', '1'))
+    uvicorn.run("main:app" if workers > 1 else app, host="0.0.0.0", port=8000, workers=workers)
 
@@ -0,0 +1,192 @@
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Limites (le) dos histogramas exportados em /metrics
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+ROWS_BUCKETS = [1e3, 1e4, 1e5, 1e6, 1e7, 1e8]
+MEMORY_BUCKETS = [2 ** 20 * mb for mb in (1, 10, 50, 100, 250, 500, 1000, 2500, 5000)]
+
+# Pico de memória: no Linux, o pico de RSS do processo (VmHWM), zerado a cada etapa via
+# /proc/self/clear_refs; nos demais sistemas, o pico do tracemalloc (bem mais lento)
+_PROC_STATUS = '/proc/self/status'
+_PROC_CLEAR_REFS = '/proc/self/clear_refs'
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+class StageProfiler:
+    """Callback de etapa (`etapa`) que mede cada etapa do pipeline
+
+    Cada chamada encerra a etapa anterior e inicia a seguinte, registrando o tempo de
+    parede e as linhas informadas com record_rows. Com memoria=True também registra o pico
+    de memória de cada etapa; a medição é do processo inteiro, então com requisições
+    simultâneas perfiladas os picos se misturam.
+    `repassar` recebe as mesmas chamadas (por exemplo o set_stage de um job).
+    """
+
+    def __init__(self, memoria: bool = False, repassar: Optional[Callable[[str], None]] = None):
+        self.repassar = repassar
+        self.etapas: List[Dict[str, Any]] = []
+        self._inicio: Optional[float] = None
+        self.fonte_memoria = None  # 'rss' ou 'tracemalloc' quando mede memória
+        self._medindo = memoria
+        if memoria:
+            self.fonte_memoria = 'rss' if _reset_rss_peak() else 'tracemalloc'
+            if self.fonte_memoria == 'tracemalloc':
+                _start_tracemalloc()
+
+    def __call__(self, nome: str) -> None:
+        self._fechar()
+        self.etapas.append({'etapa': nome, 'segundos': 0.0, 'linhas': None, 'pico_memoria_bytes': None})
+        self._inicio = time.perf_counter()
+        if self._medindo and self.fonte_memoria == 'rss':
+            _reset_rss_peak()
+        elif self._medindo:
+            tracemalloc.reset_peak()
+        if self.repassar is not None:
+            self.repassar(nome)
+
+    def rows(self, quantidade: int) -> None:
+        """Linhas processadas pela etapa atual"""
+        if self.etapas:
+            self.etapas[-1]['linhas'] = int(quantidade)
+
+    def finish(self) -> None:
+        """Encerra a última etapa (chamar uma vez, ao final do processamento)"""
+        self._fechar()
+        if self._medindo and self.fonte_memoria == 'tracemalloc':
+            _stop_tracemalloc()
+        self._medindo = False
+
+    def _fechar(self) -> None:
+        if self._inicio is None:
+            return
+        etapa = self.etapas[-1]
+        etapa['segundos'] = round(time.perf_counter() - self._inicio, 6)
+        if self._medindo and self.fonte_memoria == 'rss':
+            etapa['pico_memoria_bytes'] = _rss_peak()
+        elif self._medindo:
+            etapa['pico_memoria_bytes'] = tracemalloc.get_traced_memory()[1]
+        self._inicio = None
+
+    def server_timing(self) -> str:
+        """Valor do header Server-Timing (durações em milissegundos)"""
+        return ', '.join(f"{e['etapa']};dur={e['segundos'] * 1000:.1f}" for e in self.etapas)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'total_segundos': round(sum(e['segundos'] for e in self.etapas), 6),
+            'fonte_memoria': self.fonte_memoria,
+            'etapas': self.etapas,
+        }
+
+
+def record_rows(etapa: Callable[[str], None], quantidade: int) -> None:
+    """Informa as linhas da etapa atual quando o callback de etapa é um StageProfiler"""
+    if isinstance(etapa, StageProfiler):
+        etapa.rows(quantidade)
+
+
+def _reset_rss_peak() -> bool:
+    try:
+        with open(_PROC_CLEAR_REFS, 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _rss_peak() -> Optional[int]:
+    try:
+        with open(_PROC_STATUS, 'r') as f:
+            for linha in f:
+                if linha.startswith('VmHWM:'):
+                    return int(linha.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _start_tracemalloc() -> None:
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc() -> None:
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+
+class Histogram:
+    """Histograma cumulativo no formato do Prometheus, com séries por conjunto de labels"""
+
+    def __init__(self, nome: str, descricao: str, limites: List[float]):
+        self.nome = nome
+        self.descricao = descricao
+        self.limites = limites
+        self._series: Dict[Tuple[Tuple[str, str], ...], Dict[str, Any]] = {}
+
+    def observe(self, valor: float, **labels: str) -> None:
+        chave = tuple(sorted(labels.items()))
+        serie = self._series.get(chave)
+        if serie is None:
+            serie = self._series[chave] = {'baldes': [0] * len(self.limites), 'soma': 0.0, 'contagem': 0}
+        for i, limite in enumerate(self.limites):
+            if valor <= limite:
+                serie['baldes'][i] += 1
+        serie['soma'] += valor
+        serie['contagem'] += 1
+
+    def render(self) -> List[str]:
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} histogram"]
+        for chave, serie in sorted(self._series.items()):
+            labels = ','.join(f'{k}="{v}"' for k, v in chave)
+            for limite, contagem in zip(self.limites, serie['baldes']):
+                linhas.append(f'{self.nome}_bucket{{{labels},le="{limite:g}"}} {contagem}')
+            linhas.append(f'{self.nome}_bucket{{{labels},le="+Inf"}} {serie["contagem"]}')
+            linhas.append(f"{self.nome}_sum{{{labels}}} {serie['soma']!r}")
+            linhas.append(f"{self.nome}_count{{{labels}}} {serie['contagem']}")
+        return linhas
+
+
+class StageMetrics:
+    """Agrega as medições de etapa de todas as operações (por processo) para o /metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.duracao = Histogram('rfv_stage_duration_seconds', 'Tempo de parede por etapa do pipeline', DURATION_BUCKETS)
+        self.linhas = Histogram('rfv_stage_rows', 'Linhas processadas por etapa do pipeline', ROWS_BUCKETS)
+        self.memoria = Histogram('rfv_stage_peak_memory_bytes', 'Pico de memória por etapa (execuções perfiladas)', MEMORY_BUCKETS)
+        self._execucoes: Dict[Tuple[str, str], int] = {}
+
+    def observe(self, operacao: str, perfil: StageProfiler, status: str = 'ok') -> None:
+        with self._lock:
+            chave = (operacao, status)
+            self._execucoes[chave] = self._execucoes.get(chave, 0) + 1
+            for etapa in perfil.etapas:
+                labels = {'operation': operacao, 'stage': etapa['etapa']}
+                self.duracao.observe(etapa['segundos'], **labels)
+                if etapa['linhas'] is not None:
+                    self.linhas.observe(etapa['linhas'], **labels)
+                if etapa['pico_memoria_bytes'] is not None:
+                    self.memoria.observe(etapa['pico_memoria_bytes'], **labels)
+
+    def render(self) -> str:
+        """Exposição em texto do Prometheus"""
+        with self._lock:
+            linhas = ['# HELP rfv_operations_total Execuções por operação e resultado',
+                      '# TYPE rfv_operations_total counter']
+            for (operacao, status), total in sorted(self._execucoes.items()):
+                linhas.append(f'rfv_operations_total{{operation="{operacao}",status="{status}"}} {total}')
+            for histograma in (self.duracao, self.linhas, self.memoria):
+                linhas.extend(histograma.render())
+        return '\n'.join(linhas) + '\n'
@@ -0,0 +1,357 @@
+"""Pipeline RFV sem efeitos colaterais na importação: limpeza, agregação, scores e segmentos
+
+Usado pela API (main.py) e pelo processamento em lote (batch.py). Nada aqui cria diretórios,
+threads ou pools na importação; o pool da agregação paralela é criado sob demanda.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from columnar import COLUNAS
+from dates import parse_dates
+from metrics import record_rows
+
+# Modo fora de memória: tamanho mínimo do arquivo, linhas por bloco e
+# quantos agregados parciais acumular antes de combiná-los
+CHUNKED_MIN_BYTES = int(os.environ.get('RFV_CHUNKED_MIN_MB', '2048')) * 1024 * 1024
+CHUNK_ROWS = int(os.environ.get('RFV_CHUNK_ROWS', '1000000'))
+CHUNK_MERGE_EVERY = 8
+
+# Agregação paralela: número de processos (1 = serial) e mínimo de transações para usá-la
+RFV_WORKERS = int(os.environ.get('RFV_WORKERS', '1'))
+PARALLEL_MIN_ROWS = int(os.environ.get('RFV_PARALLEL_MIN_ROWS', '500000'))
+
+# Processos da agregação paralela iniciados sem fork: a API tem threads (jobs, limpeza de
+# artefatos) e um fork copiaria locks possivelmente em uso por elas
+MP_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+_process_pools: Dict[int, ProcessPoolExecutor] = {}
+_process_pools_lock = threading.Lock()
+
+# Janela de análise padrão (dias antes da data de referência)
+JANELA_DIAS = 365
+
+# Modelos Pydantic compartilhados pela API e pelo lote
+class ColumnMapping(BaseModel):
+    id_cliente: str
+    id_transacao: str
+    data: str
+    valor: str
+    file_id: Optional[str] = None
+    data_format: Optional[str] = None  # ex.: "%d/%m/%Y"; se ausente, é detectado em uma amostra
+
+class OutlierTreatment(BaseModel):
+    method: str  # "keep", "winsorize", "remove"
+    lower_limit: Optional[float] = None
+    upper_limit: Optional[float] = None
+
+def clean_dataset(df: pd.DataFrame, mapping: ColumnMapping, formato_data: Optional[str],
+                  relatorio: Optional[dict] = None) -> pd.DataFrame:
+    """Renomeia as colunas mapeadas, converte tipos e remove linhas com data ou valor nulos
+    
+    Se `relatorio` for informado, acumula nele as linhas lidas e as datas convertidas em NaT.
+    """
+    df = df.rename(columns={
+        mapping.id_cliente: 'id_cliente',
+        mapping.id_transacao: 'id_transacao',
+        mapping.data: 'data',
+        mapping.valor: 'valor'
+    })[COLUNAS]
+    
+    # Converte tipos
+    df['data'], coagidos = parse_dates(df['data'], formato_data)
+    df['valor'] = pd.to_numeric(df['valor'], errors='coerce')
+    
+    if relatorio is not None:
+        relatorio['date_format'] = formato_data
+        relatorio['rows_read'] = relatorio.get('rows_read', 0) + len(df)
+        relatorio['coerced_to_nat'] = relatorio.get('coerced_to_nat', 0) + coagidos
+    
+    return df.dropna(subset=['data', 'valor'])
+
+def score_quintis(valores: np.ndarray, quintis: List[float], inverso: bool = False) -> np.ndarray:
+    """Atribui scores de 1 a 5 em lote a partir dos 4 pontos de corte (quintis)
+    
+    Mantém a mesma semântica de fronteira das regras originais:
+    - inverso=False (F e V): valor <= q[0] -> 1, ..., valor > q[3] -> 5
+    - inverso=True (R): valor >= q[3] -> 1, ..., valor < q[0] -> 5
+    Os quintis vêm de Series.quantile e portanto já estão em ordem crescente.
+    Valores NaN falham em todas as comparações das regras originais e recebem 5 nos
+    dois sentidos.
+    """
+    cortes = np.asarray(quintis, dtype=np.float64)
+    if inverso:
+        # Quantidade de cortes <= valor (equivale à cadeia de ">="); o NaN fica após todos os cortes
+        scores = (5 - np.searchsorted(cortes, valores, side='right')).astype(np.int8)
+        if valores.dtype.kind == 'f':
+            scores[np.isnan(valores)] = 5
+        return scores
+    # Quantidade de cortes < valor (equivale à cadeia de "<=")
+    return (1 + np.searchsorted(cortes, valores, side='left')).astype(np.int8)
+
+# Regras de segmentação em ordem de prioridade (código 2 a 9).
+# Cada regra recebe os scores R, F, V e a média de F+V. O código 1 (NOVOS) depende
+# de recencia_dias/frequencia e é aplicado à parte; clientes sem regra ficam como OUTROS (0).
+SEGMENT_RULES = [
+    # Código 2: CAMPEÃO - R=5, F>=3, V=5
+    (2, 'CAMPEÃO', lambda r, f, v, media: r == 5 and f >= 3 and v == 5),
+    # Código 3: LEAIS - R=3 ou 4 e média de F+V >= 3
+    (3, 'LEAIS', lambda r, f, v, media: r in [3, 4] and media >= 3),
+    # Código 4: POTENCIAIS - (R=5 e média>=3 e V>=3) OU (R=4 e média>=2 e V=3 ou 4)
+    (4, 'POTENCIAIS', lambda r, f, v, media: (r == 5 and media >= 3 and v >= 3) or (r == 4 and media >= 2 and v in [3, 4])),
+    # Código 5: PROMISSORES - (R=4 e média<=2) OU (R=3 e média<3) OU (R=5 e média<=3)
+    (5, 'PROMISSORES', lambda r, f, v, media: (r == 4 and media <= 2) or (r == 3 and media < 3) or (r == 5 and media <= 3)),
+    # Código 6: HIBERNANDO - R=2 e média < 4
+    (6, 'HIBERNANDO', lambda r, f, v, media: r == 2 and media < 4),
+    # Código 7: PREOCUPANTES - R=2 e média >= 4
+    (7, 'PREOCUPANTES', lambda r, f, v, media: r == 2 and media >= 4),
+    # Código 8: RISCO - R=1 e média < 4
+    (8, 'RISCO', lambda r, f, v, media: r == 1 and media < 4),
+    # Código 9: NAO_PODEMOS_PERDER - R=1 e média >= 4
+    (9, 'NAO_PODEMOS_PERDER', lambda r, f, v, media: r == 1 and media >= 4),
+]
+
+# Código 1: NOVOS - 1ª compra nos últimos 60 dias
+NOVOS_CODIGO = 1
+NOVOS_DIAS = 60
+
+def compile_segment_table(rules=SEGMENT_RULES):
+    """Compila as regras em uma tabela 5x5x5 (R, F, V) -> código e no vetor de nomes por código"""
+    nomes = {0: 'OUTROS', NOVOS_CODIGO: 'NOVOS'}
+    nomes.update({codigo: nome for codigo, nome, _ in rules})
+    
+    tabela = np.zeros((5, 5, 5), dtype=np.int8)
+    for r in range(1, 6):
+        for f in range(1, 6):
+            for v in range(1, 6):
+                media = (f + v) / 2
+                for codigo, _, regra in rules:
+                    if regra(r, f, v, media):
+                        tabela[r - 1, f - 1, v - 1] = codigo
+                        break
+    
+    segmentos = np.array([nomes.get(i, 'OUTROS') for i in range(max(nomes) + 1)], dtype=object)
+    return tabela, segmentos
+
+SEGMENT_TABLE, SEGMENTOS = compile_segment_table()
+
+def segmentar_clientes(r: np.ndarray, f: np.ndarray, v: np.ndarray,
+                       recencia_dias: np.ndarray, frequencia: np.ndarray) -> np.ndarray:
+    """Retorna o código de segmento de cada cliente (índice em SEGMENTOS)"""
+    codigos = SEGMENT_TABLE[r.astype(np.intp) - 1, f.astype(np.intp) - 1, v.astype(np.intp) - 1]
+    novos = (recencia_dias <= NOVOS_DIAS) & (frequencia == 1)
+    return np.where(novos, np.int8(NOVOS_CODIGO), codigos)
+
+def outlier_limits(outlier_treatment: OutlierTreatment, percentis: Callable[[], tuple]) -> tuple:
+    """Retorna os limites (inferior, superior) do tratamento de outliers
+    
+    Limites não informados usam os percentis 5 e 95 devolvidos por `percentis`,
+    que só é chamado nesse caso.
+    """
+    lower = outlier_treatment.lower_limit
+    upper = outlier_treatment.upper_limit
+    if not lower or not upper:
+        p05, p95 = percentis()
+        lower = lower if lower else p05
+        upper = upper if upper else p95
+    return lower, upper
+
+def aggregate_customers(df: pd.DataFrame) -> pd.DataFrame:
+    """Agrega as transações por cliente (última compra, frequência e valor total)"""
+    df_agg = df.groupby('id_cliente', observed=True).agg({
+        'data': 'max',  # Última compra
+        'id_transacao': 'count',  # Frequência
+        'valor': 'sum'  # Valor total
+    }).reset_index()
+    
+    df_agg.columns = ['id_cliente', 'ultima_compra', 'frequencia', 'valor_total']
+    return df_agg
+
+def merge_partial_aggregates(parciais: List[pd.DataFrame]) -> pd.DataFrame:
+    """Combina agregados parciais por cliente produzidos por aggregate_customers"""
+    if not parciais:
+        return pd.DataFrame(columns=['id_cliente', 'ultima_compra', 'frequencia', 'valor_total'])
+    return pd.concat(parciais, ignore_index=True).groupby('id_cliente', observed=True).agg({
+        'ultima_compra': 'max',
+        'frequencia': 'sum',
+        'valor_total': 'sum'
+    }).reset_index()
+
+def get_process_pool(workers: int) -> ProcessPoolExecutor:
+    """Pool de `workers` processos compartilhado pelas agregações paralelas (criado sob demanda)"""
+    with _process_pools_lock:
+        if workers not in _process_pools:
+            _process_pools[workers] = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context(MP_START_METHOD)
+            )
+        return _process_pools[workers]
+
+def aggregate_customers_parallel(df: pd.DataFrame, workers: int) -> pd.DataFrame:
+    """Agrega por cliente particionando as transações por hash de id_cliente entre processos
+    
+    Cada cliente cai em uma única partição, então os agregados de cada processo já são
+    finais; a ordenação por id_cliente reproduz a saída do groupby serial.
+    """
+    particao = pd.util.hash_pandas_object(df['id_cliente'], index=False).to_numpy() % workers
+    futuros = [
+        get_process_pool(workers).submit(aggregate_customers, df[particao == i])
+        for i in range(workers)
+    ]
+    df_agg = pd.concat([futuro.result() for futuro in futuros], ignore_index=True)
+    return df_agg.sort_values('id_cliente', kind='stable', ignore_index=True)
+
+def calculate_rfv_scores(df: pd.DataFrame, outlier_treatment: OutlierTreatment, workers: int = 1,
+                         percentis: Optional[Callable[[], tuple]] = None,
+                         etapa: Callable[[str], None] = lambda nome: None) -> tuple:
+    """Calcula os scores RFV para cada cliente e retorna também os quintis calculados
+    
+    Com workers > 1 a agregação por cliente roda em paralelo (ver aggregate_customers_parallel).
+    `percentis` fornece os percentis 5/95 usados como limites padrão de outliers
+    (por exemplo a partir do sketch de valores); sem ele são calculados de forma exata.
+    `etapa` é chamada no início de cada etapa ('agregacao', 'pontuacao').
+    """
+    if percentis is None:
+        percentis = lambda: tuple(df['valor'].quantile([0.05, 0.95]))
+    
+    etapa('agregacao')
+    
+    # Aplica tratamento de outliers
+    if outlier_treatment.method == "winsorize":
+        lower, upper = outlier_limits(outlier_treatment, percentis)
+        df = df.assign(valor=df['valor'].clip(lower=lower, upper=upper))
+    elif outlier_treatment.method == "remove":
+        lower, upper = outlier_limits(outlier_treatment, percentis)
+        df = df[(df['valor'] >= lower) & (df['valor'] <= upper)]
+    
+    # Define data de referência (última data + 1 dia)
+    data_referencia = df['data'].max() + timedelta(days=1)
+    
+    # Filtra últimos 12 meses
+    data_limite = data_referencia - timedelta(days=JANELA_DIAS)
+    df = df[df['data'] >= data_limite]
+    record_rows(etapa, len(df))
+    
+    if workers > 1 and len(df) >= PARALLEL_MIN_ROWS:
+        df_agg = aggregate_customers_parallel(df, workers)
+    else:
+        df_agg = aggregate_customers(df)
+    
+    etapa('pontuacao')
+    record_rows(etapa, len(df_agg))
+    return score_customers(df_agg, data_referencia)
+
+def chunked_percentiles(read_chunks: Callable[[], Iterator[pd.DataFrame]]) -> tuple:
+    """Percentis 5/95 exatos dos valores lidos em blocos (só a coluna de valor fica em memória)"""
+    valores = [chunk['valor'].to_numpy() for chunk in read_chunks()]
+    return tuple(pd.Series(np.concatenate(valores) if valores else []).quantile([0.05, 0.95]))
+
+def calculate_rfv_scores_chunked(read_chunks: Callable[[], Iterator[pd.DataFrame]],
+                                 outlier_treatment: OutlierTreatment,
+                                 percentis: Optional[Callable[[], tuple]] = None,
+                                 etapa: Callable[[str], None] = lambda nome: None) -> tuple:
+    """Versão fora de memória de calculate_rfv_scores
+    
+    `read_chunks` deve devolver um novo iterador de blocos tipados a cada chamada.
+    Os blocos são percorridos em até três passadas: percentis 5/95 exatos (apenas se o
+    tratamento precisar deles e `percentis` não for informado), data de referência e
+    agregação da janela de 12 meses. Só os agregados parciais por cliente ficam em memória.
+    """
+    etapa('agregacao')
+    if percentis is None:
+        percentis = lambda: chunked_percentiles(read_chunks)
+    
+    method = outlier_treatment.method
+    lower = upper = None
+    if method in ("winsorize", "remove"):
+        lower, upper = outlier_limits(outlier_treatment, percentis)
+    
+    def tratar(chunk):
+        if method == "winsorize":
+            return chunk.assign(valor=chunk['valor'].clip(lower=lower, upper=upper))
+        if method == "remove":
+            return chunk[(chunk['valor'] >= lower) & (chunk['valor'] <= upper)]
+        return chunk
+    
+    # Define data de referência (última data + 1 dia) com um máximo acumulado;
+    # blocos vazios após o tratamento (ex.: todos removidos como outliers) são ignorados
+    data_maxima = None
+    for chunk in read_chunks():
+        maxima = tratar(chunk)['data'].max()
+        if pd.notna(maxima):
+            data_maxima = maxima if data_maxima is None else max(data_maxima, maxima)
+    data_referencia = pd.Timestamp(data_maxima) + timedelta(days=1)
+    data_limite = data_referencia - timedelta(days=JANELA_DIAS)
+    
+    # Agrega cada bloco e combina os parciais (máximo da data, soma das contagens e valores)
+    parciais = []
+    linhas = 0
+    for chunk in read_chunks():
+        chunk = tratar(chunk)
+        chunk = chunk[chunk['data'] >= data_limite]
+        linhas += len(chunk)
+        parciais.append(aggregate_customers(chunk))
+        if len(parciais) >= CHUNK_MERGE_EVERY:
+            parciais = [merge_partial_aggregates(parciais)]
+    
+    df_agg = merge_partial_aggregates(parciais)
+    record_rows(etapa, linhas)
+    
+    etapa('pontuacao')
+    record_rows(etapa, len(df_agg))
+    return score_customers(df_agg, data_referencia)
+
+def score_customers(df_agg: pd.DataFrame, data_referencia: pd.Timestamp) -> tuple:
+    """Atribui scores R, F, V e segmentos aos clientes agregados e retorna também os quintis"""
+    
+    # Calcula Recência (dias desde última compra)
+    df_agg['recencia_dias'] = (data_referencia - df_agg['ultima_compra']).dt.days
+    
+    # Calcula quintis para Recência (R)
+    recencia_quintis = df_agg['recencia_dias'].quantile([0.2, 0.4, 0.6, 0.8]).tolist()
+    recencia_quintis = [float(q) for q in recencia_quintis]
+    
+    # Calcula quintis para Frequência (F)
+    frequencia_quintis = df_agg['frequencia'].quantile([0.2, 0.4, 0.6, 0.8]).tolist()
+    frequencia_quintis = [float(q) for q in frequencia_quintis]
+    
+    # Calcula quintis para Valor (V)
+    valor_quintis = df_agg['valor_total'].quantile([0.2, 0.4, 0.6, 0.8]).tolist()
+    valor_quintis = [float(q) for q in valor_quintis]
+    
+    # Scores vetorizados a partir dos quintis (R invertido: maior recência = menor score)
+    df_agg['R_score'] = score_quintis(df_agg['recencia_dias'].to_numpy(), recencia_quintis, inverso=True)
+    df_agg['F_score'] = score_quintis(df_agg['frequencia'].to_numpy(), frequencia_quintis)
+    df_agg['V_score'] = score_quintis(df_agg['valor_total'].to_numpy(), valor_quintis)
+    
+    # Segmentação via tabela pré-compilada (R, F, V) + máscara de NOVOS
+    df_agg['Segmento'] = SEGMENTOS[segmentar_clientes(
+        df_agg['R_score'].to_numpy(),
+        df_agg['F_score'].to_numpy(),
+        df_agg['V_score'].to_numpy(),
+        df_agg['recencia_dias'].to_numpy(),
+        df_agg['frequencia'].to_numpy()
+    )]
+    
+    # Retorna o dataframe e os quintis calculados
+    quintis_info = {
+        'recencia': recencia_quintis,
+        'frequencia': frequencia_quintis,
+        'valor': valor_quintis
+    }
+    
+    return df_agg[['id_cliente', 'R_score', 'F_score', 'V_score', 'Segmento', 'recencia_dias', 'frequencia', 'valor_total']], quintis_info
+
+def result_statistics(df_rfv: pd.DataFrame) -> Dict[str, Any]:
+    """Totais e contagem por segmento de um resultado RFV"""
+    segmentos = df_rfv['Segmento'].value_counts().to_dict()
+    return {
+        "total_clientes": int(len(df_rfv)),
+        "receita_total": float(df_rfv['valor_total'].sum()),
+        "segmentos": {k: int(v) for k, v in segmentos.items()}
+    }
@@ -0,0 +1,269 @@
+"""Relatório PDF de um resultado RFV (estatísticas e quintis)"""
+import io
+from datetime import datetime
+
+import pandas as pd
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+
+def generate_pdf_report(statistics: dict, quintis_info: dict) -> bytes:
+    """Gera relatório PDF com análise RFV"""
+    try:
+        # Valida e converte quintis
+        recencia_quintis = [float(q) for q in quintis_info.get('recencia', [])]
+        frequencia_quintis = [float(q) for q in quintis_info.get('frequencia', [])]
+        valor_quintis = [float(q) for q in quintis_info.get('valor', [])]
+        
+        if len(recencia_quintis) != 4 or len(frequencia_quintis) != 4 or len(valor_quintis) != 4:
+            raise ValueError("Quintis devem ter exatamente 4 valores cada")
+        
+        # Verifica se há valores NaN
+        for q_list, name in [(recencia_quintis, 'recencia'), (frequencia_quintis, 'frequencia'), (valor_quintis, 'valor')]:
+            if any(pd.isna(q) or q is None for q in q_list):
+                raise ValueError(f"Quintis de {name} contém valores inválidos: {q_list}")
+        
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=A4)
+        story = []
+        styles = getSampleStyleSheet()
+        
+        # Estilos personalizados
+        title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=20,
+            textColor=colors.HexColor('#1e40af'),
+            spaceAfter=30,
+            alignment=1  # Centralizado
+        )
+        
+        heading_style = ParagraphStyle(
+            'CustomHeading',
+            parent=styles['Heading2'],
+            fontSize=14,
+            textColor=colors.HexColor('#1e40af'),
+            spaceAfter=12,
+            spaceBefore=20
+        )
+        
+        # Título
+        story.append(Paragraph("Relatório de Análise RFV", title_style))
+        story.append(Paragraph(f"Data de geração: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", styles['Normal']))
+        story.append(Spacer(1, 20))
+        
+        # Seção 1: Conceitos
+        story.append(Paragraph("Conceitos", heading_style))
+        
+        # Recência - usando quintis dinâmicos
+        story.append(Paragraph("<b>Recência (R)</b>", styles['Heading3']))
+        
+        # Texto descritivo dos conceitos
+        story.append(Paragraph(
+            f"<b>1</b> - Última compra ocorreu há {recencia_quintis[3]:.0f} dias ou mais;<br/>"
+            f"<b>2</b> - Última compra ocorreu entre {recencia_quintis[2]:.0f} e {recencia_quintis[3]:.0f} dias atrás;<br/>"
+            f"<b>3</b> - Última compra ocorreu entre {recencia_quintis[1]:.0f} e {recencia_quintis[2]:.0f} dias atrás;<br/>"
+            f"<b>4</b> - Última compra ocorreu entre {recencia_quintis[0]:.0f} e {recencia_quintis[1]:.0f} dias atrás;<br/>"
+            f"<b>5</b> - Última compra ocorreu nos últimos {recencia_quintis[0]:.0f} dias.",
+            styles['Normal']
+        ))
+        story.append(Spacer(1, 10))
+        
+        # Tabela
+        recencia_data = [
+            ['Score', 'Período (dias)'],
+            ['1', f'≥ {recencia_quintis[3]:.0f} dias'],
+            ['2', f'{recencia_quintis[2]:.0f} a {recencia_quintis[3]:.0f} dias'],
+            ['3', f'{recencia_quintis[1]:.0f} a {recencia_quintis[2]:.0f} dias'],
+            ['4', f'{recencia_quintis[0]:.0f} a {recencia_quintis[1]:.0f} dias'],
+            ['5', f'< {recencia_quintis[0]:.0f} dias'],
+        ]
+        recencia_table = Table(recencia_data, colWidths=[1*inch, 4.5*inch])
+        recencia_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3b82f6')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
+        ]))
+        story.append(recencia_table)
+        story.append(Spacer(1, 15))
+        
+        # Frequência - usando quintis dinâmicos
+        story.append(Paragraph("<b>Frequência (F)</b>", styles['Heading3']))
+        story.append(Paragraph("Os limiares de quantidade de pedidos para a atribuição do score de frequência foram calculados através dos quintis", styles['Normal']))
+        story.append(Spacer(1, 10))
+        
+        # Texto descritivo dos conceitos
+        story.append(Paragraph(
+            f"<b>1</b> - Realizou de 1 a {frequencia_quintis[0]:.0f} compras nos últimos doze meses;<br/>"
+            f"<b>2</b> - Realizou de {frequencia_quintis[0]:.0f} a {frequencia_quintis[1]:.0f} compras nos últimos doze meses;<br/>"
+            f"<b>3</b> - Realizou de {frequencia_quintis[1]:.0f} a {frequencia_quintis[2]:.0f} compras nos últimos doze meses;<br/>"
+            f"<b>4</b> - Realizou de {frequencia_quintis[2]:.0f} a {frequencia_quintis[3]:.0f} compras nos últimos doze meses;<br/>"
+            f"<b>5</b> - Realizou {frequencia_quintis[3]:.0f} ou mais compras nos últimos doze meses.",
+            styles['Normal']
+        ))
+        story.append(Spacer(1, 10))
+        
+        # Tabela
+        frequencia_data = [
+            ['Score', 'Quantidade de Compras'],
+            ['1', f'1 a {frequencia_quintis[0]:.0f} compras'],
+            ['2', f'{frequencia_quintis[0]:.0f} a {frequencia_quintis[1]:.0f} compras'],
+            ['3', f'{frequencia_quintis[1]:.0f} a {frequencia_quintis[2]:.0f} compras'],
+            ['4', f'{frequencia_quintis[2]:.0f} a {frequencia_quintis[3]:.0f} compras'],
+            ['5', f'{frequencia_quintis[3]:.0f} ou mais compras'],
+        ]
+        frequencia_table = Table(frequencia_data, colWidths=[1*inch, 4.5*inch])
+        frequencia_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10b981')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
+        ]))
+        story.append(frequencia_table)
+        story.append(Spacer(1, 15))
+        
+        # Valor Monetário - usando quintis dinâmicos
+        story.append(Paragraph("<b>Valor Monetário (V)</b>", styles['Heading3']))
+        story.append(Paragraph("Os limiares de valores monetários para a atribuição do score de valor foram calculados através dos quintis", styles['Normal']))
+        story.append(Spacer(1, 10))
+        
+        # Texto descritivo dos conceitos
+        story.append(Paragraph(
+            f"<b>1</b> - Gastou de R$ 0,01 a R$ {valor_quintis[0]:,.2f} nos últimos doze meses;<br/>"
+            f"<b>2</b> - Gastou entre R$ {valor_quintis[0]:,.2f} e R$ {valor_quintis[1]:,.2f} nos últimos doze meses;<br/>"
+            f"<b>3</b> - Gastou entre R$ {valor_quintis[1]:,.2f} e R$ {valor_quintis[2]:,.2f} nos últimos doze meses;<br/>"
+            f"<b>4</b> - Gastou entre R$ {valor_quintis[2]:,.2f} e R$ {valor_quintis[3]:,.2f} nos últimos doze meses;<br/>"
+            f"<b>5</b> - Gastou R$ {valor_quintis[3]:,.2f} ou mais nos últimos doze meses.",
+            styles['Normal']
+        ))
+        story.append(Spacer(1, 10))
+        
+        # Tabela
+        valor_data = [
+            ['Score', 'Valor Total (R$)'],
+            ['1', f'R$ 0,01 a R$ {valor_quintis[0]:,.2f}'],
+            ['2', f'R$ {valor_quintis[0]:,.2f} a R$ {valor_quintis[1]:,.2f}'],
+            ['3', f'R$ {valor_quintis[1]:,.2f} a R$ {valor_quintis[2]:,.2f}'],
+            ['4', f'R$ {valor_quintis[2]:,.2f} a R$ {valor_quintis[3]:,.2f}'],
+            ['5', f'R$ {valor_quintis[3]:,.2f} ou mais'],
+        ]
+        valor_table = Table(valor_data, colWidths=[1*inch, 4.5*inch])
+        valor_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f59e0b')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
+        ]))
+        story.append(valor_table)
+        story.append(PageBreak())
+        
+        # Seção 2: Estatísticas Gerais
+        story.append(Paragraph("Estatísticas Gerais", heading_style))
+        stats_data = [
+            ['Métrica', 'Valor'],
+            ['Total de Clientes', f"{statistics['total_clientes']:,}"],
+            ['Receita Total (12 meses)', f"R$ {statistics['receita_total']:,.2f}"],
+        ]
+        stats_table = Table(stats_data, colWidths=[3*inch, 2.5*inch])
+        stats_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#6366f1')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+        ]))
+        story.append(stats_table)
+        story.append(Spacer(1, 20))
+        
+        # Seção 3: Distribuição por Segmento
+        story.append(Paragraph("Distribuição por Segmento", heading_style))
+        segmentos_data = [['Segmento', 'Quantidade', 'Percentual']]
+        total = statistics['total_clientes']
+        for segmento, quantidade in sorted(statistics['segmentos'].items()):
+            percentual = (quantidade / total * 100) if total > 0 else 0
+            segmentos_data.append([segmento, f"{quantidade:,}", f"{percentual:.2f}%"])
+        
+        segmentos_table = Table(segmentos_data, colWidths=[2.5*inch, 1.5*inch, 1.5*inch])
+        segmentos_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#8b5cf6')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('ALIGN', (2, 0), (2, -1), 'RIGHT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
+        ]))
+        story.append(segmentos_table)
+        story.append(PageBreak())
+        
+        # Seção 4: Definições dos Segmentos
+        story.append(Paragraph("Definições dos Segmentos", heading_style))
+        story.append(Paragraph("<i>Importante: Os segmentos estão na ordem de priorização de classificação. Clientes que se encaixarem em mais de um perfil, terão o perfil de menor código atribuído.</i>", styles['Italic']))
+        story.append(Spacer(1, 15))
+        
+        segmentos_def = [
+            ['Código', 'Segmento', 'Definição', 'Perfil'],
+            ['1', 'NOVOS', 'Clientes que realizaram sua primeira compra nos últimos 60 dias.', 'Clientes que compraram pela primeira vez na marca. Ainda não é possível determinar seu perfil de compra.'],
+            ['2', 'CAMPEÃO', 'R = 5, F ≥ 3, V = 5', 'Compraram recentemente, com frequência e gastam muito.'],
+            ['3', 'LEAIS', 'R = 3 ou 4 e média de F+V >= 3', 'Compraram recentemente com valor e/ou frequência alta.'],
+            ['4', 'POTENCIAIS', 'R = 5 e média de F+V >= 3 e V >= 3 ou R = 4 e média de F+V >= 2 e V = 3 ou 4', 'Compraram recentemente, com alto valor, independentemente da frequência.'],
+            ['5', 'PROMISSORES', 'R = 4 e média de F+V <= 2 ou R = 3 e média de F+V < 3 ou R = 5 e média de F+V <= 3', 'Compraram recentemente, mas não compram muitas vezes e as compras não tem valor alto.'],
+            ['6', 'HIBERNANDO', 'R = 2 e média de F+V < 4', 'Clientes Hibernando realizaram sua última compra há muito tempo, mas compravam com frequência e/ou com valor considerável.'],
+            ['7', 'PREOCUPANTES', 'R = 2 e média de F+V >= 4', 'Clientes Preocupantes também realizaram sua última compra há muito tempo, mas compravam com muita frequência e também gastavam muito.'],
+            ['8', 'RISCO', 'R = 1 e média de F+V < 4', 'São clientes que não compram há mais de 270 dias (Recência = 1), mas compraram poucas vezes e/ou com baixo valor.'],
+            ['9', 'NAO_PODEMOS_PERDER', 'R = 1 e média de F+V >= 4', 'São clientes que não compram há mais de 270 dias (Recência = 1), mas quando compravam, gastavam bastante e com frequência.'],
+        ]
+        
+        segmentos_def_table = Table(segmentos_def, colWidths=[0.5*inch, 1.2*inch, 2*inch, 2.3*inch])
+        segmentos_def_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#ec4899')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 8),
+            ('FONTSIZE', (0, 1), (-1, -1), 7),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('TOPPADDING', (0, 1), (-1, -1), 6),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]))
+        story.append(segmentos_def_table)
+        
+        # Gera o PDF
+        doc.build(story)
+        buffer.seek(0)
+        return buffer.getvalue()
+    except Exception as e:
+        import traceback
+        print(f"Erro na geração do PDF: {str(e)}")
+        print(traceback.format_exc())
+        raise
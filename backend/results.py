@@ -0,0 +1,171 @@
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from storage import staged_directory
+
+# Colunas do resultado RFV, na ordem do CSV de download
+RESULT_COLUMNS = ['id_cliente', 'R_score', 'F_score', 'V_score', 'Segmento', 'recencia_dias', 'frequencia', 'valor_total']
+
+# Chaves de ordenação aceitas pela consulta e a coluna correspondente
+SORT_KEYS = {
+    'recencia': 'recencia_dias',
+    'frequencia': 'frequencia',
+    'valor': 'valor_total',
+}
+
+META_FILE = 'meta.json'
+
+
+def write_result_store(df_rfv: pd.DataFrame, directory: str) -> Dict[str, Any]:
+    """Grava o resultado em colunas .npy agrupadas por segmento, com os índices da consulta
+
+    - as linhas ficam ordenadas por segmento; o meta guarda o intervalo [início, fim) de cada um
+    - Segmento é gravado como código int8 (nomes no meta)
+    - ordem_<chave>.npy: permutação das linhas em ordem crescente de cada chave de SORT_KEYS
+
+    Assim como o armazenamento do dataset, a gravação usa um diretório temporário exclusivo.
+    """
+    codigos, nomes = pd.factorize(df_rfv['Segmento'], sort=True)
+    posicoes = np.argsort(codigos, kind='stable')
+    codigos = codigos[posicoes].astype(np.int8)
+    limites = np.searchsorted(codigos, np.arange(len(nomes) + 1))
+
+    colunas = {'Segmento': codigos}
+    for coluna in RESULT_COLUMNS:
+        if coluna == 'Segmento':
+            continue
+        valores = np.asarray(df_rfv[coluna].to_numpy())[posicoes]
+        if valores.dtype == object:
+            valores = valores.astype(str)
+        colunas[coluna] = valores
+
+    meta = {
+        'linhas': int(len(codigos)),
+        'segmentos': {str(nome): [int(limites[i]), int(limites[i + 1])] for i, nome in enumerate(nomes)},
+    }
+    with staged_directory(directory) as tmp_dir:
+        for coluna, valores in colunas.items():
+            np.save(os.path.join(tmp_dir, f"{coluna}.npy"), valores)
+        for chave, coluna in SORT_KEYS.items():
+            ordem = np.argsort(colunas[coluna], kind='stable').astype(np.int32 if len(codigos) < 2 ** 31 else np.int64)
+            np.save(os.path.join(tmp_dir, f"ordem_{chave}.npy"), ordem)
+        with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+    return meta
+
+
+def has_result_store(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, META_FILE))
+
+
+def query_result_store(directory: str,
+                       segmentos: Optional[List[str]] = None,
+                       faixas: Optional[Dict[str, Tuple[int, int]]] = None,
+                       ordenar_por: Optional[str] = None,
+                       decrescente: bool = False,
+                       offset: int = 0,
+                       limit: int = 50) -> Tuple[int, pd.DataFrame]:
+    """Retorna (total de linhas filtradas, página pedida) sem carregar o resultado inteiro
+
+    `faixas` mapeia colunas de score (R_score, F_score, V_score) para intervalos fechados.
+    Filtros por segmento usam os intervalos do meta; só as colunas de score filtradas
+    e a permutação da ordenação são lidas por completo (mapeadas em memória).
+    """
+    meta = _read_meta(directory)
+    total_linhas = meta['linhas']
+
+    def coluna(nome: str) -> np.ndarray:
+        return np.load(os.path.join(directory, f"{nome}.npy"), mmap_mode='r')
+
+    if segmentos:
+        intervalos = [meta['segmentos'][s] for s in dict.fromkeys(segmentos) if s in meta['segmentos']]
+    else:
+        intervalos = [[0, total_linhas]]
+    faixas = {c: (lo, hi) for c, (lo, hi) in (faixas or {}).items() if lo > 1 or hi < 5}
+
+    if ordenar_por is None and not faixas:
+        # Só segmentos: as linhas já estão agrupadas, a página sai direto dos intervalos
+        total = sum(fim - inicio for inicio, fim in intervalos)
+        trechos = _page_intervals(intervalos, offset, limit)
+        linhas = np.concatenate([np.arange(inicio, fim) for inicio, fim in trechos]) if trechos else np.array([], dtype=np.int64)
+    else:
+        selecao = None
+        if segmentos or faixas:
+            selecao = np.zeros(total_linhas, dtype=bool)
+            for inicio, fim in intervalos:
+                selecao[inicio:fim] = True
+            for nome, (lo, hi) in faixas.items():
+                valores = coluna(nome)
+                selecao &= (valores >= lo) & (valores <= hi)
+
+        if ordenar_por is not None:
+            ordem = coluna(f"ordem_{ordenar_por}")
+            if decrescente:
+                ordem = ordem[::-1]
+            if selecao is not None:
+                ordem = ordem[selecao[ordem]]
+            total = len(ordem)
+            linhas = np.asarray(ordem[offset:offset + limit])
+        else:
+            indices = np.flatnonzero(selecao)
+            total = len(indices)
+            linhas = indices[offset:offset + limit]
+
+    return int(total), _read_rows(directory, meta, linhas)
+
+
+def iter_result_store(directory: str, segmentos: Optional[List[str]] = None,
+                      linhas_por_bloco: int = 100_000) -> Iterator[pd.DataFrame]:
+    """Percorre o resultado (ou só os segmentos pedidos) em blocos de linhas
+
+    Sempre produz ao menos um bloco, vazio se a seleção não tiver linhas.
+    """
+    meta = _read_meta(directory)
+    if segmentos:
+        intervalos = [meta['segmentos'][s] for s in dict.fromkeys(segmentos) if s in meta['segmentos']]
+    else:
+        intervalos = [[0, meta['linhas']]]
+
+    vazio = True
+    for inicio, fim in intervalos:
+        for bloco in range(inicio, fim, linhas_por_bloco):
+            vazio = False
+            yield _read_rows(directory, meta, slice(bloco, min(fim, bloco + linhas_por_bloco)))
+    if vazio:
+        yield _read_rows(directory, meta, slice(0, 0))
+
+
+def _read_meta(directory: str) -> Dict[str, Any]:
+    with open(os.path.join(directory, META_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _read_rows(directory: str, meta: Dict[str, Any], linhas) -> pd.DataFrame:
+    """Lê as linhas pedidas (índices ou slice) de todas as colunas do resultado"""
+    nomes = np.array(list(meta['segmentos']), dtype=object)
+    dados = {}
+    for nome in RESULT_COLUMNS:
+        valores = np.asarray(np.load(os.path.join(directory, f"{nome}.npy"), mmap_mode='r')[linhas])
+        dados[nome] = nomes[valores] if nome == 'Segmento' else valores
+    return pd.DataFrame(dados, columns=RESULT_COLUMNS)
+
+
+def _page_intervals(intervalos: List[List[int]], offset: int, limit: int) -> List[Tuple[int, int]]:
+    """Recorta a página [offset, offset + limit) da concatenação dos intervalos"""
+    pagina = []
+    for inicio, fim in intervalos:
+        tamanho = fim - inicio
+        if offset >= tamanho:
+            offset -= tamanho
+            continue
+        fim_pagina = min(fim, inicio + offset + limit)
+        pagina.append((inicio + offset, fim_pagina))
+        limit -= fim_pagina - inicio - offset
+        offset = 0
+        if limit <= 0:
+            break
+    return pagina
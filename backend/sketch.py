@@ -0,0 +1,133 @@
+import math
+import sys
+from typing import Any, Dict
+
+import numpy as np
+
+# Erro relativo padrão dos quantis estimados (0,5%)
+DEFAULT_RELATIVE_ACCURACY = 0.005
+
+
+class QuantileSketch:
+    """Sketch de quantis mesclável (no estilo DDSketch) com momentos exatos
+
+    Os valores são contados em baldes logarítmicos de razão gamma = (1 + a) / (1 - a).
+    Garantia: qualquer quantil estimado está a no máximo `relative_accuracy` (a),
+    em erro relativo, do valor exato de mesmo posto. Contagem, soma, mínimo e máximo
+    são exatos. Dois sketches com a mesma precisão podem ser mesclados somando os baldes,
+    então o sketch pode ser construído bloco a bloco enquanto o arquivo é lido.
+    """
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positivos: Dict[int, int] = {}
+        self.negativos: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, valores: np.ndarray) -> None:
+        """Adiciona um bloco de valores (NaN são ignorados)"""
+        valores = np.asarray(valores, dtype=np.float64)
+        valores = valores[~np.isnan(valores)]
+        if len(valores) == 0:
+            return
+        self.count += len(valores)
+        self.sum += float(valores.sum())
+        self.min = min(self.min, float(valores.min()))
+        self.max = max(self.max, float(valores.max()))
+        self.zeros += int((valores == 0).sum())
+        self._add(self.positivos, valores[valores > 0])
+        self._add(self.negativos, -valores[valores < 0])
+
+    def _add(self, baldes: Dict[int, int], valores: np.ndarray) -> None:
+        if len(valores) == 0:
+            return
+        indices, contagens = np.unique(np.ceil(np.log(valores) / self._log_gamma).astype(np.int64), return_counts=True)
+        for indice, contagem in zip(indices.tolist(), contagens.tolist()):
+            baldes[indice] = baldes.get(indice, 0) + contagem
+
+    def merge(self, other: "QuantileSketch") -> None:
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Sketches com precisões diferentes não podem ser mesclados")
+        for destino, origem in ((self.positivos, other.positivos), (self.negativos, other.negativos)):
+            for indice, contagem in origem.items():
+                destino[indice] = destino.get(indice, 0) + contagem
+        self.zeros += other.zeros
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def _baldes_ordenados(self):
+        """Pares (valor representativo, contagem) em ordem crescente de valor"""
+        for indice in sorted(self.negativos, reverse=True):
+            yield -self._representante(indice), self.negativos[indice]
+        if self.zeros:
+            yield 0.0, self.zeros
+        for indice in sorted(self.positivos):
+            yield self._representante(indice), self.positivos[indice]
+
+    def _representante(self, indice: int) -> float:
+        return 2 * self.gamma ** indice / (self.gamma + 1)
+
+    def quantile(self, q: float) -> float:
+        """Estimativa do quantil q (0 a 1); NaN se o sketch estiver vazio"""
+        if self.count == 0:
+            return math.nan
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        posto = q * (self.count - 1)
+        acumulado = 0
+        for valor, contagem in self._baldes_ordenados():
+            acumulado += contagem
+            if acumulado > posto:
+                return min(max(valor, self.min), self.max)
+        return self.max
+
+    def count_outside(self, lower: float, upper: float) -> int:
+        """Estimativa de quantos valores estão abaixo de lower ou acima de upper"""
+        return sum(contagem for valor, contagem in self._baldes_ordenados() if valor < lower or valor > upper)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else math.nan
+
+    @property
+    def nbytes(self) -> int:
+        """Memória ocupada pelo sketch (objeto, dicionários de baldes e seus inteiros), para o cache"""
+        total = sys.getsizeof(self) + sys.getsizeof(self.__dict__)
+        for baldes in (self.positivos, self.negativos):
+            total += sys.getsizeof(baldes) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in baldes.items())
+        return total
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "positivos": {str(k): v for k, v in self.positivos.items()},
+            "negativos": {str(k): v for k, v in self.negativos.items()},
+            "zeros": self.zeros,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QuantileSketch":
+        sketch = cls(data["relative_accuracy"])
+        sketch.positivos = {int(k): v for k, v in data["positivos"].items()}
+        sketch.negativos = {int(k): v for k, v in data["negativos"].items()}
+        sketch.zeros = data["zeros"]
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        if sketch.count:
+            sketch.min = data["min"]
+            sketch.max = data["max"]
+        return sketch
@@ -0,0 +1,62 @@
+import contextlib
+import os
+import shutil
+import tempfile
+import uuid
+from typing import Callable, Iterator, Optional
+
+
+@contextlib.contextmanager
+def staged_directory(directory: str, obsoleto: Optional[Callable[[str], bool]] = None) -> Iterator[str]:
+    """Diretório de preparação exclusivo, publicado em `directory` com um rename no final
+
+    Cada escritor grava no seu próprio diretório (mkdtemp ao lado do destino), então
+    escritores concorrentes do mesmo destino não interferem entre si. O primeiro rename
+    vence; os demais encontram o destino pronto e descartam a própria cópia. Um destino
+    existente só é substituído quando `obsoleto(directory)` é verdadeiro (ex.: layout de
+    outra versão), e mesmo assim é primeiro renomeado para fora do caminho: um diretório
+    em uso nunca é apagado no lugar. Se o bloco falhar, a cópia de preparação é removida.
+    """
+    pai = os.path.dirname(directory) or '.'
+    tmp_dir = tempfile.mkdtemp(prefix=f"{os.path.basename(directory)}.", suffix='.tmp', dir=pai)
+    try:
+        yield tmp_dir
+        publish_directory(tmp_dir, directory, obsoleto)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def publish_directory(tmp_dir: str, directory: str, obsoleto: Optional[Callable[[str], bool]] = None) -> bool:
+    """Move `tmp_dir` para `directory`; retorna False se outro escritor publicou antes"""
+    for _ in range(2):
+        try:
+            os.rename(tmp_dir, directory)
+            return True
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+        if obsoleto is None or not obsoleto(directory):
+            return False
+        # Destino obsoleto: sai do caminho (rename atômico) antes de ser removido
+        descartado = f"{directory}.{uuid.uuid4().hex}.old"
+        try:
+            os.rename(directory, descartado)
+        except FileNotFoundError:
+            continue
+        shutil.rmtree(descartado, ignore_errors=True)
+    return False
+
+
+@contextlib.contextmanager
+def staged_file(path: str) -> Iterator[str]:
+    """Caminho temporário exclusivo ao lado de `path`, movido para `path` (os.replace) no final
+
+    O replace é atômico: leitores veem o arquivo anterior ou o novo, nunca um pela metade.
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
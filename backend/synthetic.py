@@ -0,0 +1,131 @@
+"""Gerador de transações sintéticas para testes de carga e benchmarks
+
+Uso:
+    python synthetic.py --tamanho 1m -o dados_1m.csv
+    python synthetic.py --linhas 5000000 --clientes 200000 --formato-data br --seed 7 -o dados.csv
+
+O resultado é determinístico para os mesmos parâmetros e seed, e tem o mesmo layout de
+exemplo_dados.csv (id_cliente, id_transacao, data, valor).
+"""
+import argparse
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from storage import staged_file
+
+# Tamanhos pré-definidos: (linhas, clientes)
+TAMANHOS = {
+    '1m': (1_000_000, 100_000),
+    '10m': (10_000_000, 1_000_000),
+    '50m': (50_000_000, 5_000_000),
+}
+
+# Formatos de data gerados (o formato é detectado na ingestão)
+FORMATOS_DATA = {
+    'iso': '%Y-%m-%d',
+    'br': '%d/%m/%Y',
+    'us': '%m/%d/%Y',
+    'datetime': '%Y-%m-%d %H:%M:%S',
+}
+
+BLOCO_LINHAS = 1_000_000
+
+
+def generate_transactions(linhas: int, clientes: int, seed: int = 42,
+                          data_inicio: str = '2022-01-01', data_fim: str = '2024-12-31',
+                          formato_data: str = 'iso', fracao_outliers: float = 0.005,
+                          bloco_linhas: int = BLOCO_LINHAS) -> Iterator[pd.DataFrame]:
+    """Gera as transações em blocos de até `bloco_linhas` linhas
+
+    - frequência: cada cliente tem uma propensão de compra com cauda longa (Pareto),
+      de modo que poucos clientes concentram muitas compras
+    - valor: lognormal por transação multiplicado por um ticket médio lognormal do cliente,
+      mais uma fração `fracao_outliers` de valores 10 a 50 vezes maiores
+    - data: cada cliente tem uma data de entrada; as compras ficam entre ela e `data_fim`,
+      o que produz clientes novos, ativos e inativos
+    """
+    rng = np.random.default_rng(seed)
+    inicio = np.datetime64(data_inicio, 'D')
+    dias = int((np.datetime64(data_fim, 'D') - inicio).astype(np.int64)) + 1
+
+    propensao = rng.pareto(1.5, clientes) + 1
+    acumulada = np.cumsum(propensao / propensao.sum())
+    ticket = rng.lognormal(0.0, 0.6, clientes)
+    entrada = rng.integers(0, dias, clientes)
+    # IDs de cliente embaralhados, para não coincidirem com a ordem de propensão
+    ids = rng.permutation(clientes) + 1
+
+    # Texto de cada dia calculado uma vez (formatos sem horário)
+    tabela_dias = None
+    if formato_data != 'datetime':
+        tabela_dias = pd.date_range(inicio, periods=dias, freq='D').strftime(FORMATOS_DATA[formato_data])
+
+    id_transacao = 0
+    for bloco_inicio in range(0, linhas, bloco_linhas):
+        n = min(bloco_linhas, linhas - bloco_inicio)
+        cliente = np.minimum(np.searchsorted(acumulada, rng.random(n), side='right'), clientes - 1)
+
+        valor = rng.lognormal(4.0, 0.9, n) * ticket[cliente]
+        outliers = rng.random(n) < fracao_outliers
+        valor[outliers] *= rng.uniform(10, 50, int(outliers.sum()))
+
+        dia = entrada[cliente] + (rng.random(n) * (dias - entrada[cliente])).astype(np.int64)
+        if tabela_dias is not None:
+            data = pd.Categorical.from_codes(dia, categories=tabela_dias)
+        else:
+            segundos = (inicio + dia).astype('datetime64[s]') + rng.integers(0, 86400, n)
+            data = np.char.replace(np.datetime_as_string(segundos, unit='s'), 'T', ' ')
+
+        yield pd.DataFrame({
+            'id_cliente': ids[cliente],
+            'id_transacao': np.arange(id_transacao, id_transacao + n) + 1,
+            'data': data,
+            'valor': np.round(valor, 2),
+        })
+        id_transacao += n
+
+
+def write_transactions_csv(path: str, linhas: int, clientes: int, **opcoes) -> str:
+    """Grava as transações geradas em CSV, bloco a bloco (arquivo temporário + rename)"""
+    with staged_file(path) as tmp_path, open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        cabecalho = True
+        for bloco in generate_transactions(linhas, clientes, **opcoes):
+            bloco.to_csv(f, index=False, header=cabecalho)
+            cabecalho = False
+    return path
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Gera transações sintéticas no layout de exemplo_dados.csv")
+    parser.add_argument('-o', '--saida', required=True, help="Arquivo CSV de saída")
+    parser.add_argument('--tamanho', choices=sorted(TAMANHOS), help="Tamanho pré-definido (linhas e clientes)")
+    parser.add_argument('--linhas', type=int, help="Quantidade de transações")
+    parser.add_argument('--clientes', type=int, help="Quantidade de clientes distintos")
+    parser.add_argument('--formato-data', choices=sorted(FORMATOS_DATA), default='iso')
+    parser.add_argument('--data-inicio', default='2022-01-01')
+    parser.add_argument('--data-fim', default='2024-12-31')
+    parser.add_argument('--fracao-outliers', type=float, default=0.005)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    linhas, clientes = TAMANHOS.get(args.tamanho, (None, None))
+    linhas = args.linhas or linhas
+    clientes = args.clientes or clientes
+    if not linhas or not clientes:
+        parser.error("informe --tamanho ou --linhas e --clientes")
+
+    write_transactions_csv(
+        args.saida, linhas, clientes,
+        seed=args.seed,
+        data_inicio=args.data_inicio,
+        data_fim=args.data_fim,
+        formato_data=args.formato_data,
+        fracao_outliers=args.fracao_outliers
+    )
+    print(f"{linhas} transações de {clientes} clientes gravadas em {args.saida}")
+
+
+if __name__ == '__main__':
+    main()
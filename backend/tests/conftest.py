@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+
+import pandas as pd
+import pytest
+
+# O backend é importado como módulos soltos (from main import ...), como em produção;
+# os artefatos da API de teste ficam em um diretório próprio, criado antes do import de main
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('RFV_ARTIFACT_DIR', tempfile.mkdtemp(prefix='rfv_testes_'))
+
+from synthetic import generate_transactions  # noqa: E402
+
+MAPEAMENTO = {'id_cliente': 'id_cliente', 'id_transacao': 'id_transacao', 'data': 'data', 'valor': 'valor'}
+
+
+@pytest.fixture(scope='session')
+def client():
+    from fastapi.testclient import TestClient
+    import main
+    return TestClient(main.app)
+
+
+@pytest.fixture(scope='session')
+def transacoes() -> pd.DataFrame:
+    """Transações sintéticas pequenas (datas ISO sem horário)"""
+    return pd.concat(generate_transactions(20_000, 2_000, seed=7, data_inicio='2023-01-01', data_fim='2024-06-30'),
+                     ignore_index=True)
+
+
+@pytest.fixture
+def upload(client):
+    """Envia um DataFrame como CSV e retorna o mapeamento de colunas com o file_id"""
+    def enviar(df: pd.DataFrame, nome: str = 'transacoes.csv') -> dict:
+        resposta = client.post('/upload', files={'file': (nome, df.to_csv(index=False).encode('utf-8'), 'text/csv')})
+        assert resposta.status_code == 200, resposta.text
+        return dict(MAPEAMENTO, file_id=resposta.json()['file_id'])
+    return enviar
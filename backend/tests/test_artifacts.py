@@ -0,0 +1,89 @@
+import os
+import threading
+
+import pytest
+
+from artifacts import ArtifactRegistry, ArtifactStore, FileRegistry, SqliteRegistry, create_registry
+
+
+class ContaItens:
+    """Registro que delega a outro e conta as leituras completas (items)"""
+
+    def __init__(self, registro):
+        self.registro = registro
+        self.leituras = 0
+
+    def __getattr__(self, nome):
+        return getattr(self.registro, nome)
+
+    def items(self):
+        self.leituras += 1
+        return self.registro.items()
+
+
+def _gravar(store, artifact_id, tamanho, parent=None):
+    with open(store.path(artifact_id), 'wb') as f:
+        f.write(b'x' * tamanho)
+    store.register(artifact_id, parent=parent)
+
+
+def test_registry_is_abstract():
+    with pytest.raises(TypeError):
+        ArtifactRegistry()
+
+    class Incompleto(ArtifactRegistry):
+        def get(self, artifact_id):
+            return None
+
+    with pytest.raises(TypeError):
+        Incompleto()
+
+
+@pytest.mark.parametrize('classe', [SqliteRegistry, FileRegistry])
+def test_registry_shared_between_instances_and_threads(tmp_path, classe):
+    """Cada instância (ex.: outro worker) e cada thread veem as mesmas entradas"""
+    caminho = str(tmp_path / ('artifacts.db' if classe is SqliteRegistry else 'registro'))
+    registro = classe(caminho)
+
+    def gravar(i):
+        registro.put(f"a{i}", {'parent': None, 'ttl': None, 'bytes': i, 'created_at': 0.0, 'last_access': 0.0})
+
+    threads = [threading.Thread(target=gravar, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    outro = classe(caminho)
+    assert sorted(e['bytes'] for _, e in outro.items()) == list(range(8))
+    outro.touch('a3', 10.0)
+    outro.delete('a4')
+    assert registro.get('a3')['last_access'] == 10.0
+    assert registro.get('a4') is None
+
+
+@pytest.mark.parametrize('tipo', ['sqlite', 'files'])
+def test_quota_uses_running_total(tmp_path, tipo):
+    registro = ContaItens(create_registry(tipo, str(tmp_path)))
+    store = ArtifactStore(str(tmp_path), quota_bytes=1_000, default_ttl=3600, registry=registro)
+
+    # Abaixo da cota: o registro é lido uma única vez (cálculo inicial do total)
+    for i in range(5):
+        _gravar(store, f"a{i}", 100)
+        _gravar(store, f"a{i}_filho", 50, parent=f"a{i}")
+    assert registro.leituras == 1
+    assert store.stats()['bytes'] == 750
+
+    # Regravar um artefato substitui o tamanho anterior no total, ainda sem reler o registro
+    # (stats acima releu uma vez)
+    _gravar(store, 'a0', 200)
+    assert registro.leituras == 2
+    assert store.stats()['bytes'] == 850
+
+    # Acima da cota: os grupos menos usados (raiz + derivados) saem até caber; a0 foi
+    # regravado por último e fica
+    _gravar(store, 'novo', 300)
+    chaves = store.keys()
+    assert 'a1' not in chaves and 'a1_filho' not in chaves
+    assert {'a0', 'a0_filho', 'a2', 'novo'} <= set(chaves)
+    assert store.stats()['bytes'] == sum(os.path.getsize(store.path(a)) for a in store.keys()) <= 1_000
@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+import batch
+from conftest import BACKEND_DIR
+
+
+def test_same_basename_in_different_folders(tmp_path, transacoes):
+    entradas = []
+    for loja, parte in (('a', transacoes.iloc[:10_000]), ('b', transacoes.iloc[10_000:])):
+        os.makedirs(tmp_path / 'lojas' / loja)
+        entradas.append(str(tmp_path / 'lojas' / loja / 'vendas.csv'))
+        parte.to_csv(entradas[-1], index=False)
+
+    saida = tmp_path / 'saida'
+    assert batch.main([str(tmp_path / 'lojas' / '*' / 'vendas.csv'), '-o', str(saida), '--workers', '2']) == 0
+
+    for entrada, loja in zip(entradas, ('a', 'b')):
+        manifesto = pd.read_json(saida / loja / 'vendas.lote.json', typ='series')
+        assert manifesto['assinatura']['entrada'] == entrada
+        assert (saida / loja / 'vendas.rfv.csv').exists() and (saida / loja / 'vendas.pdf').exists()
+
+
+def test_colliding_names_are_rejected(tmp_path, transacoes):
+    for nome in ('vendas.csv', 'vendas.txt'):
+        transacoes.head(100).to_csv(tmp_path / nome, index=False)
+    with pytest.raises(ValueError, match='mesmas saídas'):
+        batch.output_names([str(tmp_path / 'vendas.csv'), str(tmp_path / 'vendas.txt')])
+    assert batch.main([str(tmp_path / 'vendas.*'), '-o', str(tmp_path / 'saida')]) == 1
+    assert not (tmp_path / 'saida').exists()
+
+
+def test_import_has_no_server_side_effects(tmp_path):
+    """O lote não importa a API: nada de ArtifactStore, sweeper ou JobManager"""
+    artefatos = tmp_path / 'artefatos'
+    codigo = "import sys, threading, batch; print('main' in sys.modules, threading.active_count())"
+    saida = subprocess.run([sys.executable, '-c', codigo], cwd=BACKEND_DIR, check=True, text=True,
+                           stdout=subprocess.PIPE, env=dict(os.environ, RFV_ARTIFACT_DIR=str(artefatos))).stdout
+    assert saida.split() == ['False', '1']
+    assert not artefatos.exists()
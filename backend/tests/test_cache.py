@@ -0,0 +1,35 @@
+import numpy as np
+
+from cache import DatasetCache, estimate_nbytes
+from sketch import QuantileSketch
+
+
+def test_dict_sums_values_recursively():
+    arrays = {'dia': np.zeros(1_000, dtype=np.int32), 'soma': np.zeros(1_000)}
+    indice = dict(arrays, meta={'transacoes': 10, 'limites': [1.0, 2.0]})
+    assert estimate_nbytes(indice) > 12_000
+    assert estimate_nbytes(indice) > estimate_nbytes(arrays) > 12_000
+    assert estimate_nbytes({'interno': indice}) > estimate_nbytes(indice)
+
+
+def test_sketch_size_grows_with_buckets():
+    vazio = QuantileSketch()
+    cheio = QuantileSketch()
+    cheio.update(np.random.default_rng(1).lognormal(5, 3, 50_000))
+    assert 0 < vazio.nbytes < cheio.nbytes
+    assert estimate_nbytes(cheio) == cheio.nbytes
+    # Cada balde guarda dois inteiros do Python (índice e contagem)
+    assert cheio.nbytes > 2 * 28 * len(cheio.positivos)
+
+
+def test_cache_accounts_dicts_and_sketches():
+    cache = DatasetCache(max_bytes=200_000)
+    cache.put('indice', {'dia': np.zeros(2_000, dtype=np.int32)})
+    sketch = QuantileSketch()
+    sketch.update(np.arange(1, 10_000, dtype=np.float64))
+    cache.put('sketch', sketch)
+    assert cache.current_bytes == estimate_nbytes(cache.get('indice')) + sketch.nbytes
+
+    # Um dicionário maior que o orçamento não fica no cache (antes contava 0 bytes)
+    cache.put('grande', {'soma': np.zeros(30_000)})
+    assert cache.get('grande') is None
@@ -0,0 +1,63 @@
+import warnings
+
+import pandas as pd
+import pytest
+
+from dates import detect_date_format, parse_dates
+
+DATAS_BR = ['02/01/2024', '13/01/2024', '28/02/2024', None, '31/12/2023', 'sem data'] * 50
+ESPERADAS = pd.to_datetime(['2024-01-02', '2024-01-13', '2024-02-28', None, '2023-12-31', None] * 50)
+
+
+def parse_dates_anterior(valores):
+    """Conversão de datas anterior à detecção de formato (referência)"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return pd.to_datetime(valores, errors='coerce', infer_datetime_format=True)
+
+
+@pytest.mark.parametrize('dtype', [object, 'string'])
+def test_detect_and_parse_day_first(dtype):
+    """Texto em object ou no dtype de texto do pandas (padrão no pandas 3)"""
+    valores = pd.Series(DATAS_BR, dtype=dtype)
+    formato = detect_date_format(valores)
+    assert formato == '%d/%m/%Y'
+
+    datas, coagidos = parse_dates(valores, formato)
+    assert list(datas) == list(ESPERADAS)
+    assert coagidos == 50
+
+
+@pytest.mark.parametrize('dtype', [object, 'string'])
+def test_parse_high_cardinality(dtype):
+    valores = pd.Series([f"{d:02d}/03/2024 10:{m:02d}:00" for d in range(1, 29) for m in range(60)], dtype=dtype)
+    formato = detect_date_format(valores)
+    assert formato == '%d/%m/%Y %H:%M:%S'
+    datas, coagidos = parse_dates(valores, formato)
+    assert coagidos == 0
+    assert datas.iloc[-1] == pd.Timestamp('2024-03-28 10:59:00')
+
+
+def test_non_text_column():
+    valores = pd.Series(pd.to_datetime(['2024-01-02', None]))
+    assert detect_date_format(valores) is None
+    datas, coagidos = parse_dates(valores, None)
+    assert datas.iloc[0] == pd.Timestamp('2024-01-02') and coagidos == 0
+
+
+@pytest.mark.parametrize('valores', [
+    ['2024-01-02', '2024-01-13', None, '2023-12-31', 'sem data'] * 50,
+    [f"2024-03-{d:02d} 10:{m:02d}:00" for d in range(1, 29) for m in range(60)],
+], ids=['iso', 'iso_com_horario'])
+def test_matches_previous_parsing_on_iso(valores):
+    """Em datas ISO (sem ambiguidade de dia/mês) o resultado é o mesmo da conversão anterior"""
+    valores = pd.Series(valores, dtype=object)
+    datas, _ = parse_dates(valores, detect_date_format(valores))
+    pd.testing.assert_series_equal(datas, parse_dates_anterior(valores), check_dtype=False)
+
+
+def test_day_first_dates_that_previous_parsing_lost():
+    """A conversão anterior inferia mm/dd/aaaa pelo primeiro valor e perdia dias acima de 12"""
+    valores = pd.Series(DATAS_BR, dtype=object)
+    datas, _ = parse_dates(valores, detect_date_format(valores))
+    assert parse_dates_anterior(valores).notna().sum() < datas.notna().sum()
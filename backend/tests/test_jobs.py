@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+from artifacts import ArtifactStore
+from jobs import JobManager
+
+
+def _aguardar(manager, job_id, timeout=10):
+    limite = time.time() + timeout
+    while True:
+        job = manager.get(job_id)
+        if job.status in ("done", "error") or time.time() > limite:
+            return job
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def diretorio(tmp_path):
+    return str(tmp_path / 'artefatos')
+
+
+def test_job_is_visible_from_another_process(diretorio):
+    """Outro worker (outro JobManager e ArtifactStore no mesmo diretório) consulta o job"""
+    worker = JobManager(1, 4, store=ArtifactStore(diretorio, 10 ** 9, 3600))
+    outro = JobManager(1, 4, store=ArtifactStore(diretorio, 10 ** 9, 3600))
+
+    def executar(etapa):
+        etapa('agregacao')
+        return {'total_clientes': 3}
+
+    job = worker.submit('process-rfv', ['leitura', 'agregacao'], executar)
+    consultado = _aguardar(outro, job.id)
+    assert consultado.status == "done"
+    assert consultado.to_dict() == worker.get(job.id).to_dict()
+    assert consultado.result == {'total_clientes': 3}
+    assert outro.get('desconhecido') is None
+
+
+def test_binary_and_failed_results(diretorio):
+    worker = JobManager(1, 4, store=ArtifactStore(diretorio, 10 ** 9, 3600))
+    outro = JobManager(1, 4, store=ArtifactStore(diretorio, 10 ** 9, 3600))
+
+    pdf = worker.submit('generate-pdf', ['renderizacao'], lambda etapa: b'%PDF-1.4 teste')
+    assert _aguardar(outro, pdf.id).result == b'%PDF-1.4 teste'
+
+    def falhar(etapa):
+        raise ValueError("arquivo inválido")
+
+    erro = worker.submit('process-rfv', ['leitura'], falhar)
+    falhou = _aguardar(outro, erro.id)
+    assert (falhou.status, falhou.error) == ("error", "arquivo inválido")
+
+
+def test_without_store_jobs_stay_in_memory():
+    worker = JobManager(1, 4)
+    job = worker.submit('process-rfv', ['leitura'], lambda etapa: 1)
+    assert _aguardar(worker, job.id).result == 1
+    assert JobManager(1, 4).get(job.id) is None
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import pipeline
+from pipeline import (OutlierTreatment, aggregate_customers, aggregate_customers_parallel, calculate_rfv_scores,
+                      calculate_rfv_scores_chunked)
+
+
+@pytest.fixture
+def tipadas(transacoes):
+    return transacoes.assign(data=pd.to_datetime(transacoes['data']))
+
+
+def _assert_same_result(obtido, esperado):
+    (df_obtido, quintis_obtidos), (df_esperado, quintis_esperados) = obtido, esperado
+    df_obtido = df_obtido.sort_values('id_cliente', ignore_index=True)
+    df_esperado = df_esperado.sort_values('id_cliente', ignore_index=True)
+    pd.testing.assert_frame_equal(df_obtido, df_esperado, check_dtype=False)
+    for chave, cortes in quintis_esperados.items():
+        assert np.allclose(quintis_obtidos[chave], cortes), chave
+
+
+@pytest.mark.parametrize('tratamento', [
+    OutlierTreatment(method='keep'),
+    OutlierTreatment(method='winsorize', lower_limit=5, upper_limit=500),
+    OutlierTreatment(method='remove', lower_limit=5, upper_limit=500),
+], ids=lambda tratamento: tratamento.method)
+def test_chunked_matches_in_memory(tipadas, tratamento):
+    # O primeiro bloco só tem valores acima do limite: com "remove" ele fica vazio
+    # e não pode anular a data de referência
+    tipadas = tipadas.copy()
+    tipadas.loc[tipadas.index[:700], 'valor'] = 10_000.0
+    blocos = [tipadas.iloc[i:i + 700] for i in range(0, len(tipadas), 700)]
+
+    _assert_same_result(calculate_rfv_scores_chunked(lambda: iter(blocos), tratamento),
+                        calculate_rfv_scores(tipadas, tratamento))
+
+
+def test_parallel_aggregation_matches_serial(tipadas, monkeypatch):
+    paralelo = aggregate_customers_parallel(tipadas, 3)
+    pd.testing.assert_frame_equal(paralelo, aggregate_customers(tipadas))
+    # Um pool por número de processos, reaproveitado entre chamadas
+    assert pipeline.get_process_pool(3) is pipeline.get_process_pool(3)
+    assert pipeline.get_process_pool(3) is not pipeline.get_process_pool(2)
+
+    # Pelo calculate_rfv_scores, abaixo do mínimo padrão de linhas
+    monkeypatch.setattr(pipeline, 'PARALLEL_MIN_ROWS', 0)
+    tratamento = OutlierTreatment(method='winsorize')
+    _assert_same_result(calculate_rfv_scores(tipadas, tratamento, workers=2), calculate_rfv_scores(tipadas, tratamento))
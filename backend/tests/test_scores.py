@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline import score_quintis
+
+_gerador = np.random.default_rng(3)
+
+
+def score_quintis_original(valores, quintis, inverso=False):
+    """Regras originais de calculate_rfv_scores, cliente a cliente via Series.apply (referência)"""
+    # Recência (inverso): maior valor = menor score
+    def score_inverso(x):
+        if x >= quintis[3]:
+            return 1
+        elif x >= quintis[2]:
+            return 2
+        elif x >= quintis[1]:
+            return 3
+        elif x >= quintis[0]:
+            return 4
+        else:
+            return 5
+
+    # Frequência e valor: maior valor = maior score
+    def score(x):
+        if x <= quintis[0]:
+            return 1
+        elif x <= quintis[1]:
+            return 2
+        elif x <= quintis[2]:
+            return 3
+        elif x <= quintis[3]:
+            return 4
+        else:
+            return 5
+
+    return pd.Series(valores).apply(score_inverso if inverso else score).to_numpy()
+
+CASOS = {
+    # Inteiros com muitos empates: os quintis caem exatamente sobre valores da coluna
+    'empates': np.array([1] * 50 + [2] * 30 + [3] * 10 + [4] * 6 + [7] * 3 + [40]),
+    # Quintis interpolados (entre dois valores) e valores iguais aos cortes
+    'interpolados': np.arange(1, 11),
+    'constante': np.full(25, 3.5),
+    'dois_valores': np.array([0] * 9 + [1]),
+    'floats': _gerador.lognormal(5, 1.5, 2_000),
+    'negativos': _gerador.normal(0, 100, 500).round(1),
+    'um_cliente': np.array([12]),
+    # Cortes repetidos: vários quintis no mesmo valor, com clientes exatamente sobre eles
+    'cortes_repetidos': np.array([5] * 70 + [6] * 20 + [9] * 10),
+    # NaN falha em todas as comparações das regras originais (score 5 em F/V e em R)
+    'nan': np.array([np.nan, 1.0, 2.0, 2.0, np.nan, 3.0, 4.0, 5.0, 6.0, np.nan]),
+}
+
+
+@pytest.mark.parametrize('inverso', [False, True], ids=['F_V', 'R'])
+@pytest.mark.parametrize('nome', list(CASOS))
+def test_matches_original_rules(nome, inverso):
+    valores = CASOS[nome]
+    quintis = [float(q) for q in pd.Series(valores).quantile([0.2, 0.4, 0.6, 0.8])]
+
+    # Além da coluna: os próprios cortes, mínimo e máximo e valores fora do intervalo
+    minimo, maximo = np.nanmin(valores), np.nanmax(valores)
+    extremos = np.concatenate([valores, quintis, [minimo, maximo, minimo - 1, maximo + 1]])
+    esperado = score_quintis_original(extremos, quintis, inverso)
+    obtido = score_quintis(extremos, quintis, inverso)
+    assert obtido.dtype == np.int8
+    np.testing.assert_array_equal(obtido, esperado)
+
+
+def test_constant_column():
+    """Todos os cortes iguais ao valor: F/V ficam com 1 (<= q[0]) e R com 1 (>= q[3])"""
+    valores = np.full(10, 7)
+    quintis = [7.0] * 4
+    assert set(score_quintis(valores, quintis)) == {1}
+    assert set(score_quintis(valores, quintis, inverso=True)) == {1}
+
+
+def test_min_and_max():
+    valores = np.arange(100)
+    quintis = [float(q) for q in pd.Series(valores).quantile([0.2, 0.4, 0.6, 0.8])]
+    assert score_quintis(valores, quintis)[[0, -1]].tolist() == [1, 5]
+    assert score_quintis(valores, quintis, inverso=True)[[0, -1]].tolist() == [5, 1]
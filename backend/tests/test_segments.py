@@ -0,0 +1,71 @@
+import itertools
+
+import pandas as pd
+
+from pipeline import SEGMENTOS, segmentar_clientes
+
+
+def segmentar_cliente_original(row):
+    """Regras originais de segmentação, linha a linha via DataFrame.apply (referência)"""
+    r = row['R_score']
+    f = row['F_score']
+    v = row['V_score']
+    media = row['media_fv']
+    recencia_dias = row['recencia_dias']
+
+    # Código 1: NOVOS - 1ª compra nos últimos 60 dias
+    if recencia_dias <= 60 and row['frequencia'] == 1:
+        return 'NOVOS'
+
+    # Código 2: CAMPEÃO - R=5, F>=3, V=5
+    if r == 5 and f >= 3 and v == 5:
+        return 'CAMPEÃO'
+
+    # Código 3: LEAIS - R=3 ou 4 e média de F+V >= 3
+    if r in [3, 4] and media >= 3:
+        return 'LEAIS'
+
+    # Código 4: POTENCIAIS - (R=5 e média>=3 e V>=3) OU (R=4 e média>=2 e V=3 ou 4)
+    if (r == 5 and media >= 3 and v >= 3) or (r == 4 and media >= 2 and v in [3, 4]):
+        return 'POTENCIAIS'
+
+    # Código 5: PROMISSORES - (R=4 e média<=2) OU (R=3 e média<3) OU (R=5 e média<=3)
+    if (r == 4 and media <= 2) or (r == 3 and media < 3) or (r == 5 and media <= 3):
+        return 'PROMISSORES'
+
+    # Código 6: HIBERNANDO - R=2 e média < 4
+    if r == 2 and media < 4:
+        return 'HIBERNANDO'
+
+    # Código 7: PREOCUPANTES - R=2 e média >= 4
+    if r == 2 and media >= 4:
+        return 'PREOCUPANTES'
+
+    # Código 8: RISCO - R=1 e média < 4
+    if r == 1 and media < 4:
+        return 'RISCO'
+
+    # Código 9: NAO_PODEMOS_PERDER - R=1 e média >= 4
+    if r == 1 and media >= 4:
+        return 'NAO_PODEMOS_PERDER'
+
+    return 'OUTROS'
+
+
+def test_all_score_combinations_match_original_rules():
+    """As 125 combinações de (R, F, V), dentro e fora da regra de NOVOS (limite de 60 dias)"""
+    scores = range(1, 6)
+    casos = pd.DataFrame(
+        list(itertools.product(scores, scores, scores, [0, 60, 61, 400], [1, 2])),
+        columns=['R_score', 'F_score', 'V_score', 'recencia_dias', 'frequencia']
+    )
+    casos['media_fv'] = (casos['F_score'] + casos['V_score']) / 2
+    esperado = casos.apply(segmentar_cliente_original, axis=1).to_numpy()
+
+    obtido = SEGMENTOS[segmentar_clientes(*(casos[c].to_numpy() for c in
+                                            ('R_score', 'F_score', 'V_score', 'recencia_dias', 'frequencia')))]
+    assert len(casos) == 125 * 8
+    divergentes = casos[obtido != esperado].assign(esperado=esperado[obtido != esperado])
+    assert divergentes.empty, divergentes.to_string()
+    # Todos os segmentos aparecem em alguma combinação
+    assert set(obtido) == set(SEGMENTOS)
@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+
+
+@pytest.mark.parametrize('em_blocos', [False, True], ids=['ingestao', 'em_blocos'])
+def test_sketch_ignores_rows_without_ids(client, upload, transacoes, monkeypatch, em_blocos):
+    """Linhas sem id (descartadas pelo RFV) não entram no sketch nem nas estatísticas exatas"""
+    import main
+    if em_blocos:
+        monkeypatch.setattr(main, 'CHUNKED_MIN_BYTES', 0)
+        monkeypatch.setattr(main, 'CHUNK_ROWS', 3_000)
+
+    sem_ids = transacoes.head(300).assign(valor=1_000_000.0)
+    sem_ids.loc[sem_ids.index[:150], 'id_cliente'] = None
+    sem_ids.loc[sem_ids.index[150:], 'id_transacao'] = None
+    # No fim do arquivo, fora do preview do upload
+    mapeamento = upload(pd.concat([transacoes.iloc[300:], sem_ids]), f'sem_ids_{em_blocos}.csv')
+
+    estatisticas = {}
+    for exato in (False, True):
+        resposta = client.post('/analyze-outliers', json={
+            'column_mapping': mapeamento, 'outlier_treatment': {'method': 'keep'}, 'exact': exato})
+        assert resposta.status_code == 200, resposta.text
+        estatisticas[exato] = resposta.json()['statistics']
+
+    for exato in (False, True):
+        assert estatisticas[exato]['total_count'] == len(transacoes) - 300
+        assert estatisticas[exato]['max'] == pytest.approx(transacoes['valor'].iloc[300:].max())
+    assert estatisticas[False]['q1'] == pytest.approx(estatisticas[True]['q1'], rel=0.01)
@@ -0,0 +1,67 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from storage import staged_directory
+
+
+def test_staged_directory_concurrent_writers(tmp_path):
+    destino = str(tmp_path / 'armazenamento')
+    barreira = threading.Barrier(8)
+
+    def gravar(i):
+        with staged_directory(destino) as tmp_dir:
+            np.save(os.path.join(tmp_dir, 'valores.npy'), np.arange(1000))
+            barreira.wait()
+        return i
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(gravar, range(8)))
+
+    assert os.listdir(tmp_path) == ['armazenamento']
+    assert np.array_equal(np.load(os.path.join(destino, 'valores.npy')), np.arange(1000))
+
+
+def test_staged_directory_replaces_only_obsolete(tmp_path):
+    destino = str(tmp_path / 'armazenamento')
+    for versao in (1, 2):
+        with staged_directory(destino) as tmp_dir:
+            open(os.path.join(tmp_dir, 'versao'), 'w').write(str(versao))
+    # Destino válido: a segunda gravação é descartada
+    assert open(os.path.join(destino, 'versao')).read() == '1'
+
+    with staged_directory(destino, obsoleto=lambda d: open(os.path.join(d, 'versao')).read() != '3') as tmp_dir:
+        open(os.path.join(tmp_dir, 'versao'), 'w').write('3')
+    assert open(os.path.join(destino, 'versao')).read() == '3'
+    assert os.listdir(tmp_path) == ['armazenamento']
+
+
+def test_staged_directory_failure_leaves_nothing(tmp_path):
+    destino = str(tmp_path / 'armazenamento')
+    try:
+        with staged_directory(destino) as tmp_dir:
+            open(os.path.join(tmp_dir, 'parcial'), 'w').write('x')
+            raise RuntimeError('falha na gravação')
+    except RuntimeError:
+        pass
+    assert os.listdir(tmp_path) == []
+
+
+def test_concurrent_first_process_rfv(client, upload, transacoes):
+    """Várias primeiras chamadas simultâneas para o mesmo arquivo (ingestão concorrente)"""
+    mapeamento = upload(transacoes.assign(valor=transacoes['valor'] + 0.01), 'concorrente.csv')
+    pedido = {'column_mapping': mapeamento, 'outlier_treatment': {'method': 'winsorize'}}
+    barreira = threading.Barrier(8)
+
+    def processar(_):
+        barreira.wait()
+        return client.post('/process-rfv', json=pedido)
+
+    with ThreadPoolExecutor(8) as pool:
+        respostas = list(pool.map(processar, range(8)))
+
+    assert [r.status_code for r in respostas] == [200] * 8, [r.text for r in respostas if r.status_code != 200]
+    estatisticas = [r.json()['statistics'] for r in respostas]
+    assert all(e == estatisticas[0] for e in estatisticas)
@@ -0,0 +1,139 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import MAPEAMENTO
+from timeindex import build_time_buckets, build_time_buckets_chunked, merge_time_buckets, window_first_day
+
+
+def _assert_same_index(obtido, esperado):
+    assert list(obtido['clientes']) == list(esperado['clientes'])
+    for nome in ('inicios', 'dia', 'contagem', 'ultima'):
+        assert np.array_equal(np.asarray(obtido[nome]), np.asarray(esperado[nome])), nome
+    assert np.allclose(obtido['soma'], esperado['soma'])
+
+
+def _dividir(transacoes):
+    """Base até 30 dias antes da última data e delta com o restante"""
+    datas = pd.to_datetime(transacoes['data'].astype(str))
+    corte = datas.max() - pd.Timedelta(days=30)
+    return transacoes[datas <= corte], transacoes[datas > corte]
+
+
+@pytest.fixture
+def tipadas(transacoes):
+    return transacoes.assign(data=pd.to_datetime(transacoes['data']))[['id_cliente', 'data', 'valor']]
+
+
+def test_merge_matches_full_build(tipadas):
+    base, delta = _dividir(tipadas)
+    _assert_same_index(merge_time_buckets(build_time_buckets(base), build_time_buckets(delta)),
+                       build_time_buckets(tipadas))
+
+
+def test_merge_int_base_with_str_delta(tipadas):
+    """IDs inteiros na base e texto no delta: a ordem dos clientes muda (10 < 2 como texto)"""
+    base, delta = _dividir(tipadas)
+    delta = delta.assign(id_cliente=delta['id_cliente'].astype(str))
+    novos = delta.head(50).assign(id_cliente=[f"X{i}" for i in range(50)])
+    delta = pd.concat([delta, novos], ignore_index=True)
+    completo = pd.concat([base.assign(id_cliente=base['id_cliente'].astype(str)), delta], ignore_index=True)
+
+    dia_minimo = window_first_day(completo['data'].max() + pd.Timedelta(days=1), 365)
+    obtido = merge_time_buckets(build_time_buckets(base), build_time_buckets(delta), dia_minimo)
+    esperado = build_time_buckets(completo[completo['data'] >= pd.Timestamp('1970-01-01') + pd.Timedelta(days=dia_minimo)])
+    _assert_same_index(obtido, esperado)
+
+
+def test_append_str_ids_to_int_state_matches_full_recompute(client, upload, transacoes):
+    base, delta = _dividir(transacoes)
+    delta = pd.concat([delta, delta.head(20).assign(id_cliente='NOVO')], ignore_index=True)
+
+    estado = client.post('/rfv-state', json={'column_mapping': upload(base, 'base.csv'),
+                                             'outlier_treatment': {'method': 'keep'}}).json()
+    atualizado = client.post(f"/rfv-state/{estado['state_id']}/append",
+                             json={'column_mapping': upload(delta, 'delta.csv')})
+    assert atualizado.status_code == 200, atualizado.text
+    completo = client.post('/process-rfv', json={
+        'column_mapping': upload(pd.concat([base, delta], ignore_index=True), 'completo.csv'),
+        'outlier_treatment': {'method': 'keep'}, 'exact': True}).json()
+
+    def baixar(file_id):
+        return pd.read_csv(io.BytesIO(client.get(f"/download/{file_id}").content), dtype={'id_cliente': str})
+
+    obtido, esperado = baixar(atualizado.json()['file_id']), baixar(completo['file_id'])
+    assert len(obtido) == len(esperado)
+    pd.testing.assert_frame_equal(obtido.drop(columns='valor_total'), esperado.drop(columns='valor_total'))
+    assert np.allclose(obtido['valor_total'], esperado['valor_total'])
+    assert atualizado.json()['statistics']['segmentos'] == completo['statistics']['segmentos']
+
+
+def test_chunked_build_matches_full_build(tipadas):
+    tipadas = tipadas.assign(id_cliente='C' + tipadas['id_cliente'].astype(str))
+    blocos = [tipadas.iloc[i:i + 1_500] for i in range(0, len(tipadas), 1_500)]
+    indice, transacoes, data_maxima = build_time_buckets_chunked(blocos[:3] + [tipadas.head(0)] + blocos[3:])
+    _assert_same_index(indice, build_time_buckets(tipadas))
+    assert transacoes == len(tipadas) and data_maxima == tipadas['data'].max()
+
+
+def _assert_close(obtido, esperado, caminho='resposta'):
+    """Mesma estrutura e valores; números em ponto flutuante com tolerância relativa"""
+    if isinstance(esperado, dict):
+        assert set(obtido) == set(esperado), caminho
+        for chave in esperado:
+            _assert_close(obtido[chave], esperado[chave], f"{caminho}.{chave}")
+    elif isinstance(esperado, list):
+        assert len(obtido) == len(esperado), caminho
+        for i, (a, b) in enumerate(zip(obtido, esperado)):
+            _assert_close(a, b, f"{caminho}[{i}]")
+    elif isinstance(esperado, float):
+        assert obtido == pytest.approx(esperado, rel=1e-9), caminho
+    else:
+        assert obtido == esperado, caminho
+
+
+def test_large_files_are_not_loaded_in_memory(client, upload, transacoes, monkeypatch):
+    """Arquivos grandes (modo em blocos) dão o mesmo resultado sem passar por load_dataset"""
+    import main
+    base, delta = _dividir(transacoes)
+    pedidos = {
+        '/rfv-scenarios': {'exact': True, 'scenarios': [
+            {'outlier_treatment': {'method': 'keep'}},
+            {'outlier_treatment': {'method': 'winsorize'}, 'window_days': 180},
+            {'outlier_treatment': {'method': 'remove'}, 'reference_date': '2024-03-01'},
+        ]},
+        '/rfv-migration': {'exact': True, 'outlier_treatment': {'method': 'winsorize'}, 'from_date': '2024-01-01'},
+        '/process-rfv': {'exact': True, 'outlier_treatment': {'method': 'remove'}, 'window_days': 180},
+    }
+
+    def executar(renomear):
+        mapeamento = lambda df, nome: dict(upload(df.rename(columns=renomear), nome),
+                                           **{coluna: renomear.get(coluna, coluna) for coluna in MAPEAMENTO})
+        respostas = {}
+        for rota, pedido in pedidos.items():
+            resposta = client.post(rota, json=dict(pedido, column_mapping=mapeamento(transacoes, 'completo.csv')))
+            assert resposta.status_code == 200, resposta.text
+            respostas[rota] = resposta.json()
+        estado = client.post('/rfv-state', json={'column_mapping': mapeamento(base, 'base.csv'), 'exact': True,
+                                                 'outlier_treatment': {'method': 'winsorize'}}).json()
+        atualizado = client.post(f"/rfv-state/{estado['state_id']}/append",
+                                 json={'column_mapping': mapeamento(delta, 'delta.csv')})
+        assert atualizado.status_code == 200, atualizado.text
+        respostas['/rfv-state'] = {chave: atualizado.json()[chave] for chave in ('statistics', 'update')}
+        respostas['/process-rfv'] = respostas['/process-rfv']['statistics']
+        for cenario in respostas['/rfv-scenarios']['scenarios']:
+            cenario['limits'] = cenario['limits'] and [float(limite) for limite in cenario['limits']]
+        respostas['/rfv-scenarios'] = respostas['/rfv-scenarios']['scenarios']
+        return respostas
+
+    esperado = executar({})
+
+    def carregado(*args, **kwargs):
+        raise AssertionError("arquivo grande carregado inteiro em memória")
+    monkeypatch.setattr(main, 'CHUNKED_MIN_BYTES', 0)
+    monkeypatch.setattr(main, 'CHUNK_ROWS', 3_000)
+    monkeypatch.setattr(main, 'load_dataset', carregado)
+    obtido = executar({'id_cliente': 'cliente', 'id_transacao': 'pedido', 'data': 'dt', 'valor': 'vl'})
+    _assert_close(obtido, esperado)
@@ -0,0 +1,37 @@
+import csv
+
+import pytest
+
+from uploads import normalize_upload
+
+
+def _normalizar(tmp_path, linhas):
+    origem, destino = tmp_path / 'enviado.csv', tmp_path / 'interno.csv'
+    origem.write_bytes(('\n'.join(linhas) + '\n').encode('utf-8'))
+    relatorio = normalize_upload(str(origem), str(destino))
+    with open(destino, encoding='utf-8', newline='') as f:
+        return relatorio, list(csv.reader(f))
+
+
+@pytest.mark.parametrize('valores, esperados, convertida', [
+    # Só pontos: 12.345 é decimal (não há vírgula na coluna)
+    (['12.345', '1.5', '80'], ['12.345', '1.5', '80'], False),
+    (['12.345', '1.234'], ['12.345', '1.234'], False),
+    # Vírgula decimal na coluna: o ponto passa a ser separador de milhar
+    (['12.345', '1.234,56', '80,76', '7'], ['12345', '1234.56', '80.76', '7'], True),
+    # Texto na coluna: nada é convertido
+    (['1,5', 'Rua A, 12', '3'], ['1,5', 'Rua A, 12', '3'], False),
+], ids=['ponto_decimal', 'somente_milhar_ambiguo', 'virgula_decimal', 'texto'])
+def test_decimal_comma_decision(tmp_path, valores, esperados, convertida):
+    relatorio, linhas = _normalizar(tmp_path, ['id_cliente;valor'] + [f'{i};"{v}"' for i, v in enumerate(valores)])
+    assert relatorio['delimiter'] == ';'
+    assert relatorio['decimal_comma'] == (['valor'] if convertida else [])
+    assert [linha[1] for linha in linhas[1:]] == esperados
+
+
+def test_decimal_comma_after_first_lines(tmp_path):
+    """A vírgula decimal só aparece depois das primeiras SAMPLE_LINES linhas"""
+    valores = [str(i) for i in range(200)] + ['7,5', '1.000,25']
+    relatorio, linhas = _normalizar(tmp_path, ['id_cliente;valor'] + [f'{i};{v}' for i, v in enumerate(valores)])
+    assert relatorio['decimal_comma'] == ['valor']
+    assert [linha[1] for linha in linhas[-2:]] == ['7.5', '1000.25']
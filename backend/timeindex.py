@@ -0,0 +1,273 @@
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from storage import staged_directory, staged_file
+
+META_FILE = 'meta.json'
+
+ARRAYS = ['clientes', 'inicios', 'dia', 'contagem', 'soma', 'ultima']
+
+_EPOCH = np.datetime64('1970-01-01', 'D')
+
+# Deslocamento dos dias nas chaves (cliente << 32 | dia) de merge_time_buckets
+_DIA_MINIMO = np.iinfo(np.int32).min
+
+
+def build_time_buckets(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Baldes diários por cliente de um dataset (id_cliente, data, valor já tratados)
+
+    Para cada par (cliente, dia com compra), em ordem de cliente e dia:
+    - dia: número do dia desde 1970-01-01 (int32)
+    - contagem e soma: quantidade de transações e valor total do dia
+    - ultima: horário da última compra do dia (datetime64[ns] como int64)
+    `inicios` guarda a posição do primeiro dia de cada cliente; `clientes`, os IDs
+    na ordem do groupby de aggregate_customers (ordenados).
+    """
+    codigos, clientes = pd.factorize(df['id_cliente'], sort=True)
+    datas = df['data'].to_numpy(dtype='datetime64[ns]')
+    dias = (datas.astype('datetime64[D]') - _EPOCH).astype(np.int64)
+    valores = df['valor'].to_numpy(dtype=np.float64)
+
+    # Uma chave por (cliente, dia); a ordenação estável mantém a ordem original dentro do dia
+    if len(dias):
+        dia_min = int(dias.min())
+        chave = codigos.astype(np.int64) * (int(dias.max()) - dia_min + 1) + (dias - dia_min)
+    else:
+        dia_min, chave = 0, np.array([], dtype=np.int64)
+    ordem = np.argsort(chave, kind='stable')
+    chave = chave[ordem]
+    baldes = np.flatnonzero(np.r_[True, chave[1:] != chave[:-1]]) if len(chave) else np.array([], dtype=np.int64)
+
+    codigos_baldes = codigos[ordem][baldes]
+    indice = {
+        'clientes': np.asarray(clientes)[np.unique(codigos_baldes)],
+        'inicios': np.flatnonzero(np.r_[True, codigos_baldes[1:] != codigos_baldes[:-1]]) if len(baldes) else baldes,
+        'dia': dias[ordem][baldes].astype(np.int32),
+        'contagem': np.add.reduceat(np.ones(len(chave), dtype=np.int64), baldes) if len(baldes) else baldes,
+        'soma': np.add.reduceat(valores[ordem], baldes) if len(baldes) else valores[:0],
+        'ultima': np.maximum.reduceat(datas[ordem].view(np.int64), baldes) if len(baldes) else baldes,
+    }
+    if indice['clientes'].dtype == object:
+        indice['clientes'] = indice['clientes'].astype(str)
+    return indice
+
+
+def save_time_index(indice: Dict[str, Any], directory: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Grava os arrays do índice e o meta (acrescido das contagens de clientes e baldes)
+
+    A gravação usa um diretório temporário exclusivo movido no final, como nos demais
+    armazenamentos; se outro escritor gravou o mesmo índice antes, vale o dele.
+    """
+    meta = dict(meta, clientes=int(len(indice['clientes'])), baldes=int(len(indice['dia'])))
+    with staged_directory(directory) as tmp_dir:
+        for nome in ARRAYS:
+            np.save(os.path.join(tmp_dir, f"{nome}.npy"), np.asarray(indice[nome]))
+        with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+    return meta
+
+
+def update_time_index_meta(directory: str, meta: Dict[str, Any]) -> None:
+    """Substitui só o meta de um índice já gravado (os arrays não mudam)"""
+    with staged_file(os.path.join(directory, META_FILE)) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+
+def write_time_index(df: pd.DataFrame, directory: str, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Grava o índice diário por cliente de um dataset (id_cliente, data, valor já tratados)"""
+    datas = df['data'].to_numpy(dtype='datetime64[ns]')
+    return save_time_index(build_time_buckets(df), directory, dict(
+        meta or {},
+        transacoes=int(len(df)),
+        data_maxima=str(pd.Timestamp(datas.max())) if len(datas) else None,
+    ))
+
+
+def build_time_buckets_chunked(chunks: Iterable[pd.DataFrame]) -> Tuple[Dict[str, np.ndarray], int, Optional[pd.Timestamp]]:
+    """Baldes diários de um dataset lido em blocos; retorna (índice, transações, data máxima)
+
+    Só os baldes ficam em memória, nunca as transações. Um mesmo cliente e dia pode
+    aparecer em vários blocos, então os baldes dos blocos são somados com
+    merge_time_buckets, sempre entre índices de tamanho parecido (como um contador
+    binário): cada balde é copiado O(log blocos) vezes, e não uma vez por bloco.
+    """
+    pilha: List[Tuple[int, Dict[str, np.ndarray]]] = []
+    transacoes, data_maxima = 0, None
+    for chunk in chunks:
+        if not len(chunk):
+            # Bloco vazio não tem tipo de ID confiável (object) e forçaria IDs como texto no merge
+            continue
+        transacoes += len(chunk)
+        maxima = chunk['data'].max()
+        data_maxima = maxima if data_maxima is None else max(data_maxima, maxima)
+
+        nivel, indice = 0, build_time_buckets(chunk)
+        while pilha and pilha[-1][0] == nivel:
+            indice = merge_time_buckets(pilha.pop()[1], indice)
+            nivel += 1
+        pilha.append((nivel, indice))
+
+    if not pilha:
+        vazio = pd.DataFrame({
+            'id_cliente': np.array([], dtype=object),
+            'data': np.array([], dtype='datetime64[ns]'),
+            'valor': np.array([], dtype=np.float64),
+        })
+        return build_time_buckets(vazio), 0, None
+    indice = pilha.pop()[1]
+    while pilha:
+        indice = merge_time_buckets(pilha.pop()[1], indice)
+    return indice, transacoes, pd.Timestamp(data_maxima)
+
+
+def write_time_index_chunked(chunks: Iterable[pd.DataFrame], directory: str,
+                             meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Versão em blocos de write_time_index, para arquivos que não cabem em memória"""
+    indice, transacoes, data_maxima = build_time_buckets_chunked(chunks)
+    return save_time_index(indice, directory, dict(
+        meta or {},
+        transacoes=transacoes,
+        data_maxima=str(data_maxima) if data_maxima is not None else None,
+    ))
+
+
+def merge_time_buckets(base: Dict[str, Any], delta: Dict[str, Any], dia_minimo: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """Soma os baldes de `delta` aos de `base` e descarta os dias anteriores a `dia_minimo`
+
+    Os dois índices já estão ordenados por (cliente, dia): os baldes do delta que
+    coincidem com um balde existente são somados nele e os demais são inseridos nas
+    posições encontradas por busca binária, sem reordenar o índice inteiro. IDs de tipos
+    diferentes nos dois lados (ex.: inteiros na base e texto no delta) são comparados como
+    texto; só nesse caso os baldes precisam ser reordenados.
+    """
+    clientes_base, clientes_delta = np.asarray(base['clientes']), np.asarray(delta['clientes'])
+    # Um lado vazio não tem tipo de ID próprio (ex.: lote sem transações): assume o do outro
+    if not len(clientes_delta):
+        clientes_delta = clientes_delta.astype(clientes_base.dtype)
+    elif not len(clientes_base):
+        clientes_base = clientes_base.astype(clientes_delta.dtype)
+    convertidos = clientes_base.dtype.kind != clientes_delta.dtype.kind
+    if convertidos:
+        clientes_base, clientes_delta = clientes_base.astype(str), clientes_delta.astype(str)
+    clientes = np.union1d(clientes_base, clientes_delta)
+
+    def baldes(indice: Dict[str, Any], clientes_indice: np.ndarray) -> tuple:
+        """Chaves (código no índice combinado << 32 | dia) e valores dos baldes, em ordem de chave"""
+        tamanhos = np.diff(np.r_[np.asarray(indice['inicios']), len(indice['dia'])])
+        codigos = np.repeat(np.searchsorted(clientes, clientes_indice), tamanhos).astype(np.int64)
+        chave = (codigos << 32) | (np.asarray(indice['dia'], dtype=np.int64) - _DIA_MINIMO)
+        valores = (np.array(indice['contagem'], dtype=np.int64), np.array(indice['soma'], dtype=np.float64),
+                   np.array(indice['ultima'], dtype=np.int64))
+        if convertidos:
+            # Os clientes estavam na ordem do tipo original (ex.: numérica); como texto a
+            # ordem muda, então os baldes são reordenados pelos novos códigos
+            ordem = np.argsort(chave, kind='stable')
+            chave, valores = chave[ordem], tuple(v[ordem] for v in valores)
+        return (chave,) + valores
+
+    chave_base, contagem, soma, ultima = baldes(base, clientes_base)
+    chave_delta, contagem_delta, soma_delta, ultima_delta = baldes(delta, clientes_delta)
+
+    posicoes = np.searchsorted(chave_base, chave_delta)
+    existentes = posicoes < len(chave_base)
+    existentes[existentes] = chave_base[posicoes[existentes]] == chave_delta[existentes]
+    # Cada balde do delta coincide com no máximo um balde da base: indexação direta basta
+    alvo = posicoes[existentes]
+    contagem[alvo] += contagem_delta[existentes]
+    soma[alvo] += soma_delta[existentes]
+    ultima[alvo] = np.maximum(ultima[alvo], ultima_delta[existentes])
+
+    novos = ~existentes
+    chave = np.insert(chave_base, posicoes[novos], chave_delta[novos])
+    contagem = np.insert(contagem, posicoes[novos], contagem_delta[novos])
+    soma = np.insert(soma, posicoes[novos], soma_delta[novos])
+    ultima = np.insert(ultima, posicoes[novos], ultima_delta[novos])
+
+    dia = (chave & 0xFFFFFFFF) + _DIA_MINIMO
+    if dia_minimo is not None:
+        manter = dia >= dia_minimo
+        chave, dia, contagem, soma, ultima = chave[manter], dia[manter], contagem[manter], soma[manter], ultima[manter]
+
+    codigos = chave >> 32
+    inicios = np.flatnonzero(np.r_[True, codigos[1:] != codigos[:-1]]) if len(codigos) else np.array([], dtype=np.int64)
+    return {
+        'clientes': clientes[codigos[inicios]],
+        'inicios': inicios,
+        'dia': dia.astype(np.int32),
+        'contagem': contagem,
+        'soma': soma,
+        'ultima': ultima,
+    }
+
+
+def prune_time_buckets(indice: Dict[str, Any], dia_minimo: int) -> Dict[str, np.ndarray]:
+    """Remove os baldes anteriores a `dia_minimo` (e os clientes que ficam sem baldes)"""
+    dia = np.asarray(indice['dia'])
+    tamanhos = np.diff(np.r_[np.asarray(indice['inicios']), len(dia)])
+    manter = dia >= dia_minimo
+    codigos = np.repeat(np.arange(len(indice['clientes'])), tamanhos)[manter]
+    inicios = np.flatnonzero(np.r_[True, codigos[1:] != codigos[:-1]]) if len(codigos) else np.array([], dtype=np.int64)
+    return {
+        'clientes': np.asarray(indice['clientes'])[codigos[inicios]],
+        'inicios': inicios,
+        'dia': dia[manter],
+        'contagem': np.asarray(indice['contagem'])[manter],
+        'soma': np.asarray(indice['soma'])[manter],
+        'ultima': np.asarray(indice['ultima'])[manter],
+    }
+
+
+def window_first_day(data_referencia: pd.Timestamp, window_days: int) -> int:
+    """Primeiro dia (desde 1970-01-01) da janela [referência - window_days, referência)"""
+    inicio = data_referencia - pd.Timedelta(days=window_days)
+    return int((np.datetime64(inicio.ceil('D'), 'D') - _EPOCH).astype(np.int64))
+
+
+def has_time_index(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, META_FILE))
+
+
+def open_time_index(directory: str) -> Dict[str, Any]:
+    """Abre o índice mapeado em memória (arrays + meta)"""
+    with open(os.path.join(directory, META_FILE), 'r', encoding='utf-8') as f:
+        indice: Dict[str, Any] = {'meta': json.load(f)}
+    for nome in ARRAYS:
+        indice[nome] = np.load(os.path.join(directory, f"{nome}.npy"), mmap_mode='r')
+    return indice
+
+
+def aggregate_window(indice: Dict[str, Any], data_referencia: pd.Timestamp, window_days: int) -> pd.DataFrame:
+    """Agregados por cliente (como aggregate_customers) para a janela [referência - window_days, referência)
+
+    Lê apenas os baldes diários do índice, sem percorrer as transações. A resolução é
+    diária: um dia conta inteiro se o seu início estiver dentro da janela. Com datas
+    sem horário o resultado é o mesmo da filtragem das transações.
+    O índice do DataFrame é o código do cliente (posição em `clientes`), o que permite
+    juntar janelas diferentes do mesmo índice sem comparar os IDs.
+    """
+    dia_inicio = window_first_day(data_referencia, window_days)
+    dia_fim = (np.datetime64(data_referencia.ceil('D'), 'D') - _EPOCH).astype(np.int64)
+
+    inicios = np.asarray(indice['inicios'])
+    colunas = ['id_cliente', 'ultima_compra', 'frequencia', 'valor_total']
+    if len(inicios) == 0:
+        return pd.DataFrame(columns=colunas)
+
+    dia = np.asarray(indice['dia'])
+    mascara = (dia >= dia_inicio) & (dia < dia_fim)
+    frequencia = np.add.reduceat(np.where(mascara, indice['contagem'], 0), inicios)
+    valor_total = np.add.reduceat(np.where(mascara, indice['soma'], 0.0), inicios)
+    ultima = np.maximum.reduceat(np.where(mascara, indice['ultima'], np.iinfo(np.int64).min), inicios)
+
+    ativos = np.flatnonzero(frequencia > 0)
+    return pd.DataFrame({
+        'id_cliente': np.asarray(indice['clientes'])[ativos],
+        'ultima_compra': ultima[ativos].view('datetime64[ns]'),
+        'frequencia': frequencia[ativos],
+        'valor_total': valor_total[ativos],
+    }, columns=colunas, index=ativos)
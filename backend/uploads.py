@@ -0,0 +1,237 @@
+import codecs
+import contextlib
+import csv
+import datetime
+import gzip
+import io
+import os
+import re
+import shutil
+import zipfile
+from typing import Any, BinaryIO, Dict, Iterator, List
+
+# Dependência opcional: sem ela uploads .xlsx respondem com erro
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Amostra (já descomprimida) usada para detectar codificação, delimitador e vírgula decimal;
+# o delimitador é decidido pelas primeiras SAMPLE_LINES linhas, a vírgula decimal pela amostra inteira
+SAMPLE_BYTES = 1024 * 1024
+SAMPLE_LINES = 50
+
+# Tamanho dos blocos copiados ou recodificados
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Delimitadores aceitos, em ordem de preferência no empate
+DELIMITERS = [',', ';', '\t', '|']
+
+# Número com vírgula decimal e/ou ponto de milhar (ex.: 80,76 e 1.234,56), comum em exportações brasileiras
+_NUMERO_VIRGULA = re.compile(r'-?(?:\d{1,3}(?:\.\d{3})+(?:,\d+)?|\d+,\d+)')
+_INTEIRO = re.compile(r'-?\d+')
+
+
+def detect_container(path: str) -> str:
+    """Formato do arquivo enviado pelos bytes iniciais: 'gzip', 'zip', 'xlsx' ou 'csv'"""
+    with open(path, 'rb') as f:
+        inicio = f.read(4)
+    if inicio[:2] == b'\x1f\x8b':
+        return 'gzip'
+    if inicio == b'PK\x03\x04':
+        with zipfile.ZipFile(path) as z:
+            return 'xlsx' if 'xl/workbook.xml' in z.namelist() else 'zip'
+    return 'csv'
+
+
+def zip_member(z: zipfile.ZipFile) -> str:
+    """O único arquivo de dados do .zip (ignora diretórios e metadados do macOS)"""
+    membros = [
+        info.filename for info in z.infolist()
+        if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+        and not os.path.basename(info.filename).startswith('.')
+    ]
+    if len(membros) != 1:
+        raise ValueError(f"O arquivo .zip deve conter um único CSV (encontrados: {len(membros)})")
+    return membros[0]
+
+
+@contextlib.contextmanager
+def open_csv_stream(path: str, container: str) -> Iterator[BinaryIO]:
+    """Bytes do CSV, descomprimidos sob demanda (o arquivo nunca é descomprimido inteiro em memória)"""
+    if container == 'gzip':
+        with gzip.open(path, 'rb') as f:
+            yield f
+    elif container == 'zip':
+        with zipfile.ZipFile(path) as z, z.open(zip_member(z)) as f:
+            yield f
+    else:
+        with open(path, 'rb') as f:
+            yield f
+
+
+def detect_encoding(amostra: bytes) -> str:
+    """Codificação pela amostra: UTF-8 (com ou sem BOM), UTF-16 com BOM ou, se não for UTF-8, cp1252/latin-1"""
+    if amostra.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if amostra.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    for encoding in ('utf-8', 'cp1252'):
+        try:
+            # Decodificador incremental: um caractere cortado no fim da amostra não conta como erro
+            codecs.getincrementaldecoder(encoding)().decode(amostra, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return 'latin-1'
+
+
+def sample_lines(texto: str, completa: bool) -> List[str]:
+    linhas = texto.splitlines()
+    if not completa:
+        # A última linha de uma amostra cortada pode estar incompleta
+        linhas = linhas[:-1]
+    return [linha for linha in linhas if linha.strip()]
+
+
+def detect_delimiter(linhas: List[str]) -> str:
+    """Delimitador que divide todas as linhas da amostra no mesmo número (> 1) de campos; o maior vence"""
+    melhor, campos_melhor = ',', 1
+    for delimitador in DELIMITERS:
+        campos = {len(linha) for linha in csv.reader(linhas, delimiter=delimitador)}
+        if len(campos) == 1 and min(campos) > campos_melhor:
+            melhor, campos_melhor = delimitador, min(campos)
+    return melhor
+
+
+def decimal_comma_columns(linhas: List[str], delimitador: str) -> List[int]:
+    """Colunas numéricas com vírgula decimal (ex.: 80,76 e 1.234,56), decididas pela amostra inteira
+
+    Só com delimitador diferente de vírgula. Um valor como 12.345 é ambíguo (milhar ou
+    decimal), então a coluna só é convertida se algum valor tiver vírgula e todos os
+    valores preenchidos forem números nesse padrão (ou inteiros); colunas só com pontos
+    mantêm o ponto decimal.
+    """
+    if delimitador == ',':
+        return []
+    com_virgula, invalidas = set(), set()
+    for linha in csv.reader(linhas[1:], delimiter=delimitador):
+        for i, campo in enumerate(linha):
+            campo = campo.strip()
+            if not campo or i in invalidas:
+                continue
+            if _NUMERO_VIRGULA.fullmatch(campo):
+                if ',' in campo:
+                    com_virgula.add(i)
+            elif not _INTEIRO.fullmatch(campo):
+                invalidas.add(i)
+    return sorted(com_virgula - invalidas)
+
+
+def normalize_number(campo: str) -> str:
+    if ',' not in campo and '.' not in campo:
+        return campo
+    if _NUMERO_VIRGULA.fullmatch(campo.strip()):
+        return campo.strip().replace('.', '').replace(',', '.')
+    return campo
+
+
+def excel_cell(valor: Any) -> str:
+    """Texto de uma célula do Excel no CSV interno (datas em ISO, sem horário quando for meia-noite)"""
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime.datetime):
+        return valor.date().isoformat() if valor.time() == datetime.time() else valor.isoformat(sep=' ')
+    if isinstance(valor, datetime.date):
+        return valor.isoformat()
+    return str(valor)
+
+
+def convert_xlsx(path: str, destino: str) -> None:
+    """Grava a primeira planilha como CSV, linha a linha (modo somente leitura do openpyxl)"""
+    if openpyxl is None:
+        raise ValueError("Arquivos .xlsx exigem o pacote opcional openpyxl (pip install openpyxl)")
+    # Passado como arquivo aberto: o openpyxl recusa caminhos sem a extensão .xlsx
+    with open(path, 'rb') as origem:
+        wb = openpyxl.load_workbook(origem, read_only=True, data_only=True)
+        try:
+            with open(destino, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f, lineterminator='\n')
+                writer.writerows(
+                    [excel_cell(valor) for valor in linha]
+                    for linha in wb.worksheets[0].iter_rows(values_only=True)
+                    if any(valor is not None for valor in linha)
+                )
+        finally:
+            wb.close()
+
+
+def convert_csv(path: str, container: str, destino: str, encoding: str, delimitador: str,
+                colunas_decimais: List[int]) -> None:
+    """Grava o CSV em UTF-8 separado por vírgula, em fluxo"""
+    with open_csv_stream(path, container) as origem, open(destino, 'wb') as f:
+        if encoding == 'utf-8' and delimitador == ',':
+            # Já no formato interno: só descomprime
+            shutil.copyfileobj(origem, f, COPY_CHUNK_SIZE)
+            return
+
+        texto = io.TextIOWrapper(origem, encoding=encoding, newline='')
+        saida = io.TextIOWrapper(f, encoding='utf-8', newline='')
+        if delimitador == ',':
+            # Só a codificação muda: recodifica em blocos
+            while True:
+                bloco = texto.read(COPY_CHUNK_SIZE)
+                if not bloco:
+                    break
+                saida.write(bloco)
+        else:
+            # Outro delimitador exige reler os campos (aspas podem conter o delimitador)
+            linhas = csv.reader(texto, delimiter=delimitador)
+            if colunas_decimais:
+                def converter(linha: List[str]) -> List[str]:
+                    for i in colunas_decimais:
+                        if i < len(linha):
+                            linha[i] = normalize_number(linha[i])
+                    return linha
+                linhas = map(converter, linhas)
+            csv.writer(saida, lineterminator='\n').writerows(linhas)
+        saida.flush()
+        saida.detach()
+
+
+def normalize_upload(path: str, destino: str) -> Dict[str, Any]:
+    """Converte o arquivo enviado (CSV, .csv.gz, .zip ou .xlsx) para o CSV interno em `destino`
+
+    Codificação e delimitador são detectados em uma amostra do início do CSV. Um CSV que
+    já está em UTF-8 separado por vírgula é apenas movido; os demais são gravados em
+    fluxo, sem manter o arquivo inteiro (comprimido ou não) em memória.
+    Retorna o relatório da conversão.
+    """
+    container = detect_container(path)
+    if container == 'xlsx':
+        convert_xlsx(path, destino)
+        os.remove(path)
+        return {'container': container, 'encoding': None, 'delimiter': None, 'decimal_comma': [], 'converted': True}
+
+    with open_csv_stream(path, container) as f:
+        amostra = f.read(SAMPLE_BYTES)
+        completa = not f.read(1)
+    encoding = detect_encoding(amostra)
+    linhas = sample_lines(amostra.decode(encoding, errors='replace'), completa)
+    delimitador = detect_delimiter(linhas[:SAMPLE_LINES])
+    colunas_decimais = decimal_comma_columns(linhas, delimitador)
+    cabecalho = next(csv.reader(linhas[:1], delimiter=delimitador), [])
+
+    convertido = container != 'csv' or encoding != 'utf-8' or delimitador != ','
+    if convertido:
+        convert_csv(path, container, destino, encoding, delimitador, colunas_decimais)
+        os.remove(path)
+    else:
+        os.replace(path, destino)
+    return {
+        'container': container,
+        'encoding': encoding,
+        'delimiter': delimitador,
+        'decimal_comma': [cabecalho[i] for i in colunas_decimais if i < len(cabecalho)],
+        'converted': convertido
+    }
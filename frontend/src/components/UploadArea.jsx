@@ -1,15 +1,20 @@
 import { useRef, useState } from 'react'
 
+// Extensões aceitas pelo /upload (o conteúdo é detectado no backend)
+const EXTENSOES = ['.csv', '.txt', '.csv.gz', '.gz', '.zip', '.xlsx']
+
+const extensaoAceita = (file) => EXTENSOES.some((ext) => file.name.toLowerCase().endsWith(ext))
+
 function UploadArea({ onFileUpload }) {
   const fileInputRef = useRef(null)
   const [isDragging, setIsDragging] = useState(false)
 
   const handleFileSelect = (e) => {
     const file = e.target.files[0]
-    if (file && file.type === 'text/csv') {
+    if (file && (file.type === 'text/csv' || extensaoAceita(file))) {
       onFileUpload(file)
     } else {
-      alert('Por favor, selecione um arquivo CSV')
+      alert('Por favor, selecione um arquivo CSV, .csv.gz, .zip ou .xlsx')
     }
   }
 
@@ -17,10 +22,10 @@ function UploadArea({ onFileUpload }) {
     e.preventDefault()
     setIsDragging(false)
     const file = e.dataTransfer.files[0]
-    if (file && file.type === 'text/csv') {
+    if (file && (file.type === 'text/csv' || extensaoAceita(file))) {
       onFileUpload(file)
     } else {
-      alert('Por favor, solte um arquivo CSV')
+      alert('Por favor, solte um arquivo CSV, .csv.gz, .zip ou .xlsx')
     }
   }
 
@@ -37,7 +42,8 @@ function UploadArea({ onFileUpload }) {
     <div className="w-full">
       <h2 className="text-2xl font-semibold mb-4">Upload de Arquivo CSV</h2>
       <p className="text-gray-600 mb-6">
-        Faça upload do arquivo CSV contendo os dados de transações dos clientes.
+        Faça upload do arquivo CSV contendo os dados de transações dos clientes
+        (também aceita .csv.gz, .zip com um CSV e planilhas .xlsx).
       </p>
       
       <div
@@ -74,7 +80,7 @@ function UploadArea({ onFileUpload }) {
         <input
           ref={fileInputRef}
           type="file"
-          accept=".csv"
+          accept={EXTENSOES.join(',')}
           onChange={handleFileSelect}
           className="hidden"
         />